@@ -188,6 +188,9 @@ reset_output()
 from bokeh.io import output_notebook
 from bokeh.plotting import figure, show
 
+# Show each figure once and push later tweaks to the same output cell
+from notebook_live import live_show
+
 # The figure will be rendered inline in my Jupyter Notebook
 output_notebook()
 
@@ -212,7 +215,7 @@ fig = figure(background_fill_color='gray',
              tools='save')
 
 # See what it looks like
-show(fig)
+live_show(fig)
 
 
 # In[6]:
@@ -221,8 +224,11 @@ show(fig)
 # Remove the gridlines from the figure() object
 fig.grid.grid_line_color = None
 
-# See what it looks like 
-show(fig)
+# See what it looks like, in the output cell above
+live_show(fig)
+
+
+# Calling show(fig) again would embed the whole figure, and all of its data, in another output cell. live_show() from notebook_live.py shows a figure only the first time; after that it sends just the changes through push_notebook(), and the first output cell updates in place. Outside a notebook, it does the same as show().
 
 
 # There is tons more I could touch on here, but don’t feel like you’re missing out. I’ll make sure to introduce different figure tweaks as the tutorial progresses. Here are some other helpful links on the topic:
@@ -820,6 +826,12 @@ from bokeh.plotting import figure, show
 from bokeh.io import output_file
 from bokeh.models import ColumnDataSource, NumeralTickFormatter
 
+# Pick canvas or WebGL from the glyph count
+from backends import choose_backend
+
+# Update the same output cell when the figure is tweaked below
+from notebook_live import live_show
+
 # Output to file
 output_file('three-point-att-vs-pct.html',
             title='Three-Point Attempts vs. Percentage')
@@ -837,7 +849,8 @@ fig = figure(plot_height=400,
              y_axis_label='Percentage Made',
              title='3PT Shots Attempted vs. Percentage Made (min. 100 3PA), 2017-18',
              toolbar_location='below',
-             tools=select_tools)
+             tools=select_tools,
+             output_backend=choose_backend(len(three_takers), 'square'))
 
 # Format the y-axis tick labels as percentages
 fig.yaxis[0].formatter = NumeralTickFormatter(format='00.0%')
@@ -852,7 +865,7 @@ fig.square(x='play3PA',
            nonselection_alpha=0.3)
 
 # Visualize
-show(fig)
+live_show(fig)
 
 
 # First, specify the selection tools you want to make available. In the example above, 'box_select', 'lasso_select', 'poly_select', and 'tap' (plus a reset button) were specified in a list called select_tools. When the figure is instantiated, the toolbar is positioned 'below' the plot, and the list is passed to tools to make the tools selected above available.
@@ -886,7 +899,7 @@ tooltips = [
 fig.add_tools(HoverTool(tooltips=tooltips))
 
 # Visualize
-show(fig)
+live_show(fig)
 
 
 # The HoverTool() is slightly different than the selection tools you saw above in that it has properties, specifically tooltips.
@@ -915,7 +928,7 @@ hover_glyph = fig.circle(x='play3PA', y='pct3PM', source=three_takers_cds,
 fig.add_tools(HoverTool(tooltips=tooltips, renderers=[hover_glyph]))
 
 # Visualize
-show(fig)
+live_show(fig)
 
 
 # This is done by creating a completely new glyph, in this case circles instead of squares, and assigning it to hover_glyph. Note that the initial opacity is set to zero so that it is invisible until the cursor is touching it. The properties that appear upon hover are captured by setting hover_alpha to 0.5 along with the hover_fill_color.
@@ -1148,10 +1161,15 @@ win_loss_mapper = CategoricalColorMapper(factors = ['W', 'L'], palette=['Green',
 # Specify the tools
 toolList = ['lasso_select', 'tap', 'reset', 'save']
 
+# Pick canvas or WebGL from the number of games plotted
+from backends import choose_backend
+backend = choose_backend(len(phi_gm_stats_2), 'circle')
+
 # Create a figure relating the percentages
 pctFig = figure(title='2PT FG % vs 3PT FG %, 2017-18 Regular Season',
                 plot_height=400, plot_width=400, tools=toolList,
-                x_axis_label='2PT FG%', y_axis_label='3PT FG%')
+                x_axis_label='2PT FG%', y_axis_label='3PT FG%',
+                output_backend=backend)
 
 # Draw with circle markers
 pctFig.circle(x='team2P%', y='team3P%', source=gm_stats_cds, 
@@ -1164,7 +1182,8 @@ pctFig.yaxis[0].formatter = NumeralTickFormatter(format='00.0%')
 # Create a figure relating the totals
 totFig = figure(title='Team Points vs Opponent Points, 2017-18 Regular Season',
                 plot_height=400, plot_width=400, tools=toolList,
-                x_axis_label='Team Points', y_axis_label='Opponent Points')
+                x_axis_label='Team Points', y_axis_label='Opponent Points',
+                output_backend=backend)
 
 # Draw with square markers
 totFig.square(x='teamPTS', y='opptPTS', source=gm_stats_cds, size=10,
@@ -1228,11 +1247,21 @@ durant_view = CDSView(source=player_gm_stats,
 # In[35]:
 
 
+# Pick canvas or WebGL from the glyph count: only the rows the two
+# views let through are drawn, not the whole box score table
+from backends import choose_backend
+
+plotted = (((player_stats['playFNm'] == 'LeBron')
+            & (player_stats['playLNm'] == 'James'))
+           | ((player_stats['playFNm'] == 'Kevin')
+              & (player_stats['playLNm'] == 'Durant'))).sum()
+
 # Consolidate the common keyword arguments in dicts
 common_figure_kwargs = {
     'plot_width': 400,
     'x_axis_label': 'Points',
     'toolbar_location': None,
+    'output_backend': choose_backend(plotted, 'circle'),
 }
 common_circle_kwargs = {
     'x': 'playPTS',
@@ -1295,6 +1324,321 @@ show(row(hide_fig, mute_fig))
 # 
 # For more on all things interaction in Bokeh, [**Adding Interactions**](https://docs.bokeh.org/en/latest/docs/user_guide/interaction.html) in the Bokeh User Guide is a great place to start.
 
+# ## Scoring by Period
+
+# The team box scores also break every game down by period: teamPTS1 through teamPTS4 hold the four quarters, and teamPTS5 through teamPTS8 any overtimes (opptPTS1 through opptPTS8 hold the same for the opponent). Drawing each team-game-period as its own rect glyph would mean thousands of glyphs, so instead quarter_scoring.py scatters them into one (team × game × period) int16 tensor up front and renders any slice of it as a single image glyph:
+
+# In[ ]:
+
+
+from bokeh.io import output_file
+from bokeh.plotting import show
+
+from quarter_scoring import build_quarter_tensor, quarter_heatmap_selector
+
+# Output to file
+output_file('quarter-scoring-heatmap.html',
+            title='Points Scored by Period')
+
+# Precompute the (team x game x period) tensor once
+quarters = build_quarter_tensor(team_stats)
+
+# League average by default, any team from the selector
+show(quarter_heatmap_selector(quarters))
+
+
+# Switching teams in the selector only swaps which precomputed image the glyph draws, so the page never re-sends or re-renders thousands of shapes. Passing stat='diff' shows the per-period scoring margin instead, on a diverging palette.
+
+
+# ## Head-to-Head Records
+
+# Every row of team_stats records one side of a game: teamAbbr, opptAbbr, teamRslt and both point totals. head_to_head.py folds those rows into a sparse team × opponent matrix of wins, losses and point differential in one vectorized pass, storing only the pairs that actually met. New games are folded in with append(), which touches only the new rows and the stored pairs instead of recomputing from the raw frame:
+
+# In[ ]:
+
+
+from bokeh.io import output_file
+from bokeh.plotting import show
+
+from head_to_head import HeadToHead, head_to_head_heatmap
+
+# Output to file
+output_file('head-to-head.html',
+            title='Head-to-Head Records')
+
+# Accumulate the season so far, then append the rest as it "arrives"
+season_midpoint = team_stats['gmDate'] < '2018-01-01'
+h2h = HeadToHead.from_games(team_stats[season_midpoint])
+h2h.append(team_stats[~season_midpoint])
+
+# Color by win percentage, hover for the record and point differential
+show(head_to_head_heatmap(h2h))
+
+
+# ## Players Like LeBron
+
+# The comparison above hard-wires its two players with GroupFilter objects. player_similarity.py instead averages each player's box score stats per season (points, rebounds, assists, three-point attempts and makes, and so on), z-scores them into one float32 feature matrix and answers "players like X" as a top-k nearest-neighbor query, which is a single matrix product no matter how many players and seasons are indexed:
+
+# In[ ]:
+
+
+from bokeh.io import output_file
+from bokeh.plotting import show
+
+from player_similarity import PlayerIndex, comparison_chart
+
+# Build the per-player, per-season feature matrix once
+player_index = PlayerIndex.from_box_scores(player_stats)
+
+# The five player-seasons closest to LeBron's
+player_index.similar('LeBron', 'James', k=5)
+
+
+# The same query can pick the comparison for you. The chart below plots LeBron against his nearest neighbor, and only those two players' games are put into the ColumnDataSource:
+
+# In[ ]:
+
+
+output_file('lebron-vs-most-similar.html',
+            title='LeBron James vs. Most Similar Player')
+
+show(comparison_chart(player_stats, player_index, 'LeBron', 'James', k=1))
+
+
+# ## Rasterizing Dense Scatter Plots
+
+# The three-point chart filters down to players with at least 100 attempts partly so the browser can cope. Plotting every player-game, or every country in every year of gapminder_tidy.csv, means tens to hundreds of thousands of glyphs. rasterize.py bins the points into a pixel grid with NumPy and sends that grid as one image glyph instead, switching back to individual glyphs when few enough points are in view:
+
+# In[ ]:
+
+
+from bokeh.io import output_file
+from bokeh.plotting import figure, show
+
+from rasterize import RasterScatter
+
+# Read the Gapminder data
+gapminder = pd.read_csv('./gapminder_tidy.csv')
+
+# Output to file
+output_file('gapminder-rasterized.html',
+            title='Fertility vs. Life Expectancy')
+
+gapminder_fig = figure(plot_height=400, plot_width=600,
+                       x_axis_label='Fertility (children per woman)',
+                       y_axis_label='Life Expectancy (years)',
+                       title='Fertility vs. Life Expectancy, All Countries, All Years')
+
+# Bin every country-year into the figure's pixel grid
+RasterScatter(gapminder['fertility'], gapminder['life']).attach(
+    gapminder_fig, color='firebrick', alpha=0.5)
+
+show(gapminder_fig)
+
+
+# A static file can only ship the initial binning. Served with bokeh serve --show visdat1.py, the same charts re-bin on every pan and zoom through RangesUpdate events, so zooming in sharpens the image until the individual points take over.
+
+
+# ## Lazy-Loading Tabs
+
+# The tabbed layout above serializes both panels' figures, and the whole of standings_cds, into the page before anything is drawn. With a dozen tabs, one per conference, division or stat family, most of that weight is never looked at. lazy_tabs.py takes each panel as a title and a function that builds it. In static output, the data of every hidden panel is written to its own JSON file and only fetched the first time its tab is opened. Under bokeh serve, hidden panels aren't even built until then:
+
+# In[ ]:
+
+
+from bokeh.io import output_file
+from bokeh.models import ColumnDataSource
+from bokeh.plotting import figure, show
+
+from lazy_tabs import lazy_tabs
+
+# Output to file
+output_file('east-west-top-2-lazy-tabs.html',
+            title='Conference Top 2 Teams Wins Race')
+
+
+def race_panel(teams):
+    """Return a function building the wins race for {team: (label, color)}."""
+    def build():
+        fig = figure(x_axis_type='datetime',
+                     plot_height=300, plot_width=800,
+                     x_axis_label='Date', y_axis_label='Wins')
+        for team, (label, color) in teams.items():
+            team_data = standings.loc[standings['teamAbbr'] == team,
+                                      ['stDate', 'gameWon']]
+            fig.step('stDate', 'gameWon', color=color, legend_label=label,
+                     source=ColumnDataSource(team_data))
+        fig.legend.location = 'top_left'
+        return fig
+    return build
+
+
+# Only the Western Conference data is embedded in the page
+lazy_race_tabs = lazy_tabs([('Western Conference',
+                             race_panel({'HOU': ('Rockets', '#CE1141'),
+                                         'GS': ('Warriors', '#006BB6')})),
+                            ('Eastern Conference',
+                             race_panel({'BOS': ('Celtics', '#007A33'),
+                                         'TOR': ('Raptors', '#CE1141')}))],
+                           data_dir='data', url_prefix='data/')
+
+show(lazy_race_tabs)
+
+
+# Because the hidden tabs' data is fetched over HTTP, open the page through a web server (python -m http.server is enough) rather than straight from disk.
+
+
+# ## Publishing a Static Site
+
+# Each output_file() page above embeds its own copy of its data, so the same standings rows are downloaded again for the row layout, both gridplots and the tabbed layout. static_site.py builds a set of pages differently: every distinct ColumnDataSource is written once as a gzip-compressed file named by the hash of its contents, every page fetches its data from those files, and all pages share one copy of BokehJS. A browser that has opened one page only downloads the next page's layout:
+
+# In[ ]:
+
+
+from bokeh.layouts import gridplot, row
+
+from static_site import build_site
+
+pages = {
+    'east-west-top-2-standings-race.html':
+        ('Conference Top 2 Teams Wins Race', row(west_fig, east_fig)),
+    'east-west-top-2-gridplot.html':
+        ('Conference Top 2 Teams Wins Race', gridplot([[west_fig, east_fig]])),
+    'east-west-top-2-tabbed_layout.html':
+        ('Conference Top 2 Teams Wins Race', tabs),
+}
+
+# Write the pages and their shared data files to site/
+build_site(pages, out_dir='site', resources='local')
+
+
+# The returned manifest lists the data files each page loads; here all three pages point at the same single file holding standings_cds. Serve the site/ directory over HTTP to view the pages.
+
+# For a static host, python publish.py site writes a gzip (and, with the brotli package, a brotli) copy of every page and data file next to it, plus a manifest of their ETags, and python publish.py site --serve serves them, answering repeat visits with 304 Not Modified.
+
+
+# ## Charts as Specs
+
+# The race charts above repeat nearly the same figure(), step() and CDSView() calls for every pair of teams, and west_cds and standings_cds both end up holding the Rockets' and Warriors' rows. chart_spec.py compiles a declarative description of a whole page instead. It first plans the document, merging the rows and columns every glyph needs from a dataset into one shared ColumnDataSource, then builds each glyph on a CDSView of it, so no row is serialized twice:
+
+# In[ ]:
+
+
+from chart_spec import compile_spec, load_spec
+
+from bokeh.io import output_file
+from bokeh.plotting import show
+
+# Output to file
+output_file('east-west-top-2-standings-race-spec.html',
+            title='Conference Top 2 Teams Wins Race')
+
+datasets = {'standings': standings, 'team_stats': team_stats}
+layout, plan = compile_spec(
+    load_spec('specs/east-west-top-2-standings-race.json'), datasets)
+
+# Only the four teams' rows and the three columns drawn are shipped
+print(plan.summary())
+
+show(layout)
+
+
+# The specs/ directory holds the spec for this page and for the 76ers linked selections, where splitting wins and losses into two glyphs still leaves one source, so selections stay linked across both figures.
+
+
+# ## Regional Trends
+
+# Averaging the Gapminder indicators by region means weighting each country by its population, and doing that with a groupby on every selection or slider move gets slow. region_cube.py precomputes the weighted sums once for every region and year, and for every set of regions, as running totals over the years. The average of any set of regions over any range of years then takes two subtractions and a division:
+
+# In[ ]:
+
+
+from region_cube import RegionCube, regional_trends
+
+from bokeh.io import output_file
+from bokeh.plotting import show
+
+cube = RegionCube.from_frame(gapminder)
+
+# Population-weighted life expectancy of two regions in the 1990s
+print(cube.mean('life', ['Europe & Central Asia', 'South Asia'], 1990, 1999))
+
+# Output to file
+output_file('gapminder-regional-trends.html',
+            title='Gapminder Regional Trends')
+
+show(regional_trends(gapminder, cube))
+
+
+# The same running totals are shipped to the browser. Select some countries in the bubble chart and the trends chart draws the combined trend of their regions, without a round trip to Python; the slider moves the bubbles through the years.
+
+
+# ## Countries Like Japan
+
+# Each country in gapminder_tidy.csv traces a path through fertility and life expectancy over about 50 years. trajectory_similarity.py resamples every path to 32 evenly spaced points, z-scores them and stores them as rows of one float32 matrix, so "countries whose development path resembles X" is a top-k nearest-neighbor query, as for players like LeBron. use_dtw=True re-ranks the nearest candidates with dynamic time warping, which also matches paths that went through the same stages at a different pace:
+
+# In[ ]:
+
+
+from trajectory_similarity import TrajectoryIndex, trajectory_chart
+
+from bokeh.io import output_file
+from bokeh.plotting import show
+
+trajectory_index = TrajectoryIndex(gapminder)
+
+# The five countries whose paths are closest to Japan's
+trajectory_index.similar('Japan', k=5, use_dtw=True)
+
+
+# The chart draws every country's path. Click one and its five nearest neighbors are highlighted with it; the neighbors of every country are computed once and shipped with the page, so this happens in the browser:
+
+# In[ ]:
+
+
+output_file('gapminder-similar-paths.html',
+            title='Similar Development Paths')
+
+show(trajectory_chart(gapminder, trajectory_index, k=5))
+
+
+# ## One Query Layer
+
+# Every chart above slices its DataFrame its own way: a boolean mask, then .loc[] for the columns, then sort_values(). The charts in charts.py and the server app instead go through query.py, which takes the dataset, teams, date range, season type and columns a chart needs. Each dataset is kept sorted by team and date and split into row groups that record the smallest and largest value of each column, so a query only looks at the row groups that can match, and only gathers the columns asked for:
+
+# In[ ]:
+
+
+from types import SimpleNamespace
+
+from query import query
+
+data = SimpleNamespace(standings=standings, team_stats=team_stats)
+
+# The 76ers' regular season scoring, in date order
+query(data, 'team_stats', teams='PHI', season_type='Regular',
+      columns=['gmDate', 'teamPTS', 'opptPTS'])
+
+
+# Any other condition goes in a where clause, written like those in the chart specs, e.g. where={'gameWon': {'min': 50}}.
+
+
+# ## Standings from Box Scores
+
+# The standings file is one full row per team per day, produced somewhere else. derived_standings.py builds the same table from the team box scores instead, with running totals over every team's games and a lookup of each team's latest game on each day, so standings can be made for corrected or made-up results too. The whole season takes a few dozen milliseconds:
+
+# In[ ]:
+
+
+from derived_standings import derive_standings
+
+derived = derive_standings(team_stats)
+
+# The Celtics on the last day of the season, next to the file's row
+pd.concat([derived[derived['teamAbbr'] == 'BOS'].tail(1),
+           standings[standings['teamAbbr'] == 'BOS'].tail(1)[derived.columns]])
+
+
 # ## Summary and Next Steps
 
 # Congratulations! You’ve made it to the end of this tutorial.
@@ -0,0 +1,55 @@
+"""Output Backend Selection
+
+Picks a figure's output_backend from how many glyphs it will draw and what
+kind they are. Glyphs that BokehJS can draw with WebGL switch over from
+canvas once their count passes the crossover point recorded by
+bench_backends.py in backend_thresholds.json. A family recorded as null
+there was never faster with WebGL, and always gets canvas.
+
+No thresholds file is committed: run bench_backends.py in the browsers
+the charts are meant for to record one. Until then every family falls
+back to DEFAULT_THRESHOLDS, which are rough guesses, not measurements.
+"""
+import json
+import os
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'backend_thresholds.json')
+
+# Glyph methods BokehJS 2.4 has WebGL implementations for
+WEBGL_GLYPHS = {'circle', 'square', 'triangle', 'diamond', 'asterisk',
+                'cross', 'x', 'hex', 'scatter', 'line', 'rect', 'quad',
+                'hbar', 'vbar'}
+
+# Fallback crossovers for families missing from the thresholds file.
+# Unmeasured: rough guesses, replaced by whatever bench_backends.py records
+DEFAULT_THRESHOLDS = {'marker': 2000, 'line': 20000, 'bar': 5000}
+GLYPH_FAMILIES = {'line': 'line', 'rect': 'bar', 'quad': 'bar',
+                  'hbar': 'bar', 'vbar': 'bar'}
+
+
+def load_thresholds(path=THRESHOLDS_FILE):
+    """Glyph family -> glyph count above which WebGL is faster.
+
+    None means WebGL was measured and never faster.
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if os.path.exists(path):
+        with open(path) as f:
+            thresholds.update(json.load(f)['thresholds'])
+    return thresholds
+
+
+THRESHOLDS = load_thresholds()
+
+
+def choose_backend(n_glyphs, glyph='circle', thresholds=None):
+    """'webgl' for large counts of WebGL-capable glyphs, else 'canvas'."""
+    if glyph not in WEBGL_GLYPHS:
+        return 'canvas'
+    thresholds = THRESHOLDS if thresholds is None else thresholds
+    family = GLYPH_FAMILIES.get(glyph, 'marker')
+    threshold = thresholds[family]
+    if threshold is None:
+        return 'canvas'
+    return 'webgl' if n_glyphs >= threshold else 'canvas'
@@ -0,0 +1,128 @@
+"""Canvas vs. WebGL Benchmark
+
+Renders the same figure with each output backend at increasing glyph
+counts in a headless browser, and records the count at which WebGL starts
+beating canvas for each glyph family in backend_thresholds.json, where
+backends.choose_backend() picks it up. A family WebGL never wins for is
+recorded as null, and stays on canvas.
+
+Needs selenium and a Chrome/Chromium or Firefox webdriver, the same setup
+bokeh.io.export uses:
+
+    python bench_backends.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from backends import THRESHOLDS_FILE
+
+SIZES = [500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000]
+FAMILIES = {'marker': 'circle', 'line': 'line', 'bar': 'vbar'}
+
+# Resolves once BokehJS has finished the initial render of the document
+WAIT_FOR_IDLE = """
+const done = arguments[arguments.length - 1]
+const start = performance.now()
+function check() {
+    const doc = window.Bokeh && Bokeh.documents[0]
+    if (doc && doc.is_idle)
+        done(performance.now() - start)
+    else
+        setTimeout(check, 5)
+}
+check()
+"""
+
+
+def build_page(glyph, n, backend, path):
+    """Write a standalone page drawing n glyphs of one kind."""
+    from bokeh.embed import file_html
+    from bokeh.resources import INLINE
+    from bokeh.plotting import figure
+
+    rng = np.random.default_rng(n)
+    fig = figure(plot_width=800, plot_height=500, output_backend=backend)
+    if glyph == 'line':
+        fig.line(np.arange(n), rng.normal(size=n).cumsum())
+    elif glyph == 'vbar':
+        fig.vbar(x=np.arange(n), top=rng.random(n), width=0.8)
+    else:
+        getattr(fig, glyph)(rng.normal(size=n), rng.normal(size=n), size=4)
+
+    with open(path, 'w') as f:
+        f.write(file_html(fig, INLINE, title=f'{glyph} {n} {backend}'))
+
+
+def time_render(driver, path, repeat):
+    """Median time from navigation until the document is idle, in ms."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        driver.get(f'file://{path}')
+        driver.execute_async_script(WAIT_FOR_IDLE)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def crossover(sizes, canvas, webgl):
+    """Smallest size from which WebGL stays faster than canvas, or None."""
+    faster = [w < c for c, w in zip(canvas, webgl)]
+    for i, size in enumerate(sizes):
+        if all(faster[i:]):
+            return size
+    return None
+
+
+def main():
+    from bokeh.io.webdriver import webdriver_control
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=THRESHOLDS_FILE)
+    args = parser.parse_args()
+
+    driver = webdriver_control.create()
+    driver.set_script_timeout(120)
+    results = {'thresholds': {}, 'timings': {}}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for family, glyph in FAMILIES.items():
+                timings = {'canvas': [], 'webgl': []}
+                for n in SIZES:
+                    for backend in timings:
+                        path = os.path.join(tmp, f'{glyph}-{n}-{backend}.html')
+                        build_page(glyph, n, backend, path)
+                        timings[backend].append(
+                            time_render(driver, path, args.repeat))
+                    print(f'{family:>6} {n:>7}: '
+                          f'canvas {timings["canvas"][-1]:8.1f} ms, '
+                          f'webgl {timings["webgl"][-1]:8.1f} ms')
+
+                results['timings'][family] = dict(sizes=SIZES, **timings)
+                # None, written as null, when WebGL never caught up
+                results['thresholds'][family] = crossover(
+                    SIZES, timings['canvas'], timings['webgl'])
+    finally:
+        driver.quit()
+
+    results['measured'] = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'browser': driver.capabilities.get('browserName'),
+        'browser_version': driver.capabilities.get('browserVersion'),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Crossover points {results["thresholds"]} written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Incremental Chart Builds
+
+Renders the charts in charts.py to HTML, skipping any chart whose output
+is already up to date. A chart's cache key is a hash of the data slice it
+draws from, its spec, the source of every local module its builder's
+module imports and the files they read, and Bokeh's version, so after a
+new day of standings only the charts whose team slice actually changed
+are rendered again.
+
+    python build_cache.py [--out-dir DIR] [--force]
+"""
+import argparse
+import ast
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+CACHE_FILE = '.build_cache.json'
+
+
+def data_hash(frame):
+    """Hash a DataFrame's columns, dtypes and values, ignoring its index."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(map(str, frame.columns)),
+                              list(map(str, frame.dtypes))]).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy()
+                  .tobytes())
+    return digest.hexdigest()
+
+
+def spec_hash(spec):
+    return hashlib.sha256(
+        json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def local_files(path):
+    """A module's file, every local module it imports, and the files they
+    read, recursively, sorted.
+
+    Imports anywhere in a module count, including the ones inside
+    functions. A module is local if its .py file sits next to the one
+    importing it, and so is any .json file named in it that does.
+    """
+    found, pending = set(), [os.path.abspath(path)]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found.add(path)
+        if not path.endswith('.py'):
+            continue
+        here = os.path.dirname(path)
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                names = [node.module]
+            elif isinstance(node, ast.Constant) \
+                    and isinstance(node.value, str) \
+                    and node.value.endswith('.json'):
+                names = [node.value]
+            else:
+                continue
+            for name in names:
+                if not name.endswith('.json'):
+                    name = name.split('.')[0] + '.py'
+                candidate = os.path.join(here, name)
+                if os.path.isfile(candidate):
+                    pending.append(candidate)
+    return sorted(found)
+
+
+def code_hash(function):
+    """Hash the local code a chart's builder depends on, and Bokeh's version.
+
+    Hashing whole modules rather than the one function also catches
+    changes to the helpers the builder calls, and following their imports
+    catches the modules those come from.
+    """
+    import bokeh
+
+    digest = hashlib.sha256(bokeh.__version__.encode())
+    here = os.path.dirname(os.path.abspath(inspect.getsourcefile(function)))
+    for path in local_files(inspect.getsourcefile(function)):
+        digest.update(os.path.relpath(path, here).encode())
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def chart_key(chart, data):
+    return hashlib.sha256(''.join([
+        data_hash(data), spec_hash(chart.spec), code_hash(chart.build),
+        chart.title]).encode()).hexdigest()
+
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_cache(cache, path):
+    with open(path, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+
+
+def build_charts(charts, datasets, out_dir='.', cache_path=None,
+                 force=False):
+    """Render each chart unless its output file is already up to date.
+
+    Returns {filename: 'built', 'cached' or 'missing'}; a chart whose
+    datasets can't be read is skipped, and an older page is left as is.
+    """
+    from bokeh.embed import file_html
+    from bokeh.resources import CDN
+
+    cache_path = cache_path or os.path.join(out_dir, CACHE_FILE)
+    cache = load_cache(cache_path)
+    status = {}
+    for chart in charts:
+        if not all(datasets.available(name) for name in chart.reads):
+            status[chart.filename] = 'missing'
+            continue
+        data = chart.select(datasets)
+        key = chart_key(chart, data)
+        path = os.path.join(out_dir, chart.filename)
+
+        if not force and cache.get(chart.filename) == key \
+                and os.path.exists(path):
+            status[chart.filename] = 'cached'
+            continue
+
+        html = file_html(chart.build(data, chart.spec), CDN, chart.title)
+        with open(path, 'w') as f:
+            f.write(html)
+        cache[chart.filename] = key
+        save_cache(cache, cache_path)
+        status[chart.filename] = 'built'
+    return status
+
+
+def main():
+    from charts import CHARTS
+    from datasets import Datasets
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--force', action='store_true',
+                        help='render every chart, even if up to date')
+    args = parser.parse_args()
+
+    status = build_charts(CHARTS, Datasets(), args.out_dir, force=args.force)
+    for filename, state in status.items():
+        print(f'{state:>7}  {filename}')
+
+
+if __name__ == '__main__':
+    main()
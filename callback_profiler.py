@@ -0,0 +1,253 @@
+"""Callback Profiling
+
+An opt-in profiler for the server app's Python callbacks. Every callback
+runs on the process's single event loop, so one slow callback stalls
+every session the worker serves. Once installed, every on_change and
+on_event callback registered on any model is timed:
+
+- each callback gets a latency histogram, named after the model, the
+  property or event, and the function;
+- a probe measures how late the event loop wakes up, which is how long
+  something blocked it, callbacks or anything else;
+- with a threshold set, callbacks also run under cProfile, and the stats
+  of calls slower than the threshold are kept. Only one profiler can be
+  active at a time (Python 3.12 refuses a second), so a callback that
+  triggers another one, e.g. by setting a property, profiles both, and
+  the inner one is only timed.
+
+Enable it with VISDAT_PROFILE=1 (python serve.py --profile does this),
+and set VISDAT_PROFILE_THRESHOLD_MS to capture profiles. serve.py serves
+the results as JSON at /metrics, and /metrics?profiles=1 includes the
+captured profiles.
+"""
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+import numpy as np
+
+PROFILE_ENV = 'VISDAT_PROFILE'
+THRESHOLD_ENV = 'VISDAT_PROFILE_THRESHOLD_MS'
+
+# Histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+              float('inf'))
+PROBE_SECONDS = 0.1
+KEPT_PROFILES = 20
+PROFILE_LINES = 25
+
+# Whether a wrapped callback is running under cProfile on this thread
+_profiling = threading.local()
+
+
+class Histogram:
+    """Counts of durations per bucket, with their total and maximum."""
+
+    def __init__(self):
+        self.counts = np.zeros(len(BUCKETS_MS), dtype=np.int64)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.counts[np.searchsorted(BUCKETS_MS, ms)] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def quantile(self, q):
+        """Upper bound of the bucket the q-quantile falls in."""
+        if not self.count:
+            return None
+        bucket = np.searchsorted(np.cumsum(self.counts), q * self.count)
+        return round(min(BUCKETS_MS[bucket], self.max_ms), 3)
+
+    def to_json(self):
+        return {'count': self.count,
+                'total_ms': round(self.total_ms, 3),
+                'max_ms': round(self.max_ms, 3),
+                'p50_ms': self.quantile(0.5),
+                'p99_ms': self.quantile(0.99),
+                'buckets': {str(bound): int(n) for bound, n
+                            in zip(BUCKETS_MS, self.counts) if n}}
+
+
+class CallbackProfiler:
+    """Latency histograms and slow-call profiles for wrapped callbacks."""
+
+    def __init__(self, threshold_ms=None):
+        self.threshold_ms = threshold_ms
+        self.callbacks = {}                  # name -> Histogram
+        self.loop_lag = Histogram()
+        self.profiles = deque(maxlen=KEPT_PROFILES)
+        self.started = time.time()
+        self._probe = None
+
+    def wrap(self, name, callback):
+        """A callback with the same signature that records each call."""
+
+        @wraps(callback)
+        def timed(*args, **kwargs):
+            profile = None
+            if self.threshold_ms and not getattr(_profiling, 'active', False):
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:       # another tool is profiling
+                    profile = None
+                else:
+                    _profiling.active = True
+            start = time.perf_counter()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                ms = (time.perf_counter() - start) * 1000
+                if profile is not None:
+                    profile.disable()
+                    _profiling.active = False
+                self.callbacks.setdefault(name, Histogram()).add(ms)
+                if profile is not None and ms >= self.threshold_ms:
+                    self._keep_profile(name, ms, profile)
+
+        return timed
+
+    def _keep_profile(self, name, ms, profile):
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats(
+            'cumulative').print_stats(PROFILE_LINES)
+        self.profiles.append({'callback': name, 'ms': round(ms, 3),
+                              'at': time.time(), 'stats': out.getvalue()})
+
+    def start_probe(self):
+        """Measure event-loop lag from now on, if a loop is running."""
+        if self._probe is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._probe = loop.create_task(self._run_probe())
+
+    async def _run_probe(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(PROBE_SECONDS)
+            late = time.perf_counter() - start - PROBE_SECONDS
+            self.loop_lag.add(max(late, 0) * 1000)
+
+    def metrics(self, profiles=False):
+        slowest = sorted(self.callbacks.items(),
+                         key=lambda item: -item[1].total_ms)
+        result = {'pid': os.getpid(),
+                  'uptime_seconds': round(time.time() - self.started, 1),
+                  'threshold_ms': self.threshold_ms,
+                  'loop_lag': self.loop_lag.to_json(),
+                  'callbacks': {name: histogram.to_json()
+                                for name, histogram in slowest},
+                  'slow_calls': len(self.profiles)}
+        if profiles:
+            result['profiles'] = list(self.profiles)
+        return result
+
+
+def callback_name(model, trigger, callback):
+    """'Tabs.active:_server_tabs.<locals>.build_on_activate'."""
+    function = getattr(callback, '__qualname__', None) or repr(callback)
+    return f'{type(model).__name__}.{trigger}:{function}'
+
+
+_profiler = None
+
+
+def _registered(callbacks, callback):
+    """The callback, or the wrapper of it, in a list of registered ones."""
+    for registered in callbacks:
+        if registered is callback \
+                or getattr(registered, '__wrapped__', None) is callback:
+            return registered
+    return None
+
+
+def install(threshold_ms=None):
+    """Wrap the callbacks of every model from now on; returns the profiler.
+
+    Only callbacks registered after this call are timed, so it has to run
+    before the app builds its models.
+    """
+    from bokeh.util.callback_manager import (EventCallbackManager,
+                                             PropertyCallbackManager)
+
+    global _profiler
+    if _profiler is not None:
+        _profiler.start_probe()
+        return _profiler
+    profiler = _profiler = CallbackProfiler(threshold_ms)
+
+    # Wrappers are made afresh on every registration and only the model
+    # holds them, so they go when the model or the callback is removed.
+    # Each keeps the original as __wrapped__, which removal matches on.
+    def wrapped(model, trigger, callback):
+        return profiler.wrap(callback_name(model, trigger, callback),
+                             callback)
+
+    on_change = PropertyCallbackManager.on_change
+    remove_on_change = PropertyCallbackManager.remove_on_change
+    on_event = EventCallbackManager.on_event
+
+    def profiled_on_change(self, attr, *callbacks):
+        registered = self._callbacks.get(attr, [])
+        new = [wrapped(self, attr, callback) for callback in callbacks
+               if _registered(registered, callback) is None]
+        if new or not callbacks:
+            on_change(self, attr, *new)
+
+    def profiled_remove_on_change(self, attr, *callbacks):
+        registered = self._callbacks.get(attr, [])
+        remove_on_change(self, attr, *[
+            _registered(registered, callback) or callback
+            for callback in callbacks])
+
+    def profiled_on_event(self, event, *callbacks):
+        event_name = getattr(event, 'event_name', event)
+        on_event(self, event, *[wrapped(self, event_name, callback)
+                                for callback in callbacks])
+
+    PropertyCallbackManager.on_change = profiled_on_change
+    PropertyCallbackManager.remove_on_change = profiled_remove_on_change
+    EventCallbackManager.on_event = profiled_on_event
+    profiler.start_probe()
+    return profiler
+
+
+def install_if_enabled():
+    """install() when $VISDAT_PROFILE is set, else do nothing."""
+    if os.environ.get(PROFILE_ENV, '') in ('', '0'):
+        return None
+    threshold = os.environ.get(THRESHOLD_ENV)
+    return install(float(threshold) if threshold else None)
+
+
+def metrics_handler():
+    """A tornado handler serving the profiler's metrics as JSON."""
+    from tornado.web import RequestHandler
+
+    class MetricsHandler(RequestHandler):
+        def get(self):
+            self.set_header('Content-Type', 'application/json')
+            if _profiler is None:
+                self.write(json.dumps({'pid': os.getpid(),
+                                       'enabled': False}))
+                return
+            profiles = self.get_argument('profiles', '') not in ('', '0')
+            self.write(json.dumps(_profiler.metrics(profiles)))
+
+    return MetricsHandler
@@ -0,0 +1,217 @@
+"""Declarative Chart Specs
+
+Compiles a JSON (or, with PyYAML installed, YAML) description of a
+dashboard into Bokeh models. A spec names its charts, the glyphs each chart
+draws, which dataset and rows every glyph reads, and how the charts are
+laid out:
+
+    {
+      "title": "Conference Top 2 Teams Wins Race",
+      "layout": {"type": "row", "children": ["west", "east"]},
+      "charts": {
+        "west": {
+          "figure": {"x_axis_type": "datetime", "plot_height": 300},
+          "glyphs": [{"type": "step", "dataset": "standings",
+                      "where": {"teamAbbr": "HOU"},
+                      "x": "stDate", "y": "gameWon",
+                      "color": "#CE1141", "legend_label": "Rockets"}],
+          "legend": {"location": "top_left"}
+        },
+        ...
+      }
+    }
+
+A where clause maps columns to a value, a list of values, or a
+{"min": ..., "max": ...} range. Before any model is built, the compiler
+plans the whole document: the rows and columns every glyph needs from a
+dataset are read through query.py and merged into one ColumnDataSource
+per dataset, and each glyph draws from it through a CDSView. No row is
+serialized twice, however many charts use it.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from query import SCHEMAS, Schema, table
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+def load_spec(path):
+    """Read a spec from a .json, .yaml or .yml file."""
+    with open(path) as f:
+        if os.path.splitext(path)[1] in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ImportError('PyYAML is needed to read YAML specs')
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def where_mask(frame, where):
+    """Boolean mask of the rows of frame matching a where clause."""
+    mask = np.ones(len(frame), dtype=bool)
+    for column, condition in (where or {}).items():
+        values = frame[column]
+        if isinstance(condition, dict):
+            if 'min' in condition:
+                mask &= (values >= _like(values, condition['min'])).to_numpy()
+            if 'max' in condition:
+                mask &= (values <= _like(values, condition['max'])).to_numpy()
+        elif isinstance(condition, list):
+            mask &= values.isin(condition).to_numpy()
+        else:
+            mask &= (values == condition).to_numpy()
+    return mask
+
+
+def _like(values, bound):
+    """Coerce a JSON bound to the column's type, e.g. dates from strings."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.Timestamp(bound)
+    return bound
+
+
+def glyph_columns(glyph, columns):
+    """The dataset columns a glyph refers to, by name or as a field."""
+    used = set((glyph.get('where') or {}).keys())
+    for key, value in glyph.items():
+        if key in ('type', 'dataset', 'where'):
+            continue
+        if isinstance(value, dict):
+            value = value.get('field')
+        if isinstance(value, str) and value in columns:
+            used.add(value)
+    return used
+
+
+class Plan:
+    """Which rows and columns of each dataset the document needs.
+
+    frames maps each dataset to the one merged frame its source is built
+    from, and masks maps (chart, glyph number) to the rows of that frame
+    the glyph draws.
+    """
+
+    def __init__(self, spec, datasets):
+        glyphs = [(name, i, glyph)
+                  for name, chart in spec['charts'].items()
+                  for i, glyph in enumerate(chart['glyphs'])]
+
+        rows, columns = {}, {}
+        for _, _, glyph in glyphs:
+            dataset = glyph['dataset']
+            frame = datasets[dataset]
+            found = table(frame, SCHEMAS.get(dataset, Schema(())).order)
+            rows[dataset] = np.union1d(
+                rows.get(dataset, np.empty(0, int)),
+                found.select(glyph.get('where')))
+            columns.setdefault(dataset, set()).update(
+                glyph_columns(glyph, frame.columns))
+
+        self.frames = {}
+        for dataset, positions in rows.items():
+            frame = datasets[dataset]
+            ordered = [c for c in frame.columns if c in columns[dataset]]
+            self.frames[dataset] = table(frame).take(positions, ordered)
+
+        self.masks = {(name, i): where_mask(self.frames[glyph['dataset']],
+                                            glyph.get('where'))
+                      for name, i, glyph in glyphs}
+
+    def summary(self):
+        """{dataset: (rows, columns)} shipped to the browser."""
+        return {dataset: frame.shape for dataset, frame in self.frames.items()}
+
+
+def compile_spec(spec, datasets):
+    """Build the layout a spec describes. Returns (layout, plan)."""
+    from bokeh.models import ColumnDataSource
+
+    plan = Plan(spec, datasets)
+    sources = {dataset: ColumnDataSource(frame)
+               for dataset, frame in plan.frames.items()}
+
+    figures = {name: _build_chart(name, chart, plan, sources)
+               for name, chart in spec['charts'].items()}
+    return _build_layout(spec['layout'], figures), plan
+
+
+def _build_chart(name, chart, plan, sources):
+    from bokeh.plotting import figure
+
+    fig = figure(**chart.get('figure', {}))
+    for i, glyph in enumerate(chart['glyphs']):
+        source = sources[glyph['dataset']]
+        kwargs = {key: value for key, value in glyph.items()
+                  if key not in ('type', 'dataset', 'where')}
+        getattr(fig, glyph['type'])(
+            source=source,
+            view=_view(source, glyph.get('where'), plan.masks[name, i]),
+            **kwargs)
+
+    for attr, value in chart.get('legend', {}).items():
+        setattr(fig.legend, attr, value)
+    if chart.get('hide_grid'):
+        fig.grid.grid_line_color = None
+    return fig
+
+
+def _view(source, where, mask):
+    """A CDSView for a glyph's rows of the shared source.
+
+    Single-value string clauses become GroupFilters, which BokehJS
+    evaluates itself; anything else ships the matching row indices.
+    """
+    from bokeh.models import CDSView, GroupFilter, IndexFilter
+
+    if not where or mask.all():
+        return CDSView(source=source)
+    if all(isinstance(value, str) for value in where.values()):
+        return CDSView(source=source, filters=[
+            GroupFilter(column_name=column, group=value)
+            for column, value in where.items()])
+    return CDSView(source=source,
+                   filters=[IndexFilter(np.flatnonzero(mask).tolist())])
+
+
+def _build_layout(node, figures):
+    from bokeh.layouts import column, gridplot, row
+    from bokeh.models import Panel, Tabs
+
+    if isinstance(node, str):
+        return figures[node]
+    kind = node['type']
+    if kind == 'grid':
+        return gridplot([[None if child is None
+                          else _build_layout(child, figures)
+                          for child in grid_row]
+                         for grid_row in node['children']],
+                        **node.get('options', {}))
+    if kind == 'tabs':
+        return Tabs(tabs=[Panel(title=title,
+                                child=_build_layout(child, figures))
+                          for title, child in node['children']])
+    children = [_build_layout(child, figures) for child in node['children']]
+    return {'row': row, 'column': column}[kind](*children)
+
+
+def render_spec(path, datasets, filename=None):
+    """Compile a spec file and write it to HTML next to it, or to filename.
+
+    Returns the plan, for checking how much data the page carries.
+    """
+    from bokeh.embed import file_html
+    from bokeh.resources import CDN
+
+    spec = load_spec(path)
+    layout, plan = compile_spec(spec, datasets)
+    filename = filename or spec.get(
+        'filename', os.path.splitext(os.path.basename(path))[0] + '.html')
+    with open(filename, 'w') as f:
+        f.write(file_html(layout, CDN, spec.get('title')))
+    return plan
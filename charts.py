@@ -0,0 +1,336 @@
+"""Chart Definitions
+
+The data charts from the tutorial, written as data. Each Chart names the
+HTML file it renders to, selects the slice of the datasets it draws from
+through query.py, and builds its layout from that slice and a spec of
+figure and glyph parameters. Keeping the slice and the spec separate from
+the code is what lets build_cache.py tell when a chart actually needs
+re-rendering.
+"""
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from query import query
+
+
+class Chart(NamedTuple):
+    filename: str
+    title: str
+    select: Callable   # Datasets -> DataFrame slice the chart draws from
+    build: Callable    # (slice, spec) -> Bokeh layout
+    spec: dict
+    reads: tuple       # names of the datasets select() reads
+
+
+# ---------------------------------------------------------------------------
+# Data slices
+
+def standings_slice(datasets, teams):
+    """Daily wins for a few teams, sorted by team and date."""
+    return query(datasets, 'standings', teams=teams,
+                 columns=['stDate', 'teamAbbr', 'gameWon'])
+
+
+def three_takers_slice(datasets, min_attempts=100):
+    """Season three-point totals per player with at least min_attempts."""
+    three_takers = query(datasets, 'player_stats',
+                         where={'play3PA': {'min': 1}},
+                         columns=['playFNm', 'playLNm', 'play3PA', 'play3PM'])
+    three_takers = (three_takers
+                    .assign(name=three_takers['playFNm'] + ' '
+                            + three_takers['playLNm'])
+                    .groupby('name')[['play3PA', 'play3PM']]
+                    .sum()
+                    .sort_values('play3PA', ascending=False))
+    three_takers = three_takers[
+        three_takers['play3PA'] >= min_attempts].reset_index()
+    three_takers['pct3PM'] = three_takers['play3PM'] / three_takers['play3PA']
+    return three_takers
+
+
+def team_games_slice(datasets, team, columns):
+    """One team's regular season games in date order, numbered from 1."""
+    columns = list(dict.fromkeys(['gmDate'] + columns
+                                 + ['teamPTS', 'opptPTS']))
+    games = query(datasets, 'team_stats', teams=team, season_type='Regular',
+                  columns=columns)
+    games['game_num'] = np.arange(1, len(games) + 1)
+    games['winLoss'] = np.where(games['teamPTS'] > games['opptPTS'],
+                                'W', 'L')
+    return games
+
+
+def players_slice(datasets, players, columns):
+    """Game rows for a few (first name, last name) players."""
+    games = query(datasets, 'player_stats',
+                  where={'playLNm': [last for _, last in players],
+                         'playFNm': [first for first, _ in players]},
+                  columns=['playFNm', 'playLNm'] + columns)
+    names = pd.MultiIndex.from_frame(games[['playFNm', 'playLNm']])
+    return games[names.isin([tuple(player) for player in players])]
+
+
+# ---------------------------------------------------------------------------
+# Layout builders
+
+def race_figure(data, spec):
+    """Step lines of wins over time, one per team, from one shared source."""
+    from bokeh.models import CDSView, ColumnDataSource, GroupFilter
+    from bokeh.plotting import figure
+
+    source = ColumnDataSource(data)
+    fig = figure(**spec['figure'])
+    for team, (label, color) in spec['teams'].items():
+        view = CDSView(source=source,
+                       filters=[GroupFilter(column_name='teamAbbr',
+                                            group=team)])
+        fig.step('stDate', 'gameWon', source=source, view=view,
+                 color=color, legend_label=label)
+    fig.legend.location = 'top_left'
+    return fig
+
+
+def conference_races(data, spec):
+    """The Western and Eastern races side by side, in a grid, or in tabs."""
+    from bokeh.layouts import gridplot, row
+    from bokeh.models import Panel, Tabs
+
+    figs = {}
+    for conference, teams in spec['conferences'].items():
+        rows = data[data['teamAbbr'].isin(teams)]
+        figs[conference] = race_figure(
+            rows, {'figure': dict(spec['figure'], title=conference),
+                   'teams': teams})
+
+    west, east = figs['Western Conference'], figs['Eastern Conference']
+    if spec['layout'] == 'row':
+        return row(west, east)
+    if spec['layout'] == 'grid':
+        return gridplot([[west, east]], toolbar_location='right')
+    return Tabs(tabs=[Panel(child=fig, title=title)
+                      for title, fig in figs.items()])
+
+
+def three_point_scatter(data, spec):
+    """Three-point attempts vs. percentage with selections and hover."""
+    from bokeh.models import (ColumnDataSource, HoverTool,
+                              NumeralTickFormatter)
+    from bokeh.plotting import figure
+
+    from backends import choose_backend
+
+    fig = figure(**spec['figure'],
+                 output_backend=choose_backend(len(data), 'square'))
+    fig.yaxis[0].formatter = NumeralTickFormatter(format='00.0%')
+    source = ColumnDataSource(data)
+    fig.square(x='play3PA', y='pct3PM', source=source, **spec['square'])
+    hover_glyph = fig.circle(x='play3PA', y='pct3PM', source=source,
+                             size=15, alpha=0, hover_fill_color='black',
+                             hover_alpha=0.5)
+    fig.add_tools(HoverTool(tooltips=spec['tooltips'],
+                            renderers=[hover_glyph]))
+    return fig
+
+
+def linked_stats(data, spec):
+    """A grid of per-game bar charts sharing one panned x range."""
+    from bokeh.layouts import column, gridplot
+    from bokeh.models import CategoricalColorMapper, ColumnDataSource, Div
+    from bokeh.plotting import figure
+
+    source = ColumnDataSource(data)
+    win_loss_mapper = CategoricalColorMapper(factors=['W', 'L'],
+                                             palette=['green', 'red'])
+    figs = []
+    for stat_label, stat_col in spec['stats'].items():
+        fig = figure(y_axis_label=stat_label, **spec['figure'])
+        fig.vbar(x='game_num', top=stat_col, source=source, width=0.9,
+                 color=dict(field='winLoss', transform=win_loss_mapper))
+        figs.append(fig)
+    for fig in figs[1:]:
+        fig.x_range = figs[0].x_range
+
+    grid = gridplot([figs[:2], figs[2:]])
+    return column(Div(text=spec['header']), grid)
+
+
+def linked_selections(data, spec):
+    """Shooting percentages and point totals with linked selections."""
+    from bokeh.layouts import gridplot
+    from bokeh.models import (CategoricalColorMapper, ColumnDataSource,
+                              NumeralTickFormatter)
+    from bokeh.plotting import figure
+
+    from backends import choose_backend
+
+    source = ColumnDataSource(data)
+    backend = choose_backend(len(data), 'circle')
+    win_loss_mapper = CategoricalColorMapper(factors=['W', 'L'],
+                                             palette=['Green', 'Red'])
+
+    pct_fig = figure(**spec['pct_figure'], output_backend=backend)
+    pct_fig.circle(x='team2P%', y='team3P%', source=source, size=12,
+                   color='black')
+    pct_fig.xaxis[0].formatter = NumeralTickFormatter(format='00.0%')
+    pct_fig.yaxis[0].formatter = NumeralTickFormatter(format='00.0%')
+
+    tot_fig = figure(**spec['tot_figure'], output_backend=backend)
+    tot_fig.square(x='teamPTS', y='opptPTS', source=source, size=10,
+                   color=dict(field='winLoss', transform=win_loss_mapper))
+    return gridplot([[pct_fig, tot_fig]])
+
+
+def interactive_legends(data, spec):
+    """The same player scatter twice, with hide and mute legends."""
+    from bokeh.layouts import row
+    from bokeh.models import CDSView, ColumnDataSource, GroupFilter
+    from bokeh.plotting import figure
+
+    from backends import choose_backend
+
+    source = ColumnDataSource(data)
+    figure_kwargs = dict(spec['figure'],
+                         output_backend=choose_backend(len(data), 'circle'))
+    hide_fig = figure(**figure_kwargs, title='Click Legend to HIDE Data',
+                      y_axis_label='Rebounds')
+    mute_fig = figure(**figure_kwargs, title='Click Legend to MUTE Data')
+
+    for (first, last), color in spec['players']:
+        view = CDSView(source=source, filters=[
+            GroupFilter(column_name='playFNm', group=first),
+            GroupFilter(column_name='playLNm', group=last)])
+        circle_kwargs = dict(spec['circle'], source=source, view=view,
+                             color=color, legend_label=f'{first} {last}')
+        hide_fig.circle(**circle_kwargs)
+        mute_fig.circle(**circle_kwargs, muted_alpha=0.1)
+
+    hide_fig.legend.click_policy = 'hide'
+    mute_fig.legend.click_policy = 'mute'
+    return row(hide_fig, mute_fig)
+
+
+# ---------------------------------------------------------------------------
+# The charts
+
+RACE_FIGURE = {'x_axis_type': 'datetime', 'plot_height': 300,
+               'x_axis_label': 'Date', 'y_axis_label': 'Wins'}
+WEST_TEAMS = {'HOU': ['Rockets', '#CE1141'], 'GS': ['Warriors', '#006BB6']}
+EAST_TEAMS = {'BOS': ['Celtics', '#007A33'], 'TOR': ['Raptors', '#CE1141']}
+CONFERENCES = {'Western Conference': WEST_TEAMS,
+               'Eastern Conference': EAST_TEAMS}
+
+
+def _conference_race_chart(filename, layout, plot_width):
+    return Chart(
+        filename=filename,
+        title='Conference Top 2 Teams Wins Race',
+        select=lambda datasets: standings_slice(
+            datasets, list(WEST_TEAMS) + list(EAST_TEAMS)),
+        build=conference_races,
+        spec={'figure': dict(RACE_FIGURE, plot_width=plot_width),
+              'conferences': CONFERENCES,
+              'layout': layout},
+        reads=('standings',))
+
+
+CHARTS = [
+    Chart(
+        filename='west-top-2-standings-race.html',
+        title='Western Conference Top 2 Teams Wins Race',
+        select=lambda datasets: standings_slice(datasets, list(WEST_TEAMS)),
+        build=race_figure,
+        spec={'figure': dict(RACE_FIGURE, plot_width=600,
+                             title='Western Conference Top 2 Teams Wins '
+                                   'Race, 2017-18'),
+              'teams': WEST_TEAMS},
+        reads=('standings',)),
+    Chart(
+        filename='east-top-2-standings-race.html',
+        title='Eastern Conference Top 2 Teams Wins Race',
+        select=lambda datasets: standings_slice(datasets, list(EAST_TEAMS)),
+        build=race_figure,
+        spec={'figure': dict(RACE_FIGURE, plot_width=600,
+                             title='Eastern Conference Top 2 Teams Wins '
+                                   'Race, 2017-18'),
+              'teams': EAST_TEAMS},
+        reads=('standings',)),
+    _conference_race_chart('east-west-top-2-standings-race.html', 'row', 600),
+    _conference_race_chart('east-west-top-2-gridplot.html', 'grid', 300),
+    _conference_race_chart('east-west-top-2-tabbed_layout.html', 'tabs', 800),
+    Chart(
+        filename='three-point-att-vs-pct.html',
+        title='Three-Point Attempts vs. Percentage',
+        select=three_takers_slice,
+        build=three_point_scatter,
+        spec={'figure': {'plot_height': 400, 'plot_width': 600,
+                         'x_axis_label': 'Three-Point Shots Attempted',
+                         'y_axis_label': 'Percentage Made',
+                         'title': '3PT Shots Attempted vs. Percentage Made '
+                                  '(min. 100 3PA), 2017-18',
+                         'toolbar_location': 'below',
+                         'tools': ['box_select', 'lasso_select',
+                                   'poly_select', 'tap', 'reset']},
+              'square': {'color': 'royalblue',
+                         'selection_color': 'deepskyblue',
+                         'nonselection_color': 'lightgray',
+                         'nonselection_alpha': 0.3},
+              'tooltips': [('Player', '@name'),
+                           ('Three-Pointers Made', '@play3PM'),
+                           ('Three-Pointers Attempted', '@play3PA'),
+                           ('Three-Point Percentage', '@pct3PM{00.0%}')]},
+        reads=('player_stats',)),
+    Chart(
+        filename='phi-gm-linked-stats.html',
+        title='76ers Game Log',
+        select=lambda datasets: team_games_slice(
+            datasets, 'PHI', ['teamPTS', 'teamTRB', 'teamAST', 'teamTO']),
+        build=linked_stats,
+        spec={'figure': {'plot_height': 200, 'plot_width': 400,
+                         'x_range': [1, 10],
+                         'tools': ['xpan', 'reset', 'save']},
+              'stats': {'Points': 'teamPTS', 'Assists': 'teamAST',
+                        'Rebounds': 'teamTRB', 'Turnovers': 'teamTO'},
+              'header': '<h3>Philadelphia 76ers Game Log</h3>'
+                        '<b><i>2017-18 Regular Season</i><br></b>'
+                        '<i>Wins in green, losses in red</i>'},
+        reads=('team_stats',)),
+    Chart(
+        filename='phi-gm-linked-selections.html',
+        title='76ers Percentages vs. Win-Loss',
+        select=lambda datasets: team_games_slice(
+            datasets, 'PHI', ['team2P%', 'team3P%']),
+        build=linked_selections,
+        spec={'pct_figure': {'title': '2PT FG % vs 3PT FG %, 2017-18 '
+                                      'Regular Season',
+                             'plot_height': 400, 'plot_width': 400,
+                             'tools': ['lasso_select', 'tap', 'reset',
+                                       'save'],
+                             'x_axis_label': '2PT FG%',
+                             'y_axis_label': '3PT FG%'},
+              'tot_figure': {'title': 'Team Points vs Opponent Points, '
+                                      '2017-18 Regular Season',
+                             'plot_height': 400, 'plot_width': 400,
+                             'tools': ['lasso_select', 'tap', 'reset',
+                                       'save'],
+                             'x_axis_label': 'Team Points',
+                             'y_axis_label': 'Opponent Points'}},
+        reads=('team_stats',)),
+    Chart(
+        filename='lebron-vs-durant.html',
+        title='LeBron James vs. Kevin Durant',
+        select=lambda datasets: players_slice(
+            datasets, [('LeBron', 'James'), ('Kevin', 'Durant')],
+            ['playPTS', 'playTRB']),
+        build=interactive_legends,
+        spec={'figure': {'plot_width': 400, 'x_axis_label': 'Points',
+                         'toolbar_location': None},
+              'circle': {'x': 'playPTS', 'y': 'playTRB', 'size': 12,
+                         'alpha': 0.7},
+              'players': [[['LeBron', 'James'], '#002859'],
+                          [['Kevin', 'Durant'], '#FFC324']]},
+        reads=('player_stats',)),
+]
+
+CHARTS_BY_FILENAME = {chart.filename: chart for chart in CHARTS}
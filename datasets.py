@@ -0,0 +1,91 @@
+"""Datasets
+
+The csv files the charts are drawn from, each read the first time it's
+used rather than all up front. The standings are read from their
+delta-encoded store instead when one has been written next to the csv
+(see standings_store.py), rebuilt first if the csv has changed, and derived
+from the team box scores when there's neither (see derived_standings.py).
+"""
+import os
+
+import pandas as pd
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FILES = {
+    'player_stats': ('2017-18_playerBoxScore.csv', ['gmDate']),
+    'team_stats': ('2017-18_teamBoxScore.csv', ['gmDate']),
+    'standings': ('2017-18_standings.csv', ['stDate']),
+    'gapminder': ('gapminder_tidy.csv', None),
+}
+
+# Compact stores read in place of the csv when they exist
+STORES = {
+    'standings': '2017-18_standings.npz',
+}
+
+
+class Datasets:
+    """Lazily loaded frames, as attributes or items: data.standings."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self._frames = {}
+        self._stores = {}
+
+    def __getattr__(self, name):
+        if name not in FILES:
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._frames:
+            stored = self.store(name)
+            filename, dates = FILES[name]
+            path = os.path.join(self.data_dir, filename)
+            if stored is not None:
+                self._frames[name] = stored.frame()
+            elif name == 'standings' and not os.path.exists(path):
+                from derived_standings import derive_standings
+                self._frames[name] = derive_standings(self['team_stats'])
+            else:
+                self._frames[name] = pd.read_csv(path, parse_dates=dates)
+        return self._frames[name]
+
+    def store(self, name):
+        """The dataset's store, or None if it's only a csv.
+
+        query() rebuilds just the rows it needs from a store, without
+        building the whole frame.
+        """
+        if name not in self._stores:
+            path = os.path.join(self.data_dir, STORES.get(name, ''))
+            if name in STORES and os.path.exists(path):
+                from standings_store import load_current
+                self._stores[name] = load_current(
+                    path, os.path.join(self.data_dir, FILES[name][0]))
+            else:
+                self._stores[name] = None
+        return self._stores[name]
+
+    def available(self, name):
+        """Whether the dataset can be read: its csv is there, or a store or
+        the team box scores to build it from."""
+        if name in self._frames or self.store(name) is not None \
+                or os.path.exists(os.path.join(self.data_dir,
+                                               FILES[name][0])):
+            return True
+        return name == 'standings' and self.available('team_stats')
+
+    @property
+    def loaded(self):
+        return list(self._frames)
+
+
+def missing_data(names, width=600):
+    """A Div to show in place of a chart whose datasets can't be read."""
+    from bokeh.models import Div
+
+    files = ', '.join(FILES[name][0] for name in names)
+    return Div(text=f'<i>Data missing: this chart needs {files}, which '
+                    f'is not in the data directory.</i>', width=width)
@@ -0,0 +1,151 @@
+"""Derived Standings
+
+Builds the daily standings table from a season's box scores, so standings
+are available for corrected results, synthetic seasons or part of a
+season, not only the days a standings file was shipped for:
+
+    standings = derive_standings(data.team_stats)
+
+Every game is one row of team_stats per team. The games are sorted team by
+team and date, and the records (overall, home, away, conference, points)
+are running sums over them, reset at each team's first game; streaks are
+the distance back to where the current run of results began, and the last
+five and ten are running sums minus those five and ten games before. Each
+day's standings then take every team's latest game by that day, found by
+binary search, and games back and ranks are compared across each
+conference's teams for all days at once.
+
+The columns are the standings file's up to ptsDiff, in its order, and
+match it: ranks are per conference, ties sharing the higher rank, and a
+team yet to play has no streak and stands half a game behind a 1-0 leader.
+Averages are rounded to one decimal, so a tie such as 101.65 can round the
+other way from the file. Strength of schedule and the Pythagorean columns
+need the opponents' records and aren't derived.
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['stDate', 'teamAbbr', 'rank', 'rankOrd', 'gameWon', 'gameLost',
+           'stk', 'stkType', 'stkTot', 'gameBack', 'ptsFor', 'ptsAgnst',
+           'homeWin', 'homeLoss', 'awayWin', 'awayLoss', 'confWin',
+           'confLoss', 'lastFive', 'lastTen', 'gamePlay', 'ptsScore',
+           'ptsAllow', 'ptsDiff']
+
+
+def ordinal(numbers):
+    """'1st', '2nd', '11th', ... for an array of positive integers."""
+    numbers = np.asarray(numbers)
+    suffix = np.array(['th', 'st', 'nd', 'rd'] + ['th'] * 6)[numbers % 10]
+    suffix[(numbers % 100 >= 11) & (numbers % 100 <= 13)] = 'th'
+    return np.char.add(numbers.astype(str), suffix).astype(object)
+
+
+def _running(values, first):
+    """Running sums of values that restart at each team's first game."""
+    totals = np.cumsum(values)
+    before = np.where(first > 0, totals[first - 1], 0)
+    return totals - before
+
+
+def derive_standings(team_stats, dates=None, season_type='Regular'):
+    """The standings on each of dates, by date then team.
+
+    dates defaults to the days games were played. Only season_type games
+    count, if the box scores have seasTyp; pass None to count them all.
+    """
+    games = team_stats
+    if season_type is not None and 'seasTyp' in games:
+        games = games[games['seasTyp'] == season_type]
+    codes, teams = pd.factorize(games['teamAbbr'], sort=True)
+    days = games['gmDate'].to_numpy('datetime64[D]')
+    order = np.lexsort([days, codes])
+    codes, days = codes[order], days[order]
+
+    def column(name):
+        return games[name].to_numpy()[order]
+
+    won = (column('teamRslt') == 'Win').astype(np.int64)
+    lost = 1 - won
+    home = column('teamLoc') == 'Home'
+    conference = column('teamConf') == column('opptConf')
+
+    # Per game: the team's record after it
+    starts = np.searchsorted(codes, np.arange(len(teams)))
+    first = starts[codes]
+    played = {
+        'gameWon': won, 'gameLost': lost,
+        'homeWin': won * home, 'homeLoss': lost * home,
+        'awayWin': won * ~home, 'awayLoss': lost * ~home,
+        'confWin': won * conference, 'confLoss': lost * conference,
+        'gamePlay': np.ones(len(won), dtype=np.int64),
+        'ptsFor': column('teamPTS').astype(np.int64),
+        'ptsAgnst': column('opptPTS').astype(np.int64),
+    }
+    played = {name: _running(values, first)
+              for name, values in played.items()}
+    position = np.arange(len(won))
+    for name, games_back in (('lastFive', 5), ('lastTen', 10)):
+        back = position - games_back
+        earlier = np.where(back >= first,
+                           played['gameWon'][np.maximum(back, 0)], 0)
+        played[name] = played['gameWon'] - earlier
+    run = np.ones(len(won), dtype=bool)
+    run[1:] = (won[1:] != won[:-1]) | (first[1:] == position[1:])
+    played['stkTot'] = position - np.maximum.accumulate(
+        np.where(run, position, 0)) + 1
+
+    # Per team per day: the latest game by then, if it has played yet
+    if dates is None:
+        dates = np.unique(days)
+    dates = np.asarray(pd.to_datetime(np.asarray(dates)),
+                       dtype='datetime64[D]')
+    keys = (codes.astype(np.int64) << 32) + days.view(np.int64)
+    grid = ((np.arange(len(teams), dtype=np.int64) << 32)[None, :]
+            + dates.view(np.int64)[:, None])      # dates x teams
+    latest = np.searchsorted(keys, grid.ravel(), side='right') - 1
+    has_played = latest >= np.repeat(starts[None, :], len(dates),
+                                     axis=0).ravel()
+    latest = np.where(has_played, latest, 0)
+
+    def as_of(values, empty=0):
+        return np.where(has_played, values[latest], empty)
+
+    standings = {name: as_of(values) for name, values in played.items()}
+    streak = as_of(np.where(won == 1, 'W', 'L'), '-')
+    standings['stkType'] = np.where(streak == 'W', 'win', np.where(
+        streak == 'L', 'loss', '-')).astype(object)
+    standings['stk'] = np.where(
+        has_played, np.char.add(streak, standings['stkTot'].astype(str)),
+        '-').astype(object)
+
+    # Games back of and rank within the conference, every day at once
+    margin = (standings['gameWon'] - standings['gameLost']).reshape(
+        len(dates), len(teams))
+    back = np.zeros(margin.shape)
+    rank = np.zeros(margin.shape, dtype=np.int64)
+    conferences = (games.drop_duplicates('teamAbbr')
+                   .set_index('teamAbbr')['teamConf'].reindex(teams)
+                   .to_numpy())
+    for name in pd.unique(conferences):
+        members = np.flatnonzero(conferences == name)
+        behind = (margin[:, members].max(axis=1, keepdims=True)
+                  - margin[:, members]) / 2
+        back[:, members] = behind
+        rank[:, members] = 1 + (behind[:, None, :]
+                                < behind[:, :, None]).sum(axis=2)
+    standings['gameBack'] = back.ravel()
+    standings['rank'] = rank.ravel()
+    standings['rankOrd'] = ordinal(standings['rank'])
+
+    games_played = np.maximum(standings['gamePlay'], 1)
+    scored = standings['ptsFor'] / games_played
+    allowed = standings['ptsAgnst'] / games_played
+    standings['ptsScore'] = np.round(scored, 1)
+    standings['ptsAllow'] = np.round(allowed, 1)
+    standings['ptsDiff'] = np.round(scored - allowed, 1)
+
+    standings['stDate'] = np.repeat(dates, len(teams)).astype(
+        'datetime64[ns]')
+    standings['teamAbbr'] = np.tile(np.asarray(teams, dtype=object),
+                                    len(dates))
+    return pd.DataFrame(standings, columns=COLUMNS)
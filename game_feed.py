@@ -0,0 +1,283 @@
+"""Live Game Feed
+
+Streams in-game scoring into one small chart per game. The feed is a csv
+file with team_stats columns that grows while games are played: each row
+is one team's line at some point of a game, with teamMin the minutes
+played so far (counted per player as in the box scores, so five per
+minute of game time) and teamPTS and opptPTS the running score. A
+background task tails the file and parses new rows as they arrive; every open
+session appends them to its charts with ColumnDataSource.stream, so only
+the new points are sent, and rollover caps how many points each line
+keeps, on the server and in the browser alike.
+
+    python game_feed.py 2018-01-05 drop/game_feed.csv
+
+replays a day of the season into a feed file, one minute of game time per
+tick, as a stand-in for a real feed.
+"""
+import argparse
+import asyncio
+import csv
+import os
+import time
+from collections import deque
+from functools import partial
+from types import SimpleNamespace
+
+from query import query
+
+FEED_ENV = 'VISDAT_GAME_FEED'
+FEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'drop',
+                         'game_feed.csv')
+FEED_COLUMNS = ['gmDate', 'gmTime', 'teamAbbr', 'teamLoc', 'opptAbbr',
+                'teamMin', 'teamPTS', 'opptPTS']
+POLL_SECONDS = 1
+
+PLAYERS_ON_COURT = 5
+
+# Points kept per team line: a minute each covers regulation and four OTs
+ROLLOVER = 80
+CHARTS_PER_ROW = 3
+TEAM_COLORS = ['#1f77b4', '#d62728']
+
+
+class FeedParser:
+    """Turns chunks of csv text into records, holding back partial lines.
+
+    The first complete line is the header. teamMin, teamPTS and opptPTS
+    are converted to numbers; rows that don't parse are dropped.
+    """
+
+    def __init__(self):
+        self.header = None
+        self._partial = ''
+
+    def feed(self, text):
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        records = []
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            if self.header is None:
+                self.header = row
+                continue
+            record = dict(zip(self.header, row))
+            try:
+                record['teamMin'] = float(record['teamMin'])
+                record['teamPTS'] = int(record['teamPTS'])
+                record['opptPTS'] = int(record['opptPTS'])
+            except (KeyError, ValueError):
+                continue
+            records.append(record)
+        return records
+
+
+def game_id(record):
+    """'2018-01-05 BOS@NY': the date, then the away and home teams."""
+    team, oppt = record['teamAbbr'], record['opptAbbr']
+    away, home = (oppt, team) if record['teamLoc'] == 'Home' else (team, oppt)
+    return f"{record['gmDate']} {away}@{home}"
+
+
+def batch_records(records):
+    """Group records into {game: {team: {'minute': [...], 'points': [...]}}}.
+
+    These are the columns each team line's source is streamed.
+    """
+    batch = {}
+    for record in records:
+        columns = batch.setdefault(game_id(record), {}).setdefault(
+            record['teamAbbr'], {'minute': [], 'points': []})
+        columns['minute'].append(record['teamMin'] / PLAYERS_ON_COURT)
+        columns['points'].append(record['teamPTS'])
+    return batch
+
+
+class GameFeed:
+    """Tails the feed file and fans new points out to open sessions.
+
+    The last rollover points of every line are kept, so a session opened
+    mid-game starts from the current state; nothing older is held.
+    """
+
+    def __init__(self, path=FEED_FILE, rollover=ROLLOVER,
+                 interval=POLL_SECONDS):
+        self.path = path
+        self.rollover = rollover
+        self.interval = interval
+        self.games = {}          # game -> {team: deque of (minute, points)}
+        self._boards = {}        # document -> GameBoard
+        self._parser = FeedParser()
+        self._offset = 0
+        self._task = None
+
+    def snapshot(self):
+        """The points held for every game, batched like a feed update."""
+        return {game: {team: {'minute': [m for m, _ in points],
+                              'points': [p for _, p in points]}
+                       for team, points in teams.items()}
+                for game, teams in self.games.items()}
+
+    def subscribe(self, doc, board):
+        if doc not in self._boards:
+            doc.on_session_destroyed(
+                lambda context: self._boards.pop(doc, None))
+        self._boards[doc] = board
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self.run())
+
+    async def run(self):
+        while True:
+            self.poll()
+            await asyncio.sleep(self.interval)
+
+    def poll(self):
+        """Read whatever was appended since the last poll."""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if size < self._offset:
+            # A new feed file, e.g. the next day's games
+            self._parser, self._offset, self.games = FeedParser(), 0, {}
+            self._notify(None)
+        if size == self._offset:
+            return
+        with open(self.path) as f:
+            f.seek(self._offset)
+            text = f.read(size - self._offset)
+            self._offset = f.tell()
+
+        batch = batch_records(self._parser.feed(text))
+        for game, teams in batch.items():
+            lines = self.games.setdefault(game, {})
+            for team, columns in teams.items():
+                lines.setdefault(team, deque(maxlen=self.rollover)).extend(
+                    zip(columns['minute'], columns['points']))
+        if batch:
+            self._notify(batch)
+
+    def _notify(self, batch):
+        for doc, board in list(self._boards.items()):
+            doc.add_next_tick_callback(partial(board.apply, batch))
+
+
+class GameBoard:
+    """One session's grid of game charts, growing as games appear."""
+
+    def __init__(self, rollover=ROLLOVER):
+        from bokeh.layouts import column
+
+        self.rollover = rollover
+        self.layout = column()
+        self.figures = {}        # game -> figure
+        self.charts = {}         # game -> {team: ColumnDataSource}
+
+    def apply(self, batch):
+        """Stream a feed update in; None clears the board for a new feed."""
+        if batch is None:
+            self.layout.children = []
+            self.figures, self.charts = {}, {}
+            return
+        for game, teams in batch.items():
+            if game not in self.charts:
+                self._add_chart(game)
+            sources = self.charts[game]
+            for team, columns in teams.items():
+                if team not in sources:
+                    self._add_line(game, team)
+                sources[team].stream(columns, rollover=self.rollover)
+
+    def _add_chart(self, game):
+        from bokeh.layouts import row
+        from bokeh.plotting import figure
+
+        fig = figure(title=game, plot_width=300, plot_height=200,
+                     x_axis_label='Minute',
+                     y_axis_label='Points', tools='', toolbar_location=None)
+        rows = self.layout.children
+        if not rows or len(rows[-1].children) >= CHARTS_PER_ROW:
+            rows.append(row())
+        rows[-1].children.append(fig)
+        self.figures[game], self.charts[game] = fig, {}
+
+    def _add_line(self, game, team):
+        from bokeh.models import ColumnDataSource
+
+        fig, sources = self.figures[game], self.charts[game]
+        source = ColumnDataSource(data={'minute': [], 'points': []})
+        fig.step('minute', 'points', source=source, mode='after',
+                 color=TEAM_COLORS[len(sources) % len(TEAM_COLORS)],
+                 legend_label=team)
+        fig.legend.location = 'top_left'
+        sources[team] = source
+
+
+_game_feed = None
+
+
+def game_feed():
+    """This process's GameFeed, tailing $VISDAT_GAME_FEED if it's set."""
+    global _game_feed
+    if _game_feed is None:
+        _game_feed = GameFeed(os.environ.get(FEED_ENV, FEED_FILE))
+    return _game_feed
+
+
+def replay_lines(team_stats, date):
+    """Yield, minute by minute, the feed rows of a day's games.
+
+    Each team's period scores are spread evenly over the period's minutes,
+    giving running scores that match the final box score.
+    """
+    games = query(SimpleNamespace(team_stats=team_stats), 'team_stats',
+                  dates=(date, date))
+    periods = [f'PTS{i}' for i in range(1, 9)]
+    lines = []
+    for _, game in games.iterrows():
+        scored = [(game['team' + p], game['oppt' + p]) for p in periods]
+        played = 4 + sum(1 for team, oppt in scored[4:] if team or oppt)
+        minutes, team_pts, oppt_pts = [0], [0], [0]
+        for period, (team, oppt) in enumerate(scored[:played]):
+            length = 12 if period < 4 else 5
+            start, team_start, oppt_start = (minutes[-1], team_pts[-1],
+                                             oppt_pts[-1])
+            for minute in range(1, length + 1):
+                minutes.append(start + minute)
+                team_pts.append(team_start + round(team * minute / length))
+                oppt_pts.append(oppt_start + round(oppt * minute / length))
+        lines.append([[date, game['gmTime'], game['teamAbbr'],
+                       game['teamLoc'], game['opptAbbr'],
+                       m * PLAYERS_ON_COURT, t, o]
+                      for m, t, o in zip(minutes, team_pts, oppt_pts)])
+
+    for tick in range(max(map(len, lines), default=0)):
+        yield [game_lines[tick] for game_lines in lines
+               if tick < len(game_lines)]
+
+
+def main():
+    from datasets import Datasets
+
+    parser = argparse.ArgumentParser(
+        description='Replay a day of games into a feed file')
+    parser.add_argument('date', help='e.g. 2018-01-05')
+    parser.add_argument('feed', nargs='?', default=FEED_FILE)
+    parser.add_argument('--tick', type=float, default=1.0,
+                        help='seconds per minute of game time')
+    args = parser.parse_args()
+
+    team_stats = Datasets().team_stats
+    os.makedirs(os.path.dirname(os.path.abspath(args.feed)), exist_ok=True)
+    with open(args.feed, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(FEED_COLUMNS)
+        for rows in replay_lines(team_stats, args.date):
+            writer.writerows(rows)
+            f.flush()
+            time.sleep(args.tick)
+
+
+if __name__ == '__main__':
+    main()
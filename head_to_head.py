@@ -0,0 +1,144 @@
+"""Head-to-Head Records
+
+Accumulates wins, losses and point differential for every (team, opponent)
+pair into a sparse matrix stored in coordinate form. Team box score rows
+are folded in with one vectorized pass, and new games can be appended
+without going back to the raw frame.
+"""
+import numpy as np
+import pandas as pd
+
+# Pair keys are team_code * KEY_STRIDE + opponent_code
+KEY_STRIDE = 1 << 16
+
+
+class HeadToHead:
+    """Sparse team x opponent matrix of wins, losses and point differential.
+
+    Only pairs that have actually met are stored, as parallel arrays sorted
+    by pair key. Team codes are assigned in order of first appearance, so
+    they stay stable as new teams (or seasons) are appended.
+    """
+
+    def __init__(self):
+        self.teams = pd.Index([], dtype=object)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.wins = np.empty(0, dtype=np.int32)
+        self.losses = np.empty(0, dtype=np.int32)
+        self.point_diff = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_games(cls, team_stats):
+        h2h = cls()
+        h2h.append(team_stats)
+        return h2h
+
+    def __len__(self):
+        return len(self.keys)
+
+    def append(self, team_stats):
+        """Fold new team box score rows into the matrix.
+
+        The cost is proportional to the number of new rows plus the number
+        of stored pairs, never to the number of games seen so far.
+        """
+        if len(team_stats) == 0:
+            return self
+        team_code = self._codes(team_stats['teamAbbr'])
+        oppt_code = self._codes(team_stats['opptAbbr'])
+        keys = team_code * KEY_STRIDE + oppt_code
+
+        won = (team_stats['teamRslt'] == 'Win').to_numpy()
+        diff = (team_stats['teamPTS'] - team_stats['opptPTS']).to_numpy()
+
+        all_keys = np.concatenate([self.keys, keys])
+        self.keys, pair = np.unique(all_keys, return_inverse=True)
+        n_pairs = len(self.keys)
+        self.wins = np.bincount(
+            pair, np.concatenate([self.wins, won]), n_pairs).astype(np.int32)
+        self.losses = np.bincount(
+            pair, np.concatenate([self.losses, ~won]),
+            n_pairs).astype(np.int32)
+        self.point_diff = np.bincount(
+            pair, np.concatenate([self.point_diff, diff]),
+            n_pairs).astype(np.int64)
+        return self
+
+    def _codes(self, abbrs):
+        """Map team abbreviations to codes, registering unseen teams."""
+        new = pd.Index(abbrs.unique()).difference(self.teams, sort=False)
+        if len(new):
+            self.teams = self.teams.append(new)
+        return self.teams.get_indexer(abbrs).astype(np.int64)
+
+    def to_frame(self):
+        """One row per pair that has met, with totals from the team's side."""
+        team = self.teams[self.keys // KEY_STRIDE]
+        oppt = self.teams[self.keys % KEY_STRIDE]
+        games = self.wins + self.losses
+        return pd.DataFrame({
+            'teamAbbr': np.asarray(team),
+            'opptAbbr': np.asarray(oppt),
+            'wins': self.wins,
+            'losses': self.losses,
+            'games': games,
+            'winPct': self.wins / games,
+            'pointDiff': self.point_diff,
+            'avgMargin': self.point_diff / games,
+        })
+
+    def dense(self, stat='wins'):
+        """Expand one stat into a (team x opponent) array, zeros elsewhere."""
+        n = len(self.teams)
+        matrix = np.zeros((n, n), dtype=getattr(self, stat).dtype)
+        matrix[self.keys // KEY_STRIDE, self.keys % KEY_STRIDE] = \
+            getattr(self, stat)
+        return matrix
+
+
+def head_to_head_heatmap(h2h, stat='winPct', **figure_kwargs):
+    """Render the matrix as a team x opponent heatmap with hover details.
+
+    Only pairs that have met are drawn, so the glyph count follows the
+    sparsity of the schedule rather than the square of the team count.
+    """
+    from bokeh.models import (ColorBar, ColumnDataSource, HoverTool,
+                              LinearColorMapper)
+    from bokeh.palettes import RdBu11
+    from bokeh.plotting import figure
+
+    records = h2h.to_frame()
+    records['record'] = [f'{w}-{l}' for w, l in
+                         zip(records['wins'], records['losses'])]
+    teams = sorted(h2h.teams)
+
+    if stat == 'winPct':
+        mapper = LinearColorMapper(palette=RdBu11[::-1], low=0, high=1)
+    else:
+        bound = float(records[stat].abs().max())
+        mapper = LinearColorMapper(palette=RdBu11[::-1], low=-bound,
+                                   high=bound)
+
+    figure_kwargs.setdefault('plot_height', 650)
+    figure_kwargs.setdefault('plot_width', 700)
+    figure_kwargs.setdefault('title', 'Head-to-Head Records, 2017-18')
+    fig = figure(x_range=teams, y_range=teams[::-1],
+                 x_axis_label='Opponent', y_axis_label='Team',
+                 x_axis_location='above', tools='save', **figure_kwargs)
+    fig.rect(x='opptAbbr', y='teamAbbr', width=1, height=1,
+             source=ColumnDataSource(records),
+             fill_color=dict(field=stat, transform=mapper),
+             line_color=None)
+
+    fig.add_tools(HoverTool(tooltips=[
+        ('Matchup', '@teamAbbr vs. @opptAbbr'),
+        ('Record', '@record'),
+        ('Point Differential', '@pointDiff{+0}'),
+        ('Average Margin', '@avgMargin{+0.0}'),
+    ]))
+    fig.xaxis.major_label_orientation = np.pi / 2
+    fig.grid.grid_line_color = None
+    fig.axis.axis_line_color = None
+    fig.axis.major_tick_line_color = None
+    fig.add_layout(ColorBar(color_mapper=mapper), 'right')
+    return fig
@@ -0,0 +1,148 @@
+"""Lazy-Loading Tabs
+
+A Tabs layout whose hidden panels don't ship their data up front. Each
+panel is given as a title and a function that builds its child layout:
+
+- Under bokeh serve, only the active panel is built when the session
+  opens; every other panel is built the first time its tab is activated.
+- In static output, every panel is built but the data of the hidden panels
+  is written out to JSON files next to the page and fetched by the browser
+  the first time the tab is activated.
+
+Browsers refuse to fetch() from file:// pages, so static output needs to be
+served over HTTP (python -m http.server is enough).
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from bokeh.core.json_encoder import serialize_json
+
+PLACEHOLDER = '<i>Loading&hellip;</i>'
+
+# Turns the nulls source_data_json writes for missing values back into NaN
+NULLS_TO_NAN = """
+function nulls_to_nan(data) {
+    for (const column in data)
+        data[column] = data[column].map((v) => v === null ? NaN : v)
+    return data
+}
+"""
+
+# Fetches each panel's data files once, the first time its tab is shown
+LOAD_PANEL_DATA = NULLS_TO_NAN + """
+const i = tabs.active
+if (loaded[i])
+    return
+loaded[i] = true
+panels[i].forEach((source, j) => {
+    fetch(urls[i][j])
+        .then((response) => response.json())
+        .then((data) => { source.data = nulls_to_nan(data) })
+})
+"""
+
+
+def lazy_tabs(panels, active=0, data_dir=None, url_prefix=''):
+    """Build Tabs from (title, build) pairs, deferring hidden panels.
+
+    With data_dir=None the server mode is used, otherwise hidden panels'
+    data files are written to data_dir and fetched from url_prefix.
+    """
+    if data_dir is None:
+        return _server_tabs(panels, active)
+    return _static_tabs(panels, active, data_dir, url_prefix)
+
+
+def _server_tabs(panels, active):
+    from bokeh.models import Div, Panel, Tabs
+
+    builders = [build for _, build in panels]
+    built = {active}
+    tabs = Tabs(active=active, tabs=[
+        Panel(title=title,
+              child=build() if i == active else Div(text=PLACEHOLDER))
+        for i, (title, build) in enumerate(panels)])
+
+    def build_on_activate(attr, old, new):
+        if new not in built:
+            built.add(new)
+            tabs.tabs[new].child = builders[new]()
+
+    tabs.on_change('active', build_on_activate)
+    return tabs
+
+
+def _static_tabs(panels, active, data_dir, url_prefix):
+    from bokeh.models import ColumnDataSource, CustomJS, Panel, Tabs
+
+    children = [build() for _, build in panels]
+    panel_sources = [_sources(child, ColumnDataSource) for child in children]
+
+    # Sources the visible panel draws from stay inline in the page
+    inline = {source.id for source in panel_sources[active]}
+    deferred, urls, written = [], [], {}
+    for i, sources in enumerate(panel_sources):
+        sources = [s for s in sources if i != active and s.id not in inline]
+        for source in sources:
+            if source.id not in written:
+                written[source.id] = write_source_data(source, data_dir)
+        deferred.append(sources)
+        urls.append([url_prefix + written[source.id] for source in sources])
+    for sources in deferred:
+        for source in sources:
+            source.data = {column: [] for column in source.data}
+
+    tabs = Tabs(active=active, tabs=[
+        Panel(title=title, child=child)
+        for (title, _), child in zip(panels, children)])
+    loaded = [not sources for sources in deferred]
+    tabs.js_on_change('active', CustomJS(
+        args=dict(tabs=tabs, panels=deferred, urls=urls, loaded=loaded),
+        code=LOAD_PANEL_DATA))
+    return tabs
+
+
+def write_source_data(source, data_dir):
+    """Write a source's columns to data_dir as JSON, return the file name."""
+    name = f'data-{source.id}.json'
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, name), 'w') as f:
+        f.write(source_data_json(source))
+    return name
+
+
+def source_data_json(source):
+    """A source's columns as the plain JSON object BokehJS accepts as data.
+
+    serialize_json writes NaN as the string "NaN" and NaT as a date some
+    290 million years back, so missing values (NaN, NaT, None) go out as
+    null instead. BokehJS would read null as 0: the pages map it back to
+    NaN with NULLS_TO_NAN before setting the data.
+    """
+    columns = {column: _flat(values) for column, values in source.data.items()}
+    data = json.loads(serialize_json(columns))
+    for column, values in columns.items():
+        if isinstance(values, np.ndarray) and values.ndim == 1:
+            missing = pd.isna(values)
+            if missing.any():
+                data[column] = [None if gap else value
+                                for value, gap in zip(data[column], missing)]
+    return json.dumps(data, separators=(',', ':'))
+
+
+def _flat(values):
+    """A column of scalars as a 1-d array, any other column unchanged."""
+    try:
+        array = np.asarray(values)
+    except ValueError:               # ragged lists, as patches use
+        return values
+    return array if array.ndim == 1 else values
+
+
+def _sources(layout, model_type):
+    """All models of a type referenced anywhere inside a layout."""
+    return sorted((model for model in layout.references()
+                   if isinstance(model, model_type)),
+                  key=lambda model: model.id)
@@ -0,0 +1,205 @@
+"""Live Data Refresh
+
+Under bokeh serve, picks up new standings and box scores dropped into a
+directory while sessions stay connected. A background task polls the drop
+directory and reads any changed csv file in an executor thread, so the
+event loop, and every session on it, keeps running during the read. Once a
+new set of frames is completely loaded it replaces the current one in a
+single assignment: a reader holds either the old snapshot or the new one,
+never a mix of the two or a frame that's still being read.
+
+Each session subscribes an update callback per dataset it draws from.
+After a swap the callback is scheduled on the session's own document with
+add_next_tick_callback, and is given the new frame together with the rows
+appended to the old one, so a chart that only grew can stream the new rows
+instead of resending everything.
+
+Write new files into the drop directory under a temporary name and rename
+them into place, so the poller never reads one half-written. Standings
+needn't be dropped at all: while there's no standings file, they're
+derived from each new team box score file (see derived_standings.py).
+"""
+import asyncio
+import logging
+import os
+from functools import partial
+from typing import NamedTuple
+
+import pandas as pd
+
+from datasets import FILES
+from derived_standings import derive_standings
+
+DROP_DIR_ENV = 'VISDAT_DROP_DIR'
+REFRESH_ENV = 'VISDAT_REFRESH_SECONDS'
+DROP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'drop')
+
+# Datasets that change during the season
+REFRESHED = ('standings', 'team_stats', 'player_stats')
+REFRESH_SECONDS = 60
+
+log = logging.getLogger(__name__)
+
+
+class Snapshot(NamedTuple):
+    version: int
+    frames: dict   # dataset -> DataFrame, never modified once published
+    stamps: dict   # dataset -> (mtime_ns, size) of the file it was read from
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_snapshot(previous, drop_dir, names=REFRESHED):
+    """Read whichever drop files changed since previous.
+
+    Runs off the event loop. Returns (snapshot, changed dataset names), or
+    (None, []) when nothing changed. A file modified while it was being
+    read is skipped until the next poll.
+    """
+    frames, stamps, changed = dict(previous.frames), dict(previous.stamps), []
+    for name in names:
+        filename, dates = FILES[name]
+        path = os.path.join(drop_dir, filename)
+        try:
+            stamp = _stamp(path)
+            if stamps.get(name) == stamp:
+                continue
+            frame = pd.read_csv(path, parse_dates=dates)
+            if _stamp(path) != stamp:
+                continue
+        except FileNotFoundError:
+            continue
+        frames[name], stamps[name] = frame, stamp
+        changed.append(name)
+
+    if 'team_stats' in changed and 'standings' in names \
+            and 'standings' not in stamps:
+        frames['standings'] = derive_standings(frames['team_stats'])
+        changed.append('standings')
+    if not changed:
+        return None, []
+    return Snapshot(previous.version + 1, frames, stamps), changed
+
+
+def appended_rows(old, new):
+    """The rows new adds to the end of old, or None if old was changed.
+
+    Only the last overlapping row and the shapes are compared: drop files
+    are whole-season exports, so a file that only grew keeps its old rows.
+    """
+    if old is None or list(old.columns) != list(new.columns) \
+            or len(new) < len(old):
+        return None
+    if len(old) and not old.iloc[-1:].reset_index(drop=True).equals(
+            new.iloc[len(old) - 1:len(old)].reset_index(drop=True)):
+        return None
+    return new.iloc[len(old):]
+
+
+class LiveData:
+    """The current snapshot of the datasets, and the sessions watching it.
+
+    Datasets that were never refreshed are read from datasets, e.g. the
+    shared-memory frames under serve.py.
+    """
+
+    def __init__(self, datasets, drop_dir=DROP_DIR, interval=REFRESH_SECONDS):
+        self.datasets = datasets
+        self.drop_dir = drop_dir
+        self.interval = interval
+        self.snapshot = Snapshot(0, {}, {})
+        self._subscribers = {}   # document -> [(dataset, update)]
+        self._task = None
+
+    def __getitem__(self, name):
+        frames = self.snapshot.frames
+        return frames[name] if name in frames else self.datasets[name]
+
+    def store(self, name):
+        """The dataset's store, while it hasn't been refreshed."""
+        if name in self.snapshot.frames:
+            return None
+        return getattr(self.datasets, 'store', lambda name: None)(name)
+
+    def available(self, name):
+        return name in self.snapshot.frames or self.datasets.available(name)
+
+    def _current(self, name):
+        """The frame sessions have been drawing from, if any yet."""
+        if name in self.snapshot.frames or name in self.datasets.loaded:
+            return self[name]
+        return None
+
+    def __getattr__(self, name):
+        if name not in FILES:
+            raise AttributeError(name)
+        return self[name]
+
+    def subscribe(self, doc, dataset, update):
+        """Call update(frame, appended) on doc's next tick after a refresh.
+
+        appended is None when the frame didn't simply grow. Subscriptions
+        are dropped when the session closes; the poller starts with the
+        first one.
+        """
+        if doc not in self._subscribers:
+            self._subscribers[doc] = []
+            doc.on_session_destroyed(
+                lambda context: self._subscribers.pop(doc, None))
+        self._subscribers[doc].append((dataset, update))
+        self.start()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh(loop)
+            except Exception:
+                log.exception('Refreshing from %s failed', self.drop_dir)
+
+    async def refresh(self, loop):
+        """Load changed files in an executor, then swap and notify."""
+        if not os.path.isdir(self.drop_dir):
+            return
+        previous = self.snapshot
+        snapshot, changed = await loop.run_in_executor(
+            None, load_snapshot, previous, self.drop_dir)
+        if snapshot is None:
+            return
+
+        old = {name: self._current(name) for name in changed}
+        self.snapshot = snapshot
+        log.info('Loaded %s from %s (version %d)', ', '.join(changed),
+                 self.drop_dir, snapshot.version)
+
+        updates = {name: (snapshot.frames[name],
+                          appended_rows(old[name], snapshot.frames[name]))
+                   for name in changed}
+        for doc, subscriptions in list(self._subscribers.items()):
+            for dataset, update in subscriptions:
+                if dataset in updates:
+                    doc.add_next_tick_callback(
+                        partial(update, *updates[dataset]))
+
+
+_live_data = None
+
+
+def live_data():
+    """This process's LiveData, over shared_data.datasets()."""
+    from shared_data import datasets
+
+    global _live_data
+    if _live_data is None:
+        _live_data = LiveData(
+            datasets(), os.environ.get(DROP_DIR_ENV, DROP_DIR),
+            float(os.environ.get(REFRESH_ENV, REFRESH_SECONDS)))
+    return _live_data
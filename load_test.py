@@ -0,0 +1,436 @@
+"""Load Test
+
+Drives simulated users against a locally served visdat1.py, to find out
+how many concurrent sessions one dyno can take. Every simulated user
+opens its own session over the Bokeh websocket protocol, like a browser
+does, and then keeps interacting with the dashboard:
+
+- switching tabs, which builds a panel on the server the first time;
+- panning and zooming a scatter, which re-bins it on the server;
+- box and lasso selections, which the server resolves against every
+  plotted point and sums up.
+
+Team switches in the charts happen in the browser (CustomJS), so they
+never reach the server and aren't simulated.
+
+Each interaction is sent as a PATCH-DOC message, and its latency is the
+time until the server acknowledges it, which is after every server-side
+callback the change triggered has run. At the end the run reports
+p50/p99 latency per interaction, messages per second in each direction,
+and the server's resident memory (the process and its workers, read from
+/proc).
+
+    python load_test.py --sessions 50 --duration 60
+
+starts serve.py on a free local port for the run; pass --url to test a
+server that's already running (with --server-pid for its memory).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = '/visdat1'
+
+# Relative frequency of each interaction
+INTERACTIONS = {'tab': 1, 'zoom': 4, 'select': 2}
+REPLY_TIMEOUT = 30
+
+
+class SessionClosed(Exception):
+    """The server closed a session's websocket."""
+
+
+class Stats:
+    """Latencies and message counts collected from every user."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)   # interaction -> seconds
+        self.sent = self.received = self.errors = 0
+        self.sessions = self.closed = 0
+
+    def report(self, elapsed, rss):
+        lines = [f'{self.sessions} sessions, {elapsed:.1f} s',
+                 f'{"interaction":<12}{"count":>8}{"p50 ms":>10}'
+                 f'{"p99 ms":>10}']
+        for kind, values in sorted(self.latencies.items()):
+            p50, p99 = np.percentile(values, [50, 99]) * 1000
+            lines.append(f'{kind:<12}{len(values):>8}{p50:>10.1f}'
+                         f'{p99:>10.1f}')
+        lines.append(f'messages sent {self.sent / elapsed:.1f}/s, '
+                     f'received {self.received / elapsed:.1f}/s, '
+                     f'errors {self.errors}, sessions closed by the '
+                     f'server {self.closed}')
+        if rss:
+            lines.append(f'server RSS {rss[-1] / 2 ** 20:.1f} MB, '
+                         f'peak {max(rss) / 2 ** 20:.1f} MB')
+        return '\n'.join(lines)
+
+
+class SimulatedUser:
+    """One browser session, speaking the Bokeh protocol."""
+
+    def __init__(self, url, stats, rng):
+        from bokeh.protocol import Protocol
+        from bokeh.protocol.receiver import Receiver
+
+        self.url = url
+        self.stats = stats
+        self.rng = rng
+        self.protocol = Protocol()
+        self.receiver = Receiver(self.protocol)
+        self.socket = None
+        self.doc = None
+        self.closed = False
+        self._replies = {}       # request msgid -> Future
+        self._events = []
+        self._extents = {}       # figure id -> extent when first seen
+
+    async def connect(self):
+        from bokeh.client.websocket import WebSocketClientConnectionWrapper
+        from bokeh.document import Document
+        from bokeh.util.token import generate_jwt_token, generate_session_id
+        from tornado.websocket import websocket_connect
+
+        token = generate_jwt_token(generate_session_id())
+        ws_url = self.url.replace('http', 'ws', 1) + '/ws'
+        self.socket = WebSocketClientConnectionWrapper(
+            await websocket_connect(ws_url, subprotocols=['bokeh', token]))
+        ack = await self._read_message()
+        if ack.msgtype != 'ACK':
+            raise RuntimeError(f'expected ACK, got {ack.msgtype}')
+        asyncio.get_event_loop().create_task(self._read_loop())
+
+        reply = await self._request(self.protocol.create('PULL-DOC-REQ'))
+        self.doc = Document()
+        reply.push_to_document(self.doc)
+        self.doc.on_change(self._collect)
+
+    async def _read_message(self):
+        while True:
+            fragment = await self.socket.read_message()
+            if fragment is None:
+                return None
+            message = await self.receiver.consume(fragment)
+            if message is not None:
+                self.stats.received += 1
+                return message
+
+    async def _read_loop(self):
+        failure = SessionClosed()
+        try:
+            while True:
+                message = await self._read_message()
+                if message is None:
+                    break
+                if message.msgtype == 'PATCH-DOC':
+                    _inline_buffers(message)
+                    message.apply_to_document(self.doc, self)
+                elif message.msgtype == 'ERROR':
+                    self.stats.errors += 1
+                future = self._replies.pop(message.header.get('reqid'),
+                                           None)
+                if future is not None:
+                    future.set_result(message)
+        except Exception as error:
+            failure = error
+            if not self._replies:
+                self.stats.errors += 1
+        finally:
+            # Fail the requests still waiting, rather than cancel them,
+            # which would look like this task itself being cancelled
+            self.closed = True
+            for future in self._replies.values():
+                if not future.done():
+                    future.set_exception(failure)
+
+    async def _request(self, message):
+        if self.closed:
+            raise SessionClosed()
+        future = asyncio.get_event_loop().create_future()
+        self._replies[message.header['msgid']] = future
+        await message.send(self.socket)
+        self.stats.sent += 1
+        return await asyncio.wait_for(future, REPLY_TIMEOUT)
+
+    def _collect(self, event):
+        if getattr(event, 'setter', None) is not self:
+            self._events.append(event)
+
+    async def interact(self, kind):
+        """Make one change locally, send it, and time the round trip."""
+        events = getattr(self, '_' + kind)()
+        if not events:
+            return
+        message = self.protocol.create('PATCH-DOC', events, use_buffers=False)
+        start = time.perf_counter()
+        await self._request(message)
+        self.stats.latencies[kind].append(time.perf_counter() - start)
+
+    def _changes(self, change):
+        self._events = []
+        change()
+        return self._events
+
+    def _tab(self):
+        tabs = self.doc.roots[0]
+        choices = [i for i in range(len(tabs.tabs)) if i != tabs.active]
+        return self._changes(
+            lambda: setattr(tabs, 'active', self.rng.choice(choices)))
+
+    def _active_figures(self):
+        from bokeh.models import Plot
+
+        tabs = self.doc.roots[0]
+        return list(tabs.tabs[tabs.active].child.select({'type': Plot}))
+
+    def _zoom(self):
+        from bokeh.document.events import MessageSentEvent
+
+        # Zoom within the full extent, not whatever the last zoom left
+        for fig in self._active_figures():
+            if self._extents.get(fig.id) is None:
+                self._extents[fig.id] = _extent(fig)
+        figures = [(fig, self._extents[fig.id])
+                   for fig in self._active_figures() if self._extents[fig.id]]
+        if not figures:
+            return []
+        fig, (x0, x1, y0, y1) = self.rng.choice(figures)
+        window = []
+        for lo, hi in ((x0, x1), (y0, y1)):
+            width = (hi - lo) * self.rng.uniform(0.05, 1)
+            start = self.rng.uniform(lo, hi - width)
+            window += [start, start + width]
+        return [MessageSentEvent(self.doc, 'bokeh_event', {
+            'event_name': 'rangesupdate',
+            'event_values': {'model': {'id': fig.id},
+                             'x0': window[0], 'x1': window[1],
+                             'y0': window[2], 'y1': window[3]}})]
+
+    def _select(self):
+        from bokeh.document.events import MessageSentEvent
+        from bokeh.models import BoxSelectTool, LassoSelectTool
+
+        # What BokehJS sends when a box or lasso is drawn: the geometry in
+        # data coordinates, within the full extent of the figure
+        figures = [fig for fig in self._active_figures()
+                   if fig.select({'type': (BoxSelectTool, LassoSelectTool)})]
+        for fig in figures:
+            if fig.id not in self._extents:
+                self._extents[fig.id] = _extent(fig)
+        figures = [fig for fig in figures if self._extents[fig.id]]
+        if not figures:
+            return []
+        fig = self.rng.choice(figures)
+        x0, x1, y0, y1 = self._extents[fig.id]
+        xs = sorted(self.rng.uniform(x0, x1) for _ in range(2))
+        ys = sorted(self.rng.uniform(y0, y1) for _ in range(2))
+        if self.rng.random() < 0.5:
+            geometry = {'type': 'rect', 'x0': xs[0], 'x1': xs[1],
+                        'y0': ys[0], 'y1': ys[1]}
+        else:
+            # A lasso: a rough ellipse inside the same box
+            angles = np.linspace(0, 2 * np.pi, 24, endpoint=False)
+            geometry = {'type': 'poly',
+                        'x': (np.mean(xs) + (xs[1] - xs[0]) / 2
+                              * np.cos(angles)).tolist(),
+                        'y': (np.mean(ys) + (ys[1] - ys[0]) / 2
+                              * np.sin(angles)).tolist()}
+        return [MessageSentEvent(self.doc, 'bokeh_event', {
+            'event_name': 'selectiongeometry',
+            'event_values': {'model': {'id': fig.id}, 'geometry': geometry,
+                             'final': True}})]
+
+    async def run(self, until, think):
+        kinds, weights = zip(*INTERACTIONS.items())
+        while time.monotonic() < until:
+            await asyncio.sleep(self.rng.expovariate(1 / think))
+            await self.interact(self.rng.choices(kinds, weights)[0])
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+
+
+def _inline_buffers(message):
+    """Put a message's binary buffers back into its content as lists.
+
+    Bokeh's Python client receives the arrays the server sends as separate
+    binary buffers, but doesn't resolve the references to them before
+    applying a patch.
+    """
+    buffers = {json.loads(header)['id']: payload
+               for header, payload in message.buffers}
+
+    def resolve(value):
+        if isinstance(value, dict):
+            if '__buffer__' in value:
+                array = np.frombuffer(buffers[value['__buffer__']],
+                                      dtype=value['dtype'])
+                return array.reshape(value['shape']).tolist()
+            return {key: resolve(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [resolve(item) for item in value]
+        return value
+
+    if buffers:
+        message.content = resolve(message.content)
+
+
+def _extent(fig):
+    """The data extent of a figure's image or points, if it has any."""
+    from bokeh.models import ColumnDataSource
+
+    for source in fig.select({'type': ColumnDataSource}):
+        data = source.data
+        if len(data.get('dw', [])):
+            return (data['x'][0], data['x'][0] + data['dw'][0],
+                    data['y'][0], data['y'][0] + data['dh'][0])
+        if len(data.get('x', [])) > 1:
+            x, y = np.asarray(data['x'], float), np.asarray(data['y'], float)
+            return x.min(), x.max(), y.min(), y.max()
+    return None
+
+
+def process_tree_rss(pid):
+    """Resident bytes of pid and its descendants, from /proc."""
+    children = defaultdict(list)
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except OSError:
+                continue
+            children[ppid].append(int(entry))
+
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending += children[current]
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+async def sample_rss(pid, samples, interval=1.0):
+    while True:
+        samples.append(process_tree_rss(pid))
+        await asyncio.sleep(interval)
+
+
+async def run_load(url, sessions, duration, think, ramp, server_pid=None,
+                   seed=0):
+    """Run the simulated users; returns (stats, elapsed seconds, rss)."""
+    stats, rss = Stats(), []
+    if server_pid:
+        sampler = asyncio.get_event_loop().create_task(
+            sample_rss(server_pid, rss))
+
+    users = [SimulatedUser(url, stats, random.Random(seed + i))
+             for i in range(sessions)]
+    start = time.monotonic()
+    until = start + duration
+
+    async def user_task(i, user):
+        await asyncio.sleep(ramp * i / max(sessions, 1))
+        try:
+            await user.connect()
+            stats.sessions += 1
+            await user.run(until, think)
+        except SessionClosed:
+            stats.closed += 1
+        except Exception:
+            stats.errors += 1
+
+    await asyncio.gather(*[user_task(i, user)
+                           for i, user in enumerate(users)])
+    elapsed = time.monotonic() - start
+    for user in users:
+        user.close()
+    if server_pid:
+        sampler.cancel()
+        rss.append(process_tree_rss(server_pid))
+    return stats, elapsed, rss
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(num_procs=1):
+    """Start serve.py on a free local port; returns (process, url).
+
+    The server gets a process group of its own, which stop_server() stops
+    along with the workers it forked.
+    """
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'serve.py'), '--port', str(port),
+         '--num-procs', str(num_procs)], cwd=HERE, start_new_session=True)
+    url = f'http://localhost:{port}{APP_PATH}'
+    for _ in range(120):
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return server, url
+        except OSError:
+            time.sleep(0.5)
+    stop_server(server)
+    raise RuntimeError('serve.py did not come up')
+
+
+def stop_server(server):
+    """SIGTERM serve.py and its workers, and wait for serve.py to exit."""
+    os.killpg(server.pid, signal.SIGTERM)
+    server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to keep interacting')
+    parser.add_argument('--think', type=float, default=1.0,
+                        help='mean seconds between interactions per user')
+    parser.add_argument('--ramp', type=float, default=5,
+                        help='seconds over which the sessions are opened')
+    parser.add_argument('--url', help='app URL of a running server')
+    parser.add_argument('--server-pid', type=int)
+    parser.add_argument('--num-procs', type=int, default=1,
+                        help='workers for the serve.py this starts')
+    args = parser.parse_args()
+
+    server = None
+    url, pid = args.url, args.server_pid
+    if url is None:
+        server, url = start_server(args.num_procs)
+        pid = server.pid
+    try:
+        stats, elapsed, rss = asyncio.run(run_load(
+            url, args.sessions, args.duration, args.think, args.ramp, pid))
+    finally:
+        if server is not None:
+            stop_server(server)
+    print(stats.report(elapsed, rss))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Render One Chart
+
+A command line entry point with one subcommand per chart in charts.py,
+for regenerating a single HTML file without running the whole tutorial:
+
+    python make_chart.py lebron-vs-durant --timings
+
+Only the datasets the chart reads are loaded. --timings reports how
+long importing (the chart definitions and Bokeh), loading, building and
+writing took.
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+# What the chart builders import
+BOKEH_MODULES = ('bokeh.layouts', 'bokeh.models', 'bokeh.plotting')
+
+
+class Timings:
+    """Wall-clock seconds per step, in the order the steps ran."""
+
+    def __init__(self):
+        self.steps = {}
+        self._last = time.perf_counter()
+
+    def lap(self, step):
+        now = time.perf_counter()
+        self.steps[step] = now - self._last
+        self._last = now
+
+    def report(self):
+        total = sum(self.steps.values())
+        lines = [f'{step:<8}{seconds * 1000:>9.1f} ms'
+                 for step, seconds in self.steps.items()]
+        return '\n'.join(lines + [f'{"total":<8}{total * 1000:>9.1f} ms'])
+
+
+def chart_command(filename):
+    """'lebron-vs-durant' for 'lebron-vs-durant.html'."""
+    return os.path.splitext(filename)[0]
+
+
+def parse_args(charts, argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='chart', metavar='CHART',
+                                     required=True)
+    for chart in charts:
+        command = commands.add_parser(chart_command(chart.filename),
+                                      help=chart.title)
+        command.add_argument('--out-dir', default='.')
+        command.add_argument('--data-dir', default=None)
+        command.add_argument('--timings', action='store_true',
+                             help='report import, load and build times')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    timings = Timings()
+    # Bokeh's modules are imported here, where they're timed as imports,
+    # rather than by the builder, where they'd count towards the build
+    for module in BOKEH_MODULES:
+        importlib.import_module(module)
+    from bokeh.embed import file_html
+    from bokeh.resources import CDN
+
+    from charts import CHARTS
+    from datasets import FILES, Datasets
+    timings.lap('import')
+
+    args = parse_args(CHARTS, argv)
+    chart = {chart_command(chart.filename): chart
+             for chart in CHARTS}[args.chart]
+
+    datasets = Datasets(*([args.data_dir] if args.data_dir else []))
+    missing = [FILES[name][0] for name in chart.reads
+               if not datasets.available(name)]
+    if missing:
+        sys.exit(f'{chart.filename} needs {", ".join(missing)}, which is '
+                 f'not in {datasets.data_dir}')
+    data = chart.select(datasets)
+    timings.lap('load')
+
+    layout = chart.build(data, chart.spec)
+    timings.lap('build')
+
+    path = os.path.join(args.out_dir, chart.filename)
+    with open(path, 'w') as f:
+        f.write(file_html(layout, CDN, chart.title))
+    timings.lap('write')
+
+    if args.timings:
+        print(timings.report(), file=sys.stderr)
+    print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Live Notebook Output
+
+In a notebook, every show() embeds the figure, with all of its data, in
+a new output cell, so tweaking a figure step by step (dropping the
+gridlines, adding a HoverTool, adding a hover glyph) re-sends everything
+each time and grows the notebook file. live_show() shows a figure once
+with a notebook handle, and on later calls for the same figure sends only
+what changed since through push_notebook(), updating the original cell
+in place:
+
+    output_notebook()
+    live_show(fig)                       # embeds fig
+    fig.grid.grid_line_color = None
+    live_show(fig)                       # pushes the one property change
+
+Outside a notebook it's the same as show(). With output_file() set as
+well, every call also saves the page again, as show() would.
+"""
+
+# Model id -> (state document, handle) of each figure shown live
+_handles = {}
+
+
+def live_show(obj):
+    """Show obj, or push its changes to where it was already shown."""
+    from bokeh.io import push_notebook, save, show
+    from bokeh.io.state import curstate
+
+    state = curstate()
+    if not state.notebook:
+        return show(obj)
+
+    # reset_output() starts a new state document, which the old handle
+    # no longer hears about
+    document, handle = _handles.get(obj.id, (None, None))
+    if handle is not None and document is state.document:
+        push_notebook(handle=handle)
+        if state.file:
+            # show() would also have rewritten the output_file() page
+            save(obj)
+        return handle
+
+    handle = show(obj, notebook_handle=True)
+    _handles[obj.id] = (state.document, handle)
+    return handle
+
+
+def forget(obj=None):
+    """Make the next live_show of obj (or of everything) embed anew."""
+    if obj is None:
+        _handles.clear()
+    else:
+        _handles.pop(obj.id, None)
@@ -0,0 +1,165 @@
+"""Player Similarity
+
+Builds a normalized per-player, per-season feature matrix from the player
+box scores and answers "players like X" queries as top-k nearest neighbors,
+computed with a single matrix product per batch of queries.
+"""
+from itertools import cycle
+
+import numpy as np
+import pandas as pd
+
+# Per-game averages compared between players, when present in the data
+FEATURES = ['playMin', 'playPTS', 'playAST', 'playTO', 'playSTL', 'playBLK',
+            'playFGA', 'playFGM', 'play2PA', 'play2PM', 'play3PA', 'play3PM',
+            'playFTA', 'playFTM', 'playORB', 'playDRB', 'playTRB']
+PLAYER_KEY = ['playFNm', 'playLNm', 'season']
+COLORS = ['#002859', '#FFC324', '#CE1141', '#007A33', '#5A2D81', '#00788C']
+
+
+def season_label(dates):
+    """Label game dates with their season, e.g. 2018-03-01 -> '2017-18'."""
+    codes, unique = pd.factorize(pd.to_datetime(dates))
+    start = unique.year - (unique.month < 7)
+    labels = (start.astype(str) + '-'
+              + ((start + 1) % 100).astype(str).str.zfill(2))
+    return pd.Series(np.asarray(labels)[codes], index=dates.index)
+
+
+def build_player_features(player_stats, features=FEATURES, min_games=10):
+    """Average each feature per player and season.
+
+    Players with fewer than min_games games in a season are dropped, since
+    a handful of garbage-time appearances makes for a meaningless profile.
+    """
+    features = [f for f in features if f in player_stats.columns]
+    games = player_stats.assign(season=season_label(player_stats['gmDate']))
+    grouped = games.groupby(PLAYER_KEY)
+    averages = grouped[features].mean()
+    averages['games'] = grouped.size()
+    return averages[averages['games'] >= min_games].reset_index()
+
+
+class PlayerIndex:
+    """Nearest-neighbor index over per-season player feature vectors.
+
+    Features are z-scored so that no single stat dominates the distance,
+    and stored as one contiguous float32 matrix with precomputed squared
+    norms, so a query is a matrix-vector product plus an argpartition.
+    """
+
+    def __init__(self, player_features, features=FEATURES):
+        self.features = [f for f in features if f in player_features.columns]
+        self.players = player_features.reset_index(drop=True)
+
+        values = self.players[self.features].to_numpy(np.float64)
+        self.mean = values.mean(axis=0)
+        self.std = values.std(axis=0)
+        self.std[self.std == 0] = 1
+        self.matrix = np.ascontiguousarray(
+            (values - self.mean) / self.std, dtype=np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    @classmethod
+    def from_box_scores(cls, player_stats, features=FEATURES, min_games=10):
+        return cls(build_player_features(player_stats, features, min_games),
+                   features)
+
+    def __len__(self):
+        return len(self.players)
+
+    def locate(self, first, last, season=None):
+        """Row of a player's season, defaulting to their latest season."""
+        rows = np.flatnonzero((self.players['playFNm'] == first)
+                              & (self.players['playLNm'] == last))
+        if season is not None:
+            rows = rows[self.players['season'].to_numpy()[rows] == season]
+        if len(rows) == 0:
+            raise KeyError(f'No player-season for {first} {last} {season}')
+        return rows[np.argmax(self.players['season'].to_numpy()[rows])]
+
+    def distances(self, rows):
+        """Squared distances from each queried row to every player-season."""
+        queries = self.matrix[np.atleast_1d(rows)]
+        return (self.sq_norms[np.newaxis, :]
+                - 2 * queries @ self.matrix.T
+                + self.sq_norms[np.atleast_1d(rows), np.newaxis])
+
+    def similar(self, first, last, season=None, k=5, same_season=True):
+        """The k player-seasons most similar to a player's season.
+
+        Other seasons of the same player are never returned, and by default
+        only players from the same season are considered.
+        """
+        row = self.locate(first, last, season)
+        dist = self.distances(row)[0]
+
+        player = self.players.iloc[row]
+        excluded = ((self.players['playFNm'] == player['playFNm'])
+                    & (self.players['playLNm'] == player['playLNm']))
+        if same_season:
+            excluded |= self.players['season'] != player['season']
+        dist[excluded.to_numpy()] = np.inf
+
+        k = min(k, int(np.isfinite(dist).sum()))
+        nearest = np.argpartition(dist, k - 1)[:k] if k else np.empty(0, int)
+        nearest = nearest[np.argsort(dist[nearest])]
+
+        result = self.players.iloc[nearest].copy()
+        result['distance'] = np.sqrt(np.maximum(dist[nearest], 0))
+        return result.reset_index(drop=True)
+
+
+def comparison_chart(player_stats, index, first, last, season=None, k=1):
+    """Scatter a player's games against their k most similar players.
+
+    Only the compared players' rows and the plotted columns are put into
+    the ColumnDataSource, rather than the whole box score table. With no
+    box scores to compare, a Div says so instead.
+    """
+    from bokeh.layouts import row
+    from bokeh.models import CDSView, ColumnDataSource, GroupFilter
+    from bokeh.plotting import figure
+
+    from backends import choose_backend
+    from datasets import missing_data
+
+    if player_stats is None or not len(index):
+        return missing_data(['player_stats'])
+
+    target = index.players.iloc[index.locate(first, last, season)]
+    rivals = index.similar(first, last, target['season'], k=k)
+    compared = pd.concat([target.to_frame().T, rivals], ignore_index=True)
+
+    games = player_stats.assign(season=season_label(player_stats['gmDate']))
+    names = games['playFNm'] + ' ' + games['playLNm']
+    compared_names = compared['playFNm'] + ' ' + compared['playLNm']
+    games = games[names.isin(compared_names)
+                  & (games['season'] == target['season'])]
+    source = ColumnDataSource(
+        games.assign(name=names)[['name', 'playPTS', 'playTRB']])
+
+    common_figure_kwargs = {
+        'plot_width': 400,
+        'x_axis_label': 'Points',
+        'toolbar_location': None,
+        'output_backend': choose_backend(len(games), 'circle'),
+    }
+    hide_fig = figure(**common_figure_kwargs,
+                      title='Click Legend to HIDE Data',
+                      y_axis_label='Rebounds')
+    mute_fig = figure(**common_figure_kwargs,
+                      title='Click Legend to MUTE Data')
+
+    for name, color in zip(compared_names, cycle(COLORS)):
+        view = CDSView(source=source,
+                       filters=[GroupFilter(column_name='name', group=name)])
+        circle_kwargs = dict(x='playPTS', y='playTRB', source=source,
+                             view=view, size=12, alpha=0.7, color=color,
+                             legend_label=name)
+        hide_fig.circle(**circle_kwargs)
+        mute_fig.circle(**circle_kwargs, muted_alpha=0.1)
+
+    hide_fig.legend.click_policy = 'hide'
+    mute_fig.legend.click_policy = 'mute'
+    return row(hide_fig, mute_fig)
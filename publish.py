@@ -0,0 +1,268 @@
+"""Precompressed Publishing
+
+Prepares a directory of generated pages, such as the one build_site()
+writes, for a plain static host, and serves it. Publishing writes a gzip
+and a brotli variant next to every page, script and data file, and a
+manifest giving each variant's size, type and strong ETag. The brotli
+package is in requirements.txt; where it's missing, only gzip variants
+are written, and publish.py says so:
+
+    python publish.py site            # write site/*.gz, *.br, manifest
+    python publish.py site --serve    # ... and serve it on port 8000
+
+The bundled server picks the smallest variant the browser accepts,
+without compressing anything per request, and answers If-None-Match with
+304 Not Modified. Content-hashed data files are cached for a year; pages
+are revalidated on every visit, which costs a 304 when nothing changed.
+
+The data files build_site() writes are gzip files already. They're served
+as they are to browsers that accept gzip, and brotli-compressed from the
+JSON inside to those that accept br; the pages read either.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST = 'precompressed.json'
+COMPRESSIBLE = ('.html', '.js', '.css', '.json', '.svg', '.txt', '.map')
+IMMUTABLE_DIRS = ('data/',)          # names change with their content
+ENCODINGS = ('br', 'gzip')           # preferred first
+SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def etag(payload):
+    """A strong ETag for a variant's bytes."""
+    return '"' + hashlib.sha256(payload).hexdigest()[:24] + '"'
+
+
+def compress(payload, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(payload, compresslevel=9, mtime=0)
+    return brotli.compress(payload, quality=11)
+
+
+def _variant(path, payload):
+    return {'file': path, 'bytes': len(payload), 'etag': etag(payload)}
+
+
+def _is_variant(path):
+    if path.endswith('.json.gz'):
+        return False
+    return path.endswith(tuple(SUFFIXES.values()))
+
+
+def publish_file(out_dir, path, previous=None):
+    """Write the variants of one file; returns its manifest entry.
+
+    previous is the file's entry from the last publish, whose variants
+    are reused when the file hasn't changed since.
+    """
+    with open(os.path.join(out_dir, path), 'rb') as f:
+        original = f.read()
+    identity = _variant(path, original)
+    if previous and previous['etag'] == identity['etag'] and all(
+            os.path.exists(os.path.join(out_dir, variant['file']))
+            for variant in previous['variants'].values()):
+        return previous
+
+    if path.endswith('.json.gz'):
+        # Already gzip: that's the gzip variant, and the JSON inside it
+        # is what the other variants carry. Sent without Content-Encoding
+        # it's a different representation, so it needs its own ETag
+        content_type = 'application/json'
+        variants = {'identity': dict(identity, type='application/gzip',
+                                     etag=identity['etag'][:-1] + '-raw"'),
+                    'gzip': identity}
+        content = gzip.decompress(original)
+        encodings = ['br']
+    else:
+        content_type = mimetypes.guess_type(path)[0] \
+            or 'application/octet-stream'
+        variants = {'identity': identity}
+        content = original
+        encodings = list(ENCODINGS) if path.endswith(COMPRESSIBLE) else []
+
+    for encoding in encodings:
+        if encoding == 'br' and brotli is None:
+            continue
+        payload = compress(content, encoding)
+        if len(payload) >= len(original):
+            continue
+        name = path + SUFFIXES[encoding]
+        with open(os.path.join(out_dir, name), 'wb') as f:
+            f.write(payload)
+        variants[encoding] = _variant(name, payload)
+    return {'type': content_type, 'etag': identity['etag'],
+            'variants': variants}
+
+
+def publish(out_dir):
+    """Precompress every file under out_dir and write the manifest.
+
+    Returns the manifest: {url path: {'type', 'etag', 'variants':
+    {encoding: {'file', 'bytes', 'etag'}}}}, with 'identity' for the file
+    as is. Files unchanged since the last publish aren't compressed again.
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+
+    manifest = {}
+    for root, _, files in os.walk(out_dir):
+        for name in sorted(files):
+            path = os.path.relpath(os.path.join(root, name), out_dir)
+            path = path.replace(os.sep, '/')
+            if path == MANIFEST or _is_variant(path):
+                continue
+            manifest[path] = publish_file(out_dir, path, previous.get(path))
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+def accepted_encodings(header):
+    """{encoding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        accepted[name.strip().lower()] = float(match.group(1)) if match \
+            else 1.0
+    return accepted
+
+
+def negotiate(variants, header):
+    """The encoding to send: the smallest variant the client accepts."""
+    accepted = accepted_encodings(header)
+    candidates = [encoding for encoding in variants
+                  if encoding != 'identity'
+                  and accepted.get(encoding, accepted.get('*', 0)) > 0]
+    if accepted.get('identity', accepted.get('*', 1)) > 0 \
+            or not candidates:
+        candidates.append('identity')
+    return min(candidates, key=lambda encoding: variants[encoding]['bytes'])
+
+
+def etag_matches(header, tag):
+    """Whether If-None-Match lists tag (compared weakly, as it should be)."""
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [value.strip() for value in header.split(',')]
+    return tag in [value[2:] if value.startswith('W/') else value
+                   for value in tags]
+
+
+def handler(out_dir, manifest):
+    """A request handler class serving out_dir's precompressed files."""
+
+    class PrecompressedHandler(BaseHTTPRequestHandler):
+        server_version = 'visdat-static'
+        protocol_version = 'HTTP/1.1'       # keep connections open
+
+        def do_HEAD(self):
+            self._respond(body=False)
+
+        def do_GET(self):
+            self._respond(body=True)
+
+        def _respond(self, body):
+            path = unquote(urlsplit(self.path).path).lstrip('/')
+            if path == '' or path.endswith('/'):
+                path += 'index.html'
+            entry = manifest.get(path)
+            if entry is None:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+
+            variants = entry['variants']
+            encoding = negotiate(variants,
+                                 self.headers.get('Accept-Encoding'))
+            variant = variants[encoding]
+            immutable = path.startswith(IMMUTABLE_DIRS)
+
+            if etag_matches(self.headers.get('If-None-Match'),
+                            variant['etag']):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self._common_headers(variant, immutable)
+                self.end_headers()
+                return
+
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type',
+                             variant.get('type', entry['type']))
+            if encoding != 'identity':
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(variant['bytes']))
+            self._common_headers(variant, immutable)
+            self.end_headers()
+            if body:
+                with open(os.path.join(out_dir, variant['file']), 'rb') as f:
+                    self.wfile.write(f.read())
+
+        def _common_headers(self, variant, immutable):
+            self.send_header('ETag', variant['etag'])
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Cache-Control',
+                             'public, max-age=31536000, immutable'
+                             if immutable else 'no-cache')
+
+    return PrecompressedHandler
+
+
+def serve(out_dir, port=8000, address='127.0.0.1'):
+    """Serve a published directory until interrupted."""
+    with open(os.path.join(out_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    server = ThreadingHTTPServer((address, port), handler(out_dir, manifest))
+    print(f'Serving {out_dir} at http://{address}:{server.server_port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out_dir', nargs='?', default='site')
+    parser.add_argument('--serve', action='store_true',
+                        help='serve the directory once published')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--address', default='127.0.0.1')
+    args = parser.parse_args(argv)
+
+    manifest = publish(args.out_dir)
+    original = sum(entry['variants']['identity']['bytes']
+                   for entry in manifest.values())
+    smallest = sum(min(variant['bytes']
+                       for variant in entry['variants'].values())
+                   for entry in manifest.values())
+    print(f'{len(manifest)} files, {original / 2 ** 20:.1f} MB, '
+          f'{smallest / 2 ** 20:.1f} MB compressed'
+          + ('' if brotli else ' (install brotli for .br variants)'))
+    if args.serve:
+        serve(args.out_dir, args.port, args.address)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Per-Quarter Scoring
+
+Builds a (team x game x period) int16 tensor from the teamPTS1-teamPTS8 and
+opptPTS1-opptPTS8 columns of the team box scores, and renders it as a
+heatmap drawn with a single image glyph.
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+PERIODS = 8
+PERIOD_LABELS = ['Q1', 'Q2', 'Q3', 'Q4', 'OT1', 'OT2', 'OT3', 'OT4']
+MISSING = -1
+
+
+class QuarterScoring(NamedTuple):
+    teams: np.ndarray      # (team,) team abbreviations, sorted
+    dates: np.ndarray      # (team, game) game dates, NaT where missing
+    team_pts: np.ndarray   # (team, game, period) int16, MISSING where absent
+    oppt_pts: np.ndarray   # (team, game, period) int16, MISSING where absent
+
+    @property
+    def periods_played(self):
+        """Number of periods that were played in at least one game."""
+        played = (self.team_pts > 0).any(axis=(0, 1))
+        return max(4, int(np.flatnonzero(played).max()) + 1)
+
+
+def build_quarter_tensor(team_stats, season_type='Regular'):
+    """Scatter the per-period points of every team game into a tensor.
+
+    Game g of a team is its g-th game of the season by date, so one pass of
+    fancy indexing fills the whole tensor without any Python loops.
+    """
+    if season_type is not None:
+        team_stats = team_stats[team_stats['seasTyp'] == season_type]
+    games = team_stats.sort_values(['teamAbbr', 'gmDate'])
+
+    team_idx, teams = pd.factorize(games['teamAbbr'], sort=True)
+    game_idx = games.groupby('teamAbbr').cumcount().to_numpy()
+    n_teams, n_games = len(teams), int(game_idx.max()) + 1
+
+    team_cols = [f'teamPTS{p}' for p in range(1, PERIODS + 1)]
+    oppt_cols = [f'opptPTS{p}' for p in range(1, PERIODS + 1)]
+
+    team_pts = np.full((n_teams, n_games, PERIODS), MISSING, dtype=np.int16)
+    oppt_pts = np.full((n_teams, n_games, PERIODS), MISSING, dtype=np.int16)
+    team_pts[team_idx, game_idx] = games[team_cols].to_numpy(np.int16)
+    oppt_pts[team_idx, game_idx] = games[oppt_cols].to_numpy(np.int16)
+
+    dates = np.full((n_teams, n_games), np.datetime64('NaT'),
+                    dtype='datetime64[ns]')
+    dates[team_idx, game_idx] = games['gmDate'].to_numpy()
+
+    return QuarterScoring(np.asarray(teams), dates, team_pts, oppt_pts)
+
+
+def quarter_image(quarters, team=None, stat='team'):
+    """Return the (period x game) image for one team, or the league average.
+
+    stat is 'team' for points scored, 'oppt' for points allowed or 'diff'
+    for the per-period margin. Missing cells come back as NaN.
+    """
+    team_pts = quarters.team_pts.astype(np.float32)
+    oppt_pts = quarters.oppt_pts.astype(np.float32)
+    # Overtime periods of games that ended in regulation are stored as 0-0
+    overtime = np.arange(PERIODS) >= 4
+    missing = ((quarters.team_pts == MISSING)
+               | (overtime & (team_pts == 0) & (oppt_pts == 0)))
+    if stat == 'team':
+        values = team_pts
+    elif stat == 'oppt':
+        values = oppt_pts
+    elif stat == 'diff':
+        values = team_pts - oppt_pts
+    else:
+        raise ValueError(f'Unknown stat {stat!r}')
+    values[missing] = np.nan
+
+    if team is None:
+        played = (~missing).sum(axis=0)
+        total = np.nansum(values, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            image = np.where(played > 0, total / played, np.nan)
+    else:
+        (row,) = np.flatnonzero(quarters.teams == team)
+        image = values[row]
+
+    # Bokeh images are indexed [y, x]: periods up the y axis, games along x
+    return image[:, :quarters.periods_played].T.astype(np.float32)
+
+
+def quarter_heatmap(quarters, team=None, stat='team', color_range=None,
+                    **figure_kwargs):
+    """Draw the quarter scoring heatmap with one image glyph.
+
+    The image source is the data source of fig.renderers[0], so a team
+    selector only needs to swap a single array to switch teams. The colors
+    span color_range, (low, high), by default that of the image drawn.
+    """
+    from bokeh.models import (ColorBar, ColumnDataSource, FixedTicker,
+                              LinearColorMapper)
+    from bokeh.palettes import RdBu11, Viridis256
+    from bokeh.plotting import figure
+
+    image = quarter_image(quarters, team, stat)
+    n_periods, n_games = image.shape
+
+    low, high = color_range or _color_range([image], stat)
+    mapper = LinearColorMapper(
+        palette=RdBu11[::-1] if stat == 'diff' else Viridis256,
+        low=low, high=high, nan_color='white')
+
+    quarter_source = ColumnDataSource(data={'image': [image]})
+
+    figure_kwargs.setdefault('plot_height', 250)
+    figure_kwargs.setdefault('plot_width', 800)
+    figure_kwargs.setdefault('title', _heatmap_title(team, stat))
+    fig = figure(x_range=(0.5, n_games + 0.5), y_range=(0, n_periods),
+                 x_axis_label='Game Number', y_axis_label='Period',
+                 tools='xpan,xwheel_zoom,reset,save', **figure_kwargs)
+    fig.image(image='image', source=quarter_source, color_mapper=mapper,
+              x=0.5, y=0, dw=n_games, dh=n_periods)
+
+    fig.yaxis.ticker = FixedTicker(ticks=[p + 0.5 for p in range(n_periods)])
+    fig.yaxis.major_label_overrides = {p + 0.5: PERIOD_LABELS[p]
+                                       for p in range(n_periods)}
+    fig.grid.grid_line_color = None
+    fig.add_layout(ColorBar(color_mapper=mapper), 'right')
+
+    return fig
+
+
+def quarter_heatmap_selector(quarters, stat='team', **figure_kwargs):
+    """League heatmap plus a Select that swaps in any team's image.
+
+    Every team's image is precomputed and shipped once in a side source;
+    switching teams in the browser copies one array, never re-sends data.
+    """
+    from bokeh.layouts import column
+    from bokeh.models import ColumnDataSource, CustomJS, Select
+
+    league = 'League Average'
+    options = [league] + list(quarters.teams)
+    images = [quarter_image(quarters, None, stat)]
+    images += [quarter_image(quarters, team, stat) for team in quarters.teams]
+    all_images = ColumnDataSource(data={'team': options, 'image': images})
+
+    # One color scale for every team, so switching teams doesn't saturate
+    fig = quarter_heatmap(quarters, None, stat, _color_range(images, stat),
+                          **figure_kwargs)
+    select = Select(title='Team', value=league, options=options)
+    select.js_on_change('value', CustomJS(
+        args=dict(heat=fig.renderers[0].data_source, all_images=all_images,
+                  title=fig.title),
+        code="""
+        const i = all_images.data.team.indexOf(cb_obj.value)
+        heat.data = {image: [all_images.data.image[i]]}
+        title.text = title.text.replace(/^[^,]+,/, cb_obj.value + ',')
+        """))
+    return column(select, fig)
+
+
+def _color_range(images, stat):
+    """(low, high) covering every image: from 0 for points, and centered
+    on 0 for the margin."""
+    high = max(float(np.nanmax(np.abs(image))) for image in images)
+    return (-high if stat == 'diff' else 0, high)
+
+
+def _heatmap_title(team, stat):
+    what = {'team': 'Points Scored', 'oppt': 'Points Allowed',
+            'diff': 'Scoring Margin'}[stat]
+    return f'{team or "League Average"}, {what} by Period, 2017-18'
@@ -0,0 +1,287 @@
+"""Query Layer
+
+The one way charts get rows out of the datasets. A query names a dataset
+and, optionally, the team(s), date range, season type and columns it
+wants, plus any other conditions as a where clause like chart_spec.py's:
+
+    query(data, 'team_stats', teams='PHI', season_type='Regular',
+          columns=['gmDate', 'teamPTS', 'opptPTS'])
+
+Every dataset is stored clustered by its schema's order, team then date
+for the NBA data, and split into row groups of ROW_GROUP_ROWS rows with
+the min and max of every column a predicate has touched. A query skips
+the row groups whose statistics rule them out, checks its predicates on
+the rows of the rest only, and gathers just the columns it asked for.
+Results come back in clustered order, e.g. one team's games by date, with
+a fresh index.
+
+data is anything with the datasets as attributes: Datasets, the shared
+datasets, live_data(), or a namespace of frames. If it has stores, like
+Datasets with the standings' .npz, the team and date range are looked up
+in the store, and only those rows are rebuilt. Each frame's table is
+built once, the first time it's queried, and dropped along with it.
+
+A table is rebuilt when its frame gains, loses or reorders rows or
+columns, including through inplace=True methods. Values written into the
+frame in place, e.g. frame.loc[row, column] = value, are NOT noticed: the
+datasets are never modified once loaded, and a frame that is has to be
+passed to forget() before it's queried again.
+"""
+import weakref
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+ROW_GROUP_ROWS = 256
+
+
+class Schema(NamedTuple):
+    order: tuple                       # columns the rows are clustered by
+    team: Optional[str] = None
+    date: Optional[str] = None
+    season_type: Optional[str] = None
+
+
+SCHEMAS = {
+    'standings': Schema(('teamAbbr', 'stDate'), 'teamAbbr', 'stDate'),
+    'team_stats': Schema(('teamAbbr', 'gmDate'), 'teamAbbr', 'gmDate',
+                         'seasTyp'),
+    'player_stats': Schema(('teamAbbr', 'gmDate'), 'teamAbbr', 'gmDate',
+                           'seasTyp'),
+    'gapminder': Schema(('Country', 'Year'), date='Year'),
+}
+
+
+class Table:
+    """A frame's rows in clustered order, split into row groups.
+
+    Nothing is copied up front: the table holds the permutation that puts
+    the frame in order, and builds each column's sort codes and row group
+    statistics the first time a predicate uses the column.
+    """
+
+    def __init__(self, frame, order=(), group_rows=ROW_GROUP_ROWS):
+        self._frame = weakref.ref(frame)
+        self._state = _state(frame)
+        self.rows = len(frame)
+        self.group_rows = group_rows
+        self._values, self._stats = {}, {}
+        self.order = [column for column in order if column in frame.columns]
+        if self.order:
+            keys = [self.values(column) for column in reversed(self.order)]
+            self.permutation = np.lexsort(keys)
+        else:
+            self.permutation = np.arange(self.rows)
+        self.starts = np.arange(0, self.rows, group_rows)
+
+    @property
+    def frame(self):
+        return self._frame()
+
+    def current(self, frame):
+        """Whether the table is still that of frame, as it is now."""
+        return self.frame is frame and _state(frame) == self._state
+
+    def values(self, column):
+        """A column as comparable numbers, in the frame's own row order.
+
+        Strings become codes into their sorted unique values, so ranges
+        over them still work.
+        """
+        if column not in self._values:
+            series = self.frame[column]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                self._values[column] = (series.to_numpy('datetime64[ns]'),
+                                        None)
+            elif pd.api.types.is_numeric_dtype(series) \
+                    or pd.api.types.is_bool_dtype(series):
+                self._values[column] = (series.to_numpy(), None)
+            else:
+                codes, categories = pd.factorize(series, sort=True)
+                self._values[column] = (codes.astype(np.int32),
+                                        pd.Index(np.asarray(categories)))
+        return self._values[column][0]
+
+    def statistics(self, column):
+        """Per row group (min, max) of a column, in clustered order."""
+        if column not in self._stats:
+            values = self.values(column)[self.permutation]
+            if not len(values):
+                self._stats[column] = (values, values)
+            elif values.dtype.kind == 'f':
+                self._stats[column] = (np.fmin.reduceat(values, self.starts),
+                                       np.fmax.reduceat(values, self.starts))
+            else:
+                self._stats[column] = (
+                    np.minimum.reduceat(values, self.starts),
+                    np.maximum.reduceat(values, self.starts))
+        return self._stats[column]
+
+    def _condition(self, column, condition):
+        """A where condition as ('in', sorted values) or ('range', lo, hi)."""
+        values = self.values(column)
+        categories = self._values[column][1]
+        if isinstance(condition, dict):
+            lo, hi = condition.get('min'), condition.get('max')
+            if categories is not None:
+                lo = None if lo is None else categories.searchsorted(lo)
+                hi = None if hi is None else categories.searchsorted(
+                    hi, side='right') - 1
+            else:
+                lo, hi = _like(values, lo), _like(values, hi)
+            return ('range', lo, hi)
+
+        if isinstance(condition, (list, tuple, set, np.ndarray, pd.Index)):
+            wanted = list(condition)
+        else:
+            wanted = [condition]
+        if categories is not None:
+            wanted = categories.get_indexer(wanted)
+            wanted = wanted[wanted >= 0]
+        else:
+            wanted = [_like(values, value) for value in wanted]
+        return ('in', np.unique(np.asarray(wanted)))
+
+    @staticmethod
+    def _matches(values, condition):
+        if condition[0] == 'in':
+            return np.isin(values, condition[1])
+        _, lo, hi = condition
+        mask = np.ones(len(values), dtype=bool)
+        if lo is not None:
+            mask &= values >= lo
+        if hi is not None:
+            mask &= values <= hi
+        return mask
+
+    def _groups(self, column, condition):
+        """Which row groups a condition on column can match."""
+        mins, maxs = self.statistics(column)
+        if condition[0] == 'range':
+            return self._matches(maxs, ('range', condition[1], None)) \
+                & self._matches(mins, ('range', None, condition[2]))
+        wanted = condition[1]
+        if not len(wanted):
+            return np.zeros(len(mins), dtype=bool)
+        first = np.minimum(np.searchsorted(wanted, mins), len(wanted) - 1)
+        return (wanted[first] >= mins) & (wanted[first] <= maxs)
+
+    def select(self, where=None):
+        """Positions, in clustered order, of the rows matching where."""
+        conditions = [(column, self._condition(column, condition))
+                      for column, condition in (where or {}).items()]
+        keep = np.ones(len(self.starts), dtype=bool)
+        for column, condition in conditions:
+            keep &= self._groups(column, condition)
+
+        stops = np.append(self.starts[1:], self.rows)
+        positions = np.concatenate(
+            [np.arange(start, stop) for start, stop
+             in zip(self.starts[keep], stops[keep])] or [np.empty(0, int)])
+        for column, condition in conditions:
+            rows = self.permutation[positions]
+            positions = positions[self._matches(self.values(column)[rows],
+                                                condition)]
+        return positions
+
+    def take(self, positions, columns=None):
+        """The given rows and columns as a new frame with a fresh index."""
+        frame = self.frame
+        columns = list(frame.columns) if columns is None else list(columns)
+        indexer = frame.columns.get_indexer(columns)
+        if (indexer < 0).any():
+            missing = [c for c, i in zip(columns, indexer) if i < 0]
+            raise KeyError(f'No such columns: {missing}')
+        result = frame.iloc[self.permutation[positions], indexer]
+        return result.reset_index(drop=True)
+
+
+def _like(values, bound):
+    """Coerce a bound to the column's type, e.g. dates from strings."""
+    if bound is not None and values.dtype.kind == 'M':
+        return np.datetime64(pd.Timestamp(bound), 'ns')
+    return bound
+
+
+def _state(frame):
+    """What changes when rows or columns are added, dropped or reordered.
+
+    pandas swaps in a new block manager for inplace=True sorts, drops and
+    resets; it's held weakly, so a later one can't be mistaken for it.
+    """
+    return (len(frame), tuple(frame.columns), weakref.ref(frame._mgr))
+
+
+# id(frame) -> Table, for frames still alive
+_tables = {}
+
+
+def table(frame, order=()):
+    """The Table of a frame, built the first time it's asked for, and
+    again whenever the frame's rows or columns have changed since."""
+    key = id(frame)
+    found = _tables.get(key)
+    if found is None or found.frame is not frame:
+        weakref.finalize(frame, _tables.pop, key, None)
+    elif found.current(frame):
+        return found
+    found = _tables[key] = Table(frame, order)
+    return found
+
+
+def forget(frame):
+    """Drop a frame's Table, after writing values into the frame."""
+    _tables.pop(id(frame), None)
+
+
+def predicates(dataset, teams=None, dates=None, season_type=None,
+               where=None):
+    """The where clause for a query's team, date and season type."""
+    schema = SCHEMAS.get(dataset, Schema(()))
+    clause = dict(where or {})
+    for field, condition in (('team', teams), ('season_type', season_type)):
+        if condition is not None:
+            column = getattr(schema, field)
+            if column is None:
+                raise ValueError(f'{dataset} has no {field} column')
+            clause[column] = condition
+    if dates is not None:
+        if schema.date is None:
+            raise ValueError(f'{dataset} has no date column')
+        start, end = dates
+        clause[schema.date] = {key: bound for key, bound
+                               in (('min', start), ('max', end))
+                               if bound is not None}
+    return clause
+
+
+def query(data, dataset, teams=None, dates=None, season_type=None,
+          columns=None, where=None, sort=None):
+    """Rows of a dataset matching every given predicate.
+
+    teams is one team or a list of them, dates an inclusive (start, end)
+    with either end None for open. The result holds only columns (every
+    column if None), in clustered order unless sort names other columns.
+    """
+    sort = [sort] if isinstance(sort, str) else list(sort or [])
+    store = getattr(data, 'store', None)
+    stored = store(dataset) if callable(store) else None
+    if stored is not None:
+        # Rebuild only the teams, dates and columns the query needs
+        needed = None if columns is None else list(dict.fromkeys(
+            list(columns) + sort + list(where or {})))
+        frame = stored.frame(dates, teams, needed, by_team=True)
+        teams = dates = None
+    else:
+        frame = getattr(data, dataset)
+    found = table(frame, SCHEMAS.get(dataset, Schema(())).order)
+    positions = found.select(
+        predicates(dataset, teams, dates, season_type, where))
+
+    if sort == found.order[:len(sort)]:
+        return found.take(positions, columns)
+    wanted = list(frame.columns) if columns is None else list(columns)
+    result = found.take(positions, list(dict.fromkeys(wanted + sort)))
+    return result.sort_values(sort, kind='stable',
+                              ignore_index=True)[wanted]
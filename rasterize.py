@@ -0,0 +1,129 @@
+"""Server-Side Rasterization
+
+Dense scatter plots are binned into a pixel grid with NumPy and sent to the
+browser as a single image glyph. Under bokeh serve the grid is re-binned
+whenever the plot is panned or zoomed, and once few enough points are in
+view the individual glyphs are drawn instead.
+"""
+import numpy as np
+
+# Draw individual glyphs when at most this many points are in view
+GLYPH_THRESHOLD = 5000
+
+
+class RasterScatter:
+    """A scatter that switches between a binned image and plain glyphs.
+
+    x and y are kept as float64 arrays on the server; only the binned
+    counts, or the points currently in view, are ever sent to the browser.
+    """
+
+    def __init__(self, x, y, pixel_size=2, glyph_threshold=GLYPH_THRESHOLD):
+        self._set_points(x, y)
+        self.pixel_size = pixel_size
+        self.glyph_threshold = glyph_threshold
+        self.image_source = None
+        self.points_source = None
+        self.points_renderer = None
+        self._fig = None
+
+    def _set_points(self, x, y):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        finite = np.isfinite(self.x) & np.isfinite(self.y)
+        self.x, self.y = self.x[finite], self.y[finite]
+
+    def set_data(self, x, y):
+        """Replace the points and re-render whatever is in view."""
+        self._set_points(x, y)
+        if self._fig is None:
+            return
+        x_range, y_range = self._fig.x_range, self._fig.y_range
+        window = (x_range.start, x_range.end, y_range.start, y_range.end)
+        if None in window or window[0] >= window[1] \
+                or window[2] >= window[3]:
+            window = self.bounds
+        self.update(*window)
+
+    @property
+    def bounds(self):
+        """Full data extent, padded so that neither side has zero width."""
+        x0, x1 = self.x.min(), self.x.max()
+        y0, y1 = self.y.min(), self.y.max()
+        x_pad = (x1 - x0) * 0.02 or 0.5
+        y_pad = (y1 - y0) * 0.02 or 0.5
+        return x0 - x_pad, x1 + x_pad, y0 - y_pad, y1 + y_pad
+
+    def bin(self, x0, x1, y0, y1, width, height):
+        """Count the points falling in each cell of a width x height grid.
+
+        Returns the (height, width) count image, indexed [y, x] the way the
+        image glyph expects, and the mask of points inside the window.
+        """
+        in_view = ((self.x >= x0) & (self.x <= x1)
+                   & (self.y >= y0) & (self.y <= y1))
+        xs, ys = self.x[in_view], self.y[in_view]
+
+        col = ((xs - x0) * (width / (x1 - x0))).astype(np.int64)
+        row = ((ys - y0) * (height / (y1 - y0))).astype(np.int64)
+        np.clip(col, 0, width - 1, out=col)
+        np.clip(row, 0, height - 1, out=row)
+        counts = np.bincount(row * width + col, minlength=width * height)
+        return counts.reshape(height, width), in_view
+
+    def update(self, x0, x1, y0, y1):
+        """Re-render the window [x0, x1] x [y0, y1] as points or an image."""
+        width = max(1, int(self._fig.plot_width // self.pixel_size))
+        height = max(1, int(self._fig.plot_height // self.pixel_size))
+        counts, in_view = self.bin(x0, x1, y0, y1, width, height)
+
+        if in_view.sum() <= self.glyph_threshold:
+            self.points_source.data = {'x': self.x[in_view],
+                                       'y': self.y[in_view]}
+            self.image_source.data = {'image': [], 'x': [], 'y': [],
+                                      'dw': [], 'dh': []}
+            return
+
+        # Log-scale the counts so sparse regions stay visible; empty cells
+        # become NaN and are drawn transparent
+        image = np.log1p(counts).astype(np.float32)
+        image[counts == 0] = np.nan
+        self.image_source.data = {'image': [image], 'x': [x0], 'y': [y0],
+                                  'dw': [x1 - x0], 'dh': [y1 - y0]}
+        self.points_source.data = {'x': [], 'y': []}
+
+    def attach(self, fig, glyph='circle', palette=None, **glyph_kwargs):
+        """Add the image and point renderers to fig and draw the full extent.
+
+        Under bokeh serve, RangesUpdate events re-bin the view on every pan
+        or zoom; in static output the initial binning is what gets shipped.
+        """
+        from bokeh.events import RangesUpdate
+        from bokeh.io import curdoc
+        from bokeh.models import ColumnDataSource, LinearColorMapper
+        from bokeh.palettes import Blues256
+
+        self._fig = fig
+        self.image_source = ColumnDataSource(
+            data={'image': [], 'x': [], 'y': [], 'dw': [], 'dh': []})
+        self.points_source = ColumnDataSource(data={'x': [], 'y': []})
+
+        mapper = LinearColorMapper(palette=palette or Blues256[::-1][64:],
+                                   nan_color=(0, 0, 0, 0))
+        fig.image(image='image', x='x', y='y', dw='dw', dh='dh',
+                  source=self.image_source, color_mapper=mapper)
+        self.points_renderer = getattr(fig, glyph)(
+            x='x', y='y', source=self.points_source, **glyph_kwargs)
+
+        x0, x1, y0, y1 = self.bounds
+        self.update(x0, x1, y0, y1)
+        if curdoc().session_context is not None:
+            fig.on_event(RangesUpdate, self._on_ranges_update)
+        return fig
+
+    def _on_ranges_update(self, event):
+        if None in (event.x0, event.x1, event.y0, event.y1):
+            return
+        if event.x0 >= event.x1 or event.y0 >= event.y1:
+            return
+        self.update(event.x0, event.x1, event.y0, event.y1)
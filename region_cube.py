@@ -0,0 +1,252 @@
+"""Regional Trends
+
+Population-weighted regional averages of the Gapminder indicators,
+precomputed so that no interaction has to run a groupby. The cube holds,
+for every region and year, the sum of population x value and the sum of
+population over the countries reporting that value, accumulated over the
+years. Summing the regions of every possible region set ahead of time
+(there are only six regions, so 64 sets) makes the weighted mean of any
+set of regions over any range of years two subtractions and a division.
+
+The same prefix sums are shipped to the browser, where they drive a
+trends chart linked to the country bubble chart: selecting countries
+plots the trend of their regions, and the year slider moves the bubbles.
+"""
+import numpy as np
+import pandas as pd
+
+STATS = ('fertility', 'life', 'gdp', 'child_mortality')
+STAT_LABELS = {'fertility': 'Fertility (children per woman)',
+               'life': 'Life Expectancy (years)',
+               'gdp': 'GDP per Capita',
+               'child_mortality': 'Child Mortality (per 1,000)'}
+
+# Above this many regions, sets are summed per query instead of up front
+MAX_SUBSET_REGIONS = 10
+
+
+class RegionCube:
+    """Prefix sums of population-weighted values per region set and year.
+
+    sums and weights have shape (stat, region set, year + 1); region set
+    is a bitmask over regions, and entry [..., i] covers the years before
+    years[i].
+    """
+
+    def __init__(self, regions, years, stats, sums, weights):
+        self.regions = list(regions)
+        self.years = np.asarray(years)
+        self.stats = list(stats)
+        self.sums = sums
+        self.weights = weights
+
+    @classmethod
+    def from_frame(cls, gapminder, stats=STATS, weight='population'):
+        regions = sorted(gapminder['region'].unique())
+        years = np.arange(gapminder['Year'].min(),
+                          gapminder['Year'].max() + 1)
+        region_codes = pd.Categorical(gapminder['region'],
+                                      categories=regions).codes.astype(
+                                          np.int64)
+        year_codes = gapminder['Year'].to_numpy() - years[0]
+        cell = region_codes * len(years) + year_codes
+        population = gapminder[weight].to_numpy(dtype=np.float64)
+
+        shape = (len(stats), len(regions), len(years))
+        sums, weights = np.zeros(shape), np.zeros(shape)
+        for i, stat in enumerate(stats):
+            values = gapminder[stat].to_numpy(dtype=np.float64)
+            valid = np.isfinite(values) & np.isfinite(population)
+            sums[i] = np.bincount(cell[valid],
+                                  population[valid] * values[valid],
+                                  minlength=shape[1] * shape[2]
+                                  ).reshape(shape[1:])
+            weights[i] = np.bincount(cell[valid], population[valid],
+                                     minlength=shape[1] * shape[2]
+                                     ).reshape(shape[1:])
+
+        cube = cls(regions, years, stats, None, None)
+        cube.sums = _prefix(cube._by_set(sums))
+        cube.weights = _prefix(cube._by_set(weights))
+        return cube
+
+    def _by_set(self, per_region):
+        """(stat, region, year) totals summed into (stat, set, year)."""
+        if len(self.regions) > MAX_SUBSET_REGIONS:
+            return per_region
+        sets = np.arange(2 ** len(self.regions))
+        members = (sets[:, None] >> np.arange(len(self.regions))) & 1
+        return np.einsum('sr,kry->ksy', members.astype(np.float64),
+                         per_region)
+
+    @property
+    def precomputed_sets(self):
+        return len(self.regions) <= MAX_SUBSET_REGIONS
+
+    def mask(self, regions=None):
+        """Bitmask of a set of region names; None means every region."""
+        if regions is None:
+            return 2 ** len(self.regions) - 1
+        return sum(1 << self.regions.index(region) for region in regions)
+
+    def _totals(self, stat, regions, start, stop):
+        i = self.stats.index(stat)
+        if self.precomputed_sets:
+            rows = [self.mask(regions)]
+        else:
+            rows = [self.regions.index(region) for region in
+                    (self.regions if regions is None else regions)]
+        sums = self.sums[i, rows]
+        weights = self.weights[i, rows]
+        return ((sums[:, stop] - sums[:, start]).sum(axis=0),
+                (weights[:, stop] - weights[:, start]).sum(axis=0))
+
+    def _span(self, start, end):
+        """Prefix indices for the years start..end, inclusive.
+
+        Years outside the cube are clamped away, so a range entirely
+        before or after it is empty.
+        """
+        first, years = self.years[0], len(self.years)
+        lo = 0 if start is None else int(np.clip(start - first, 0, years))
+        hi = years if end is None else int(np.clip(end - first + 1, 0,
+                                                   years))
+        return lo, hi
+
+    def mean(self, stat, regions=None, start=None, end=None):
+        """Population-weighted mean of stat over regions and years.
+
+        NaN when no country in the set reports stat in those years.
+        """
+        lo, hi = self._span(start, end)
+        total, weight = self._totals(stat, regions, lo, max(hi, lo))
+        return total / weight if weight else np.nan
+
+    def yearly(self, stat, regions=None):
+        """The weighted mean of stat for each year, as a float array."""
+        years = np.arange(len(self.years))
+        total, weight = self._totals(stat, regions, years, years + 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(weight > 0, total / weight, np.nan)
+
+
+def _prefix(values):
+    """Cumulative sums over the last axis, with a leading zero."""
+    out = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+    np.cumsum(values, axis=-1, out=out[..., 1:])
+    return out
+
+
+# Recomputes the selection's trend from the prefix sums: OR together the
+# regions of the selected countries, then one subtraction per year
+SELECTION_TREND = """
+const indices = bubbles.selected.indices
+let set = 0
+for (const i of indices)
+    set |= 1 << bubbles.data.region_code[i]
+const width = years.length + 1
+const values = years.map((year, i) => {
+    const w = weights[set * width + i + 1] - weights[set * width + i]
+    return w > 0 ? (sums[set * width + i + 1] - sums[set * width + i]) / w
+                 : NaN
+})
+selection.data = {Year: years, value: set ? values : years.map(() => NaN)}
+const total = sums[set * width + years.length] - sums[set * width]
+const weight = weights[set * width + years.length] - weights[set * width]
+label.text = set ? `Selected regions, ${years[0]}-${years[years.length - 1]}`
+    + ` average: ${(total / weight).toFixed(2)}` : ''
+"""
+
+# Shows one year of countries in the bubble chart
+SHOW_YEAR = """
+const year = slider.value
+const data = all.data
+const rows = {}
+for (const key of Object.keys(data))
+    rows[key] = []
+for (let i = 0; i < data.Year.length; i++)
+    if (data.Year[i] == year)
+        for (const key of Object.keys(data))
+            rows[key].push(data[key][i])
+bubbles.selected.indices = []
+bubbles.data = rows
+marker.location = year
+"""
+
+
+def regional_trends(gapminder, cube=None, stat='life', year=None):
+    """A bubble chart of countries linked to regional trend lines.
+
+    The trends chart draws the weighted mean of stat per region; selecting
+    bubbles adds the trend of the selected countries' regions combined.
+    """
+    from bokeh.layouts import column, row
+    from bokeh.models import (CategoricalColorMapper, ColumnDataSource,
+                              CustomJS, HoverTool, Label, Slider, Span)
+    from bokeh.palettes import Category10
+    from bokeh.plotting import figure
+
+    cube = cube or RegionCube.from_frame(gapminder)
+    if not cube.precomputed_sets:
+        raise ValueError('too many regions for the browser-side cube')
+    year = int(cube.years[-1] if year is None else year)
+    colors = Category10[10][:len(cube.regions)]
+
+    columns = ['Country', 'Year', 'region', 'fertility', 'life', 'population']
+    data = gapminder.loc[:, columns].dropna(
+        subset=['fertility', 'life', 'population'])
+    data['region_code'] = pd.Categorical(
+        data['region'], categories=cube.regions).codes
+    data['size'] = np.sqrt(data['population'] / data['population'].max()) * 40
+    all_rows = ColumnDataSource(data)
+    bubbles = ColumnDataSource(data[data['Year'] == year])
+
+    mapper = CategoricalColorMapper(factors=cube.regions, palette=colors)
+    bubble_fig = figure(plot_height=400, plot_width=500,
+                        x_axis_label=STAT_LABELS['fertility'],
+                        y_axis_label=STAT_LABELS['life'],
+                        title='Countries (select some to see their regions)',
+                        tools='tap,box_select,lasso_select,reset')
+    bubble_fig.circle('fertility', 'life', size='size', source=bubbles,
+                      color=dict(field='region', transform=mapper),
+                      alpha=0.6, line_color='white',
+                      nonselection_alpha=0.15)
+    bubble_fig.add_tools(HoverTool(tooltips=[('Country', '@Country'),
+                                             ('Region', '@region')]))
+
+    trend_fig = figure(plot_height=400, plot_width=500,
+                       x_axis_label='Year', y_axis_label=STAT_LABELS[stat],
+                       title='Population-Weighted Regional Trends',
+                       toolbar_location=None)
+    for region, color in zip(cube.regions, colors):
+        trend_fig.line(cube.years, cube.yearly(stat, [region]),
+                       color=color, line_width=2, alpha=0.7,
+                       legend_label=region)
+    selection = ColumnDataSource(data={'Year': cube.years.tolist(),
+                                       'value': [np.nan] * len(cube.years)})
+    trend_fig.line('Year', 'value', source=selection, color='black',
+                   line_width=4, legend_label='Selected regions')
+    trend_fig.legend.location = 'top_left'
+    trend_fig.legend.label_text_font_size = '8pt'
+    marker = Span(location=year, dimension='height', line_dash='dashed',
+                  line_color='gray')
+    label = Label(x=10, y=10, x_units='screen', y_units='screen', text='',
+                  text_font_size='9pt')
+    trend_fig.add_layout(marker)
+    trend_fig.add_layout(label)
+
+    i = cube.stats.index(stat)
+    bubbles.selected.js_on_change('indices', CustomJS(
+        args={'bubbles': bubbles, 'selection': selection, 'label': label,
+              'years': cube.years.tolist(),
+              'sums': cube.sums[i].ravel().tolist(),
+              'weights': cube.weights[i].ravel().tolist()},
+        code=SELECTION_TREND))
+
+    slider = Slider(start=int(cube.years[0]), end=int(cube.years[-1]),
+                    value=year, step=1, title='Year')
+    slider.js_on_change('value', CustomJS(
+        args={'slider': slider, 'all': all_rows, 'bubbles': bubbles,
+              'marker': marker},
+        code=SHOW_YEAR))
+    return column(slider, row(bubble_fig, trend_fig))
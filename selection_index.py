@@ -0,0 +1,215 @@
+"""Server-Side Selections
+
+Box, lasso and polygon selections resolved on the server, with a summary
+of what was selected. BokehJS reports every selection's geometry in data
+coordinates, whatever it hit, so this also works on a rasterized scatter
+whose points never reach the browser.
+
+A GridIndex buckets a scatter's points into a uniform grid, sorted by
+cell, so the points of a block of cells are a few contiguous slices. A
+rectangle only tests the points of the cells it overlaps, and a polygon
+those of the cells in its bounding box, all at once, with an even-odd ray
+crossing test. Either takes milliseconds with every player-game plotted.
+
+SelectionSummary follows a figure's selections and shows the aggregates
+of the selected records in a Div, as the selection is drawn.
+"""
+import numpy as np
+
+# Average points per grid cell
+CELL_POINTS = 16
+
+
+def points_in_polygon(x, y, xs, ys):
+    """Mask of the points (x, y) inside the polygon xs, ys (even-odd)."""
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    inside = np.zeros(len(x), dtype=bool)
+    for x0, y0, x1, y1 in zip(xs, ys, np.roll(xs, -1), np.roll(ys, -1)):
+        if y0 == y1:
+            continue
+        spans = (y0 > y) != (y1 > y)
+        crossing = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= spans & (x < crossing)
+    return inside
+
+
+class GridIndex:
+    """A uniform grid over a scatter's points, for region queries."""
+
+    def __init__(self, x, y, cell_points=CELL_POINTS):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.rows = len(x)
+        finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        cells = max(1, int(np.sqrt(len(finite) / cell_points)))
+        self.shape = (cells, cells)
+        if len(finite):
+            self.x0, self.x1 = x[finite].min(), x[finite].max()
+            self.y0, self.y1 = y[finite].min(), y[finite].max()
+        else:
+            self.x0 = self.x1 = self.y0 = self.y1 = 0.0
+        self.dx = (self.x1 - self.x0) / cells or 1.0
+        self.dy = (self.y1 - self.y0) / cells or 1.0
+
+        col, row = self._cell(x[finite], y[finite])
+        cell = row * cells + col
+        order = np.argsort(cell, kind='stable')
+        self.index = finite[order]          # row of the data, by cell
+        self.x, self.y = x[self.index], y[self.index]
+        self.offsets = np.zeros(cells * cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell, minlength=cells * cells),
+                  out=self.offsets[1:])
+
+    def _cell(self, x, y):
+        cols, rows = self.shape[1], self.shape[0]
+        col = np.clip(((x - self.x0) / self.dx).astype(np.int64), 0,
+                      cols - 1)
+        row = np.clip(((y - self.y0) / self.dy).astype(np.int64), 0,
+                      rows - 1)
+        return col, row
+
+    def _span(self, lo, hi, origin, step, cells):
+        """First and last cell along an axis overlapping [lo, hi]."""
+        first = int(np.clip(np.floor((lo - origin) / step), 0, cells - 1))
+        last = int(np.clip(np.floor((hi - origin) / step), 0, cells - 1))
+        return first, last
+
+    def _positions(self, cols, rows):
+        """Positions of the points in a block of cells, row by row."""
+        first, last = cols
+        width = self.shape[1]
+        return np.concatenate(
+            [np.arange(self.offsets[row * width + first],
+                       self.offsets[row * width + last + 1])
+             for row in range(rows[0], rows[1] + 1)] or [np.empty(0, int)])
+
+    def _overlaps(self, x0, x1, y0, y1):
+        return not (x1 < self.x0 or x0 > self.x1 or y1 < self.y0
+                    or y0 > self.y1 or not len(self.index))
+
+    def in_rect(self, x0, x1, y0, y1):
+        """Rows of the points inside a rectangle, in data row order."""
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        if not self._overlaps(x0, x1, y0, y1):
+            return np.empty(0, dtype=np.int64)
+        cols = self._span(x0, x1, self.x0, self.dx, self.shape[1])
+        rows = self._span(y0, y1, self.y0, self.dy, self.shape[0])
+
+        positions = self._positions(cols, rows)
+        x, y = self.x[positions], self.y[positions]
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        return np.sort(self.index[positions[inside]])
+
+    def in_polygon(self, xs, ys):
+        """Rows of the points inside a polygon, in data row order."""
+        if len(xs) < 3:
+            return np.empty(0, dtype=np.int64)
+        x0, x1, y0, y1 = min(xs), max(xs), min(ys), max(ys)
+        if not self._overlaps(x0, x1, y0, y1):
+            return np.empty(0, dtype=np.int64)
+        cols = self._span(x0, x1, self.x0, self.dx, self.shape[1])
+        rows = self._span(y0, y1, self.y0, self.dy, self.shape[0])
+
+        positions = self._positions(cols, rows)
+        inside = points_in_polygon(self.x[positions], self.y[positions],
+                                   xs, ys)
+        return np.sort(self.index[positions[inside]])
+
+    def select(self, geometry):
+        """Rows inside a SelectionGeometry event's geometry.
+
+        Rectangles and polygons are resolved; anything else, such as a
+        tap, selects nothing.
+        """
+        kind = geometry.get('type')
+        if kind == 'rect':
+            return self.in_rect(geometry['x0'], geometry['x1'],
+                                geometry['y0'], geometry['y1'])
+        if kind == 'poly':
+            return self.in_polygon(list(geometry['x']),
+                                   list(geometry['y']))
+        return np.empty(0, dtype=np.int64)
+
+
+def outline(geometry):
+    """The xs, ys of a selection geometry's outline, closed."""
+    if geometry.get('type') == 'rect':
+        x0, x1, y0, y1 = (geometry[key] for key in ('x0', 'x1', 'y0', 'y1'))
+        return [x0, x1, x1, x0], [y0, y0, y1, y1]
+    if geometry.get('type') == 'poly':
+        return list(geometry['x']), list(geometry['y'])
+    return [], []
+
+
+class SelectionSummary:
+    """Aggregates of the records inside a figure's selections.
+
+    summarize takes the selected rows of records, and returns the HTML to
+    show; it's called on every selection event, including those sent
+    while a lasso is still being drawn. records can be a function
+    returning the current (version, frame), e.g. from a session cache, so
+    that only the selected row positions are kept between events. version
+    is that of the data x and y come from, and while the two differ,
+    until set_data catches up, selections are cleared rather than summed
+    up.
+    """
+
+    def __init__(self, x, y, records, summarize, empty='', version=None):
+        self.summarize = summarize
+        self.empty = empty
+        self.div = self.outline_source = None
+        self.selected = np.empty(0, dtype=np.int64)
+        self.set_data(x, y, records, version)
+
+    def set_data(self, x, y, records, version=None):
+        """Replace the points; any selection is cleared."""
+        self.records, self.version = records, version
+        self.index = GridIndex(x, y)
+        if self.div is not None:
+            self.clear()
+
+    def select(self, geometry):
+        """Select the rows inside geometry; returns them."""
+        records = self.records
+        if callable(records):
+            version, records = records()
+            if version != self.version:
+                self.selected = np.empty(0, dtype=np.int64)
+                if self.div is not None:
+                    self.clear()
+                return self.selected
+        self.selected = self.index.select(geometry)
+        if self.div is not None:
+            self.div.text = self.summarize(records.iloc[self.selected])
+            xs, ys = outline(geometry)
+            self.outline_source.data = {'xs': [xs], 'ys': [ys]}
+        return self.selected
+
+    def clear(self):
+        self.selected = np.empty(0, dtype=np.int64)
+        self.div.text = self.empty
+        self.outline_source.data = {'xs': [], 'ys': []}
+
+    def attach(self, fig, width=None):
+        """Draw the selection outline on fig; returns the summary Div.
+
+        Under bokeh serve every selection on fig updates the Div, and a
+        reset clears it. In static output the Div stays as it is.
+        """
+        from bokeh.events import Reset, SelectionGeometry
+        from bokeh.io import curdoc
+        from bokeh.models import ColumnDataSource, Div
+
+        self.div = Div(text=self.empty, width=width or fig.plot_width)
+        self.outline_source = ColumnDataSource(data={'xs': [], 'ys': []})
+        fig.patches('xs', 'ys', source=self.outline_source, fill_alpha=0.1,
+                    fill_color='gray', line_color='black', line_dash='dashed')
+
+        if curdoc().session_context is not None:
+            fig.on_event(SelectionGeometry,
+                         lambda event: self.select(event.geometry))
+            fig.on_event(Reset, lambda event: self.clear())
+        return self.div
@@ -0,0 +1,102 @@
+"""Multi-Process Dashboard Server
+
+Serves visdat1.py like bokeh serve does, but with one worker process per
+core sharing a single copy of the datasets. The csv files are read and
+published into shared memory once, before the workers are forked, so
+adding workers doesn't multiply the memory the data takes up.
+
+    python serve.py --port 5006 --num-procs 0
+
+--num-procs 0 starts one worker per core. The remaining options match the
+bokeh serve options the Procfile uses. /status reports the sessions of
+the worker answering it, and the memory they hold (see session_budget.py).
+With --profile, /metrics reports how long its callbacks take (see
+callback_profiler.py).
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+
+from callback_profiler import PROFILE_ENV, THRESHOLD_ENV, metrics_handler
+from datasets import FILES, Datasets
+from session_budget import status_handler
+from shared_data import PREFIX_ENV, publish
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'visdat1.py')
+
+
+def load_frames(data_dir=None):
+    """Read every dataset whose csv file is present."""
+    data = Datasets(*([data_dir] if data_dir else []))
+    return {name: data[name] for name, (filename, _) in FILES.items()
+            if os.path.exists(os.path.join(data.data_dir, filename))}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=5006)
+    parser.add_argument('--address', default=None)
+    parser.add_argument('--num-procs', type=int, default=1,
+                        help='worker processes, 0 for one per core')
+    parser.add_argument('--allow-websocket-origin', action='append',
+                        default=None)
+    parser.add_argument('--use-xheaders', action='store_true')
+    parser.add_argument('--show', action='store_true')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every callback, see /metrics')
+    parser.add_argument('--profile-threshold-ms', type=float,
+                        help='keep cProfile stats of slower callbacks')
+    return parser.parse_args(argv)
+
+
+def server_kwargs(args):
+    kwargs = {'port': args.port, 'num_procs': args.num_procs,
+              'use_xheaders': args.use_xheaders,
+              'extra_patterns': [('/status', status_handler()),
+                                 ('/metrics', metrics_handler())]}
+    if args.address:
+        kwargs['address'] = args.address
+    if args.allow_websocket_origin:
+        kwargs['allow_websocket_origin'] = args.allow_websocket_origin
+    return kwargs
+
+
+def main(argv=None):
+    from bokeh.command.util import build_single_handler_application
+    from bokeh.server.server import Server
+
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(process)d %(message)s')
+
+    if args.profile:
+        os.environ[PROFILE_ENV] = '1'
+    if args.profile_threshold_ms is not None:
+        os.environ[THRESHOLD_ENV] = str(args.profile_threshold_ms)
+
+    prefix = f'visdat{os.getpid()}'
+    blocks = publish(load_frames(), prefix)
+    os.environ[PREFIX_ENV] = prefix
+    publisher = os.getpid()
+
+    # Dynos are stopped with SIGTERM; exit through the finally block below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server = Server({'/visdat1': build_single_handler_application(APP)},
+                        **server_kwargs(args))
+        server.start()
+        if args.show:
+            server.io_loop.add_callback(server.show, '/visdat1')
+        server.io_loop.start()
+    finally:
+        # Workers exit through here too; only the publisher cleans up
+        if os.getpid() == publisher:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+
+if __name__ == '__main__':
+    main()
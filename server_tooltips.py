@@ -0,0 +1,278 @@
+"""Server-Side Tooltips
+
+A HoverTool can only show fields that are in the page: every tooltip
+column, player names included, has to be shipped in the ColumnDataSource
+for every point, and hovering over a rasterized scatter shows nothing at
+all. A ServerTooltip keeps the records on the server instead. Under bokeh
+serve the browser reports where the mouse is, a KD-tree over the plotted
+points finds the nearest one within HOVER_PIXELS, and only that record's
+fields are sent back, drawn as labels next to the point. The page itself
+only needs the x and y arrays, or an image.
+
+Tooltips are written the way HoverTool's are, e.g.
+('Three-Point Percentage', '@pct3PM{00.0%}').
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+HOVER_PIXELS = 10
+LEAF_SIZE = 16
+LINE_PIXELS = 16
+
+FIELD = re.compile(r'@(\w+|\{[^}]+\})(\{[^}]*\})?')
+
+
+class KDTree:
+    """A static two-dimensional tree over points, stored as arrays.
+
+    The points are reordered so that every node covers a contiguous slice
+    of them. Nodes split at the median of their wider dimension until at
+    most leaf_size points are left, which are compared all at once.
+    """
+
+    def __init__(self, x, y, leaf_size=LEAF_SIZE):
+        self.points = np.column_stack([np.asarray(x, dtype=np.float64),
+                                       np.asarray(y, dtype=np.float64)])
+        self.index = np.arange(len(self.points))
+        self.leaf_size = leaf_size
+        # Per node: slice of points, split dimension (-1 for a leaf),
+        # split value and children
+        self.start, self.stop, self.dim, self.split = [], [], [], []
+        self.left, self.right = [], []
+        if len(self.points):
+            self._build(0, len(self.points))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self, start, stop):
+        node = len(self.start)
+        for values, value in ((self.start, start), (self.stop, stop),
+                              (self.dim, -1), (self.split, 0.0),
+                              (self.left, -1), (self.right, -1)):
+            values.append(value)
+        if stop - start <= self.leaf_size:
+            return node
+
+        points = self.points[start:stop]
+        dim = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        middle = (stop - start) // 2
+        order = np.argpartition(points[:, dim], middle)
+        self.points[start:stop] = points[order]
+        self.index[start:stop] = self.index[start:stop][order]
+
+        self.dim[node] = dim
+        self.split[node] = self.points[start + middle, dim]
+        self.left[node] = self._build(start, start + middle)
+        self.right[node] = self._build(start + middle, stop)
+        return node
+
+    def nearest(self, x, y, scale=(1.0, 1.0), max_distance=np.inf):
+        """Index of the point nearest to (x, y), or None.
+
+        Distances are measured after multiplying each coordinate by scale,
+        e.g. pixels per data unit, and nothing further than max_distance
+        counts. Returns (index, distance).
+        """
+        if not len(self.points):
+            return None, np.inf
+        query = np.array([x, y], dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+        best, best_d2 = None, max_distance ** 2
+
+        pending = [(0, 0.0)]           # node, lower bound on its distance
+        while pending:
+            node, bound = pending.pop()
+            if bound >= best_d2:
+                continue
+            dim = self.dim[node]
+            if dim < 0:
+                start, stop = self.start[node], self.stop[node]
+                d2 = (((self.points[start:stop] - query) * scale) ** 2
+                      ).sum(axis=1)
+                i = int(np.argmin(d2))
+                if d2[i] < best_d2:
+                    best, best_d2 = start + i, d2[i]
+                continue
+            offset = (query[dim] - self.split[node]) * scale[dim]
+            near, far = ((self.left[node], self.right[node]) if offset < 0
+                         else (self.right[node], self.left[node]))
+            pending.append((far, offset ** 2))
+            pending.append((near, bound))
+
+        if best is None:
+            return None, np.inf
+        return int(self.index[best]), float(np.sqrt(best_d2))
+
+
+def format_value(value, fmt=None):
+    """Format a value like a HoverTool field, e.g. '{00.0%}' or '{0,0}'.
+
+    Only the common numeral formats are understood: zero padding, decimal
+    places, thousands separators and percentages. Formats starting with
+    '%' are strftime formats for dates.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return '???'
+    if fmt is None:
+        if isinstance(value, (float, np.floating)):
+            return f'{value:.3f}'
+        if isinstance(value, (pd.Timestamp, np.datetime64)):
+            return str(pd.Timestamp(value).date())
+        return str(value)
+    if fmt.startswith('%'):
+        return pd.Timestamp(value).strftime(fmt)
+
+    percent = fmt.endswith('%')
+    number = float(value) * (100 if percent else 1)
+    whole, _, decimals = fmt.rstrip('%').partition('.')
+    text = f'{number:{"," if "," in whole else ""}.{len(decimals)}f}'
+    digits = whole.replace(',', '').count('0')
+    integer, dot, fraction = text.partition('.')
+    text = integer.zfill(digits + integer.startswith('-')) + dot + fraction
+    return text + ('%' if percent else '')
+
+
+def format_tooltip(template, record):
+    """Fill a tooltip template's @fields from a record."""
+    def field(match):
+        name, fmt = match.group(1), match.group(2)
+        return format_value(record[name.strip('{}')],
+                            fmt[1:-1] if fmt else None)
+
+    return FIELD.sub(field, template)
+
+
+class ServerTooltip:
+    """Tooltips for a scatter, looked up on the server as the mouse moves.
+
+    x and y are what's plotted, and records holds the fields the tooltips
+    show, one row per point. records can be a function returning the
+    current (version, frame), e.g. from a session cache, in which case
+    only row positions are kept and the frame is fetched for each tooltip
+    shown. version is that of the data x and y come from, and while the
+    two differ, until set_data catches up, no tooltip is shown.
+    """
+
+    def __init__(self, x, y, records, tooltips, max_pixels=HOVER_PIXELS,
+                 version=None):
+        self.tooltips = list(tooltips)
+        self.max_pixels = max_pixels
+        self.source = self.marker = None
+        self._fig = None
+        self._window = None
+        self._shown = None
+        self.set_data(x, y, records, version)
+
+    def set_data(self, x, y, records, version=None):
+        """Replace the points; the shown tooltip is hidden."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.rows = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        self.x, self.y = x[self.rows], y[self.rows]
+        self.records, self.version = records, version
+        self.tree = KDTree(self.x, self.y)
+        if self.source is not None:
+            self.hide()
+
+    @property
+    def bounds(self):
+        return self.x.min(), self.x.max(), self.y.min(), self.y.max()
+
+    def window(self):
+        """The data window in view: the last one reported, else the ranges."""
+        if self._window is not None:
+            return self._window
+        x_range, y_range = self._fig.x_range, self._fig.y_range
+        window = (x_range.start, x_range.end, y_range.start, y_range.end)
+        if None in window or window[0] >= window[1] \
+                or window[2] >= window[3]:
+            return self.bounds
+        return window
+
+    def lookup(self, x, y):
+        """Row of records nearest to (x, y) on screen, or None."""
+        if not len(self.tree):
+            return None
+        x0, x1, y0, y1 = self.window()
+        scale = (self._fig.plot_width / ((x1 - x0) or 1),
+                 self._fig.plot_height / ((y1 - y0) or 1))
+        row, _ = self.tree.nearest(x, y, scale, self.max_pixels)
+        return row
+
+    def describe(self, row):
+        """The tooltip lines of a record, None if the records have moved
+        on from the points."""
+        records = self.records
+        if callable(records):
+            version, records = records()
+            if version != self.version:
+                return None
+        record = records.iloc[self.rows[row]]
+        return [f'{label}: {format_tooltip(template, record)}'
+                for label, template in self.tooltips]
+
+    def show(self, row):
+        if row == self._shown:
+            return
+        lines = self.describe(row)
+        if lines is None:
+            self.hide()
+            return
+        self._shown = row
+        x, y = self.x[row], self.y[row]
+        self.source.data = {'x': [x] * len(lines), 'y': [y] * len(lines),
+                            'text': lines,
+                            'y_offset': [-LINE_PIXELS * (i + 1)
+                                         for i in range(len(lines))]}
+        self.marker.data = {'x': [x], 'y': [y]}
+
+    def hide(self):
+        self._shown = None
+        self.source.data = {'x': [], 'y': [], 'text': [], 'y_offset': []}
+        self.marker.data = {'x': [], 'y': []}
+
+    def attach(self, fig, **label_kwargs):
+        """Add the tooltip labels to fig, and follow the mouse under serve.
+
+        In static output nothing is sent, so nothing is shown.
+        """
+        from bokeh.events import MouseLeave, MouseMove, RangesUpdate
+        from bokeh.io import curdoc
+        from bokeh.models import ColumnDataSource, LabelSet
+
+        self._fig = fig
+        self.source = ColumnDataSource(
+            data={'x': [], 'y': [], 'text': [], 'y_offset': []})
+        self.marker = ColumnDataSource(data={'x': [], 'y': []})
+        fig.circle(x='x', y='y', source=self.marker, size=12,
+                   fill_alpha=0, line_color='black', line_width=2)
+        fig.add_layout(LabelSet(
+            x='x', y='y', text='text', y_offset='y_offset', x_offset=10,
+            source=self.source, text_font_size='9pt',
+            background_fill_color='white', background_fill_alpha=0.85,
+            **label_kwargs))
+
+        if curdoc().session_context is not None:
+            fig.on_event(MouseMove, self._on_mouse_move)
+            fig.on_event(MouseLeave, lambda event: self.hide())
+            fig.on_event(RangesUpdate, self._on_ranges_update)
+        return fig
+
+    def _on_mouse_move(self, event):
+        if event.x is None or event.y is None:
+            return
+        row = self.lookup(event.x, event.y)
+        if row is None:
+            if self._shown is not None:
+                self.hide()
+        else:
+            self.show(row)
+
+    def _on_ranges_update(self, event):
+        window = (event.x0, event.x1, event.y0, event.y1)
+        if None not in window and window[0] < window[1] \
+                and window[2] < window[3]:
+            self._window = window
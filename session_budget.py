@@ -0,0 +1,224 @@
+"""Session Memory Budget
+
+Keeps the memory held by the server app's sessions in check. Each session
+is registered with the process's SessionBudget, which accounts for the
+data in the session's ColumnDataSources and for the frames the session
+derives from the datasets. Derived frames go through the session's
+SessionCache, so they can be recomputed when they're needed again:
+
+    three_games = session_cache().get(
+        'three_games', lambda: query(data, 'player_stats',
+                                     where={'play3PA': {'min': 1}}))
+
+Every CHECK_SECONDS, sessions nobody has interacted with for IDLE_SECONDS
+lose their cached frames, and while the process is still over its budget,
+cached frames are dropped from the least recently active sessions first.
+
+serve.py exposes the accounting as JSON at /status; with several worker
+processes, each request reports on the worker that answered it.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+BUDGET_ENV = 'VISDAT_MEMORY_BUDGET_MB'
+DEFAULT_BUDGET_MB = 256
+IDLE_SECONDS = 300
+CHECK_SECONDS = 30
+
+
+def nbytes(value):
+    """Approximate memory held by a frame, array or list of values."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(nbytes(item)
+                                          for item in value.values())
+    return sys.getsizeof(value)
+
+
+def source_nbytes(source):
+    return sum(nbytes(column) for column in source.data.values())
+
+
+class SessionCache:
+    """One session's derived frames, least recently used first."""
+
+    def __init__(self):
+        self._entries = OrderedDict()   # key -> (value, bytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """The cached value for key, computing and caching it if needed."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+        value = compute()
+        self._entries[key] = (value, nbytes(value))
+        return value
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def evict(self, target=None):
+        """Drop entries, oldest first, until target bytes are freed.
+
+        With target=None everything is dropped. Returns the bytes freed.
+        """
+        freed = 0
+        while self._entries and (target is None or freed < target):
+            _, (_, size) = self._entries.popitem(last=False)
+            freed += size
+        return freed
+
+
+class SessionRecord:
+    """What the budget knows about one open session."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.id = doc.session_context.id
+        self.created = self.last_active = time.time()
+        self.cache = SessionCache()
+
+    def touch(self):
+        self.last_active = time.time()
+
+    @property
+    def sources_nbytes(self):
+        from bokeh.models import ColumnDataSource
+
+        return sum(source_nbytes(source)
+                   for source in self.doc.select({'type': ColumnDataSource}))
+
+    @property
+    def nbytes(self):
+        return self.sources_nbytes + self.cache.nbytes
+
+    def status(self, now):
+        return {'id': self.id,
+                'age_seconds': round(now - self.created, 1),
+                'idle_seconds': round(now - self.last_active, 1),
+                'sources_bytes': self.sources_nbytes,
+                'cache_bytes': self.cache.nbytes,
+                'cached_frames': len(self.cache)}
+
+
+class SessionBudget:
+    """The sessions of this process and the memory they may hold."""
+
+    def __init__(self, budget_bytes, idle_seconds=IDLE_SECONDS,
+                 interval=CHECK_SECONDS):
+        self.budget_bytes = budget_bytes
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.sessions = {}   # document -> SessionRecord
+        self._task = None
+
+    def register(self, doc):
+        """Start accounting for doc's session; returns its record.
+
+        Only changes made by the browser count as activity, not the
+        server's own updates such as streamed game scores.
+        """
+        if doc in self.sessions:
+            return self.sessions[doc]
+        record = self.sessions[doc] = SessionRecord(doc)
+
+        def touch(event):
+            if getattr(event, 'setter', None) is not None:
+                record.touch()
+
+        doc.on_change(touch)
+        doc.on_session_destroyed(
+            lambda context: self.sessions.pop(doc, None))
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self.run())
+        return record
+
+    @property
+    def nbytes(self):
+        return sum(record.nbytes for record in self.sessions.values())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.enforce()
+
+    def enforce(self, now=None):
+        """Evict idle sessions' caches, then LRU caches while over budget.
+
+        Returns the bytes freed.
+        """
+        now = time.time() if now is None else now
+        records = sorted(self.sessions.values(),
+                         key=lambda record: record.last_active)
+        freed = sum(record.cache.evict() for record in records
+                    if now - record.last_active >= self.idle_seconds)
+
+        over = self.nbytes - self.budget_bytes
+        for record in records:
+            if over <= 0:
+                break
+            released = record.cache.evict(over)
+            over -= released
+            freed += released
+        return freed
+
+    def status(self):
+        now = time.time()
+        sessions = [record.status(now) for record in self.sessions.values()]
+        return {'pid': os.getpid(),
+                'budget_bytes': self.budget_bytes,
+                'total_bytes': sum(session['sources_bytes']
+                                   + session['cache_bytes']
+                                   for session in sessions),
+                'sessions': sessions}
+
+
+_budget = None
+
+
+def budget():
+    """This process's SessionBudget, sized by $VISDAT_MEMORY_BUDGET_MB."""
+    global _budget
+    if _budget is None:
+        megabytes = float(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET_MB))
+        _budget = SessionBudget(int(megabytes * 2 ** 20))
+    return _budget
+
+
+def session_cache():
+    """The current session's cache; a throwaway one outside the server."""
+    from bokeh.io import curdoc
+
+    doc = curdoc()
+    if doc.session_context is None:
+        return SessionCache()
+    return budget().register(doc).cache
+
+
+def status_handler():
+    """A tornado handler serving budget().status() as JSON."""
+    from tornado.web import RequestHandler
+
+    class StatusHandler(RequestHandler):
+        def get(self):
+            self.set_header('Content-Type', 'application/json')
+            self.write(json.dumps(budget().status()))
+
+    return StatusHandler
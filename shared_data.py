@@ -0,0 +1,212 @@
+"""Shared-Memory Datasets
+
+Lets every worker of a multi-process bokeh server read the same copy of
+the datasets. A loader publishes each preprocessed frame once, column by
+column, into a multiprocessing.shared_memory block; workers map the blocks
+read-only and wrap the columns in DataFrames without copying them, which
+needs pandas 2: earlier versions consolidate the columns of a frame into
+private copies, one per worker.
+
+Text columns are stored as categorical codes, with their categories in
+the manifest, and come back as categorical columns rather than the csv's
+strings, since Python strings can't live in shared memory. They compare
+equal to strings and work with isin(), query() and merges as before, but
+groupby() on one should pass observed=True to leave out categories a
+selection doesn't contain.
+
+serve.py publishes the data before forking its workers. An app gets its
+datasets through shared_data.datasets(), which falls back to reading the
+csv files when nothing has been published.
+"""
+import json
+import os
+import struct
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from datasets import Datasets
+
+# Workers find the published blocks under the prefix in this variable
+PREFIX_ENV = 'VISDAT_SHARED_DATA'
+ALIGNMENT = 64
+
+# Pid of the publisher, in its process and any it forks: those share the
+# resource tracker it started, unlike a process started any other way
+_publisher = None
+
+
+def _manifest_name(prefix):
+    return f'{prefix}_manifest'
+
+
+def _block_name(prefix, dataset):
+    return f'{prefix}_{dataset}'
+
+
+def _columns(frame):
+    """Split a frame into (name, array, categories) ready for publishing."""
+    for name, values in frame.items():
+        if pd.api.types.is_datetime64_any_dtype(values):
+            yield name, values.to_numpy('datetime64[ns]'), None
+        elif pd.api.types.is_numeric_dtype(values) \
+                or pd.api.types.is_bool_dtype(values):
+            yield name, values.to_numpy(), None
+        else:
+            codes, categories = pd.factorize(values)
+            # The code type pd.Categorical would pick, so it's not copied
+            dtype = (np.int8 if len(categories) < 2 ** 7 else
+                     np.int16 if len(categories) < 2 ** 15 else np.int32)
+            yield name, codes.astype(dtype), [str(c) for c in categories]
+
+
+def publish(frames, prefix):
+    """Copy {dataset: DataFrame} into shared memory under prefix.
+
+    Returns the SharedMemory blocks; the publisher must keep them alive,
+    and unlink them when the workers are done.
+    """
+    global _publisher
+    _publisher = os.getpid()
+    blocks, manifest = [], {'publisher': _publisher, 'datasets': {}}
+    for dataset, frame in frames.items():
+        columns, offset = [], 0
+        for name, values, categories in _columns(frame):
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            columns.append((name, values, categories, offset))
+            offset += values.nbytes
+
+        block = shared_memory.SharedMemory(
+            name=_block_name(prefix, dataset), create=True,
+            size=max(offset, 1))
+        for name, values, _, start in columns:
+            np.ndarray(values.shape, values.dtype, block.buf,
+                       start)[:] = values
+        blocks.append(block)
+
+        manifest['datasets'][dataset] = {
+            'rows': len(frame),
+            'columns': [{'name': name, 'dtype': values.dtype.str,
+                         'offset': start, 'categories': categories}
+                        for name, values, categories, start in columns]}
+
+    payload = json.dumps(manifest).encode('utf-8')
+    block = shared_memory.SharedMemory(name=_manifest_name(prefix),
+                                       create=True, size=len(payload) + 8)
+    block.buf[:8] = struct.pack('<Q', len(payload))
+    block.buf[8:8 + len(payload)] = payload
+    blocks.append(block)
+    return blocks
+
+
+def _open(name, untrack):
+    """Map an existing block, unregistering it from the resource tracker.
+
+    A worker forked from the publisher shares its tracker, which already
+    knows the block and only unlinks it if the publisher never does, so
+    nothing needs undoing there. Any other process has a tracker of its
+    own, started by the first block it maps, and has to unregister the
+    block, or its tracker would unlink it when that process exits, pulling
+    it out from under every other worker.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    block = shared_memory.SharedMemory(name=name)
+    if untrack:
+        _untrack(block)
+    return block
+
+
+def _untrack(block):
+    if sys.version_info < (3, 13):
+        resource_tracker.unregister(block._name, 'shared_memory')
+
+
+class SharedDataset:
+    """One published frame: read-only column arrays over shared memory."""
+
+    def __init__(self, block, manifest):
+        self._block = block
+        self.rows = manifest['rows']
+        self.arrays, self.categories = {}, {}
+        for column in manifest['columns']:
+            values = np.ndarray(self.rows, np.dtype(column['dtype']),
+                                block.buf, column['offset'])
+            values.flags.writeable = False
+            self.arrays[column['name']] = values
+            if column['categories'] is not None:
+                self.categories[column['name']] = column['categories']
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.arrays.values())
+
+    def column(self, name):
+        values = self.arrays[name]
+        if name in self.categories:
+            return pd.Categorical.from_codes(values, self.categories[name])
+        return values
+
+    def frame(self, columns=None):
+        """A DataFrame over the shared columns.
+
+        The columns are wrapped without being copied, text columns as
+        categoricals over the shared codes.
+        """
+        columns = list(self.arrays) if columns is None else columns
+        return pd.DataFrame({name: self.column(name) for name in columns},
+                            copy=False)
+
+
+def attach(prefix):
+    """Map every dataset published under prefix, read-only."""
+    block = _open(_manifest_name(prefix), untrack=False)
+    (length,) = struct.unpack('<Q', bytes(block.buf[:8]))
+    manifest = json.loads(bytes(block.buf[8:8 + length]))
+    untrack = manifest['publisher'] != _publisher
+    if untrack:
+        _untrack(block)
+    block.close()
+    return {dataset: SharedDataset(
+                _open(_block_name(prefix, dataset), untrack), meta)
+            for dataset, meta in manifest['datasets'].items()}
+
+
+class SharedDatasets(Datasets):
+    """Datasets backed by shared memory instead of the csv files.
+
+    Frames are built over the shared columns once per process; datasets
+    that weren't published are still read from disk.
+    """
+
+    def __init__(self, prefix, data_dir=None):
+        super().__init__(*([data_dir] if data_dir else []))
+        self.shared = attach(prefix)
+
+    def __getitem__(self, name):
+        if name in self.shared and name not in self._frames:
+            self._frames[name] = self.shared[name].frame()
+        return super().__getitem__(name)
+
+    def store(self, name):
+        return None if name in self.shared else super().store(name)
+
+    def available(self, name):
+        return name in self.shared or super().available(name)
+
+
+_datasets = None
+
+
+def datasets():
+    """This process's datasets: shared if published, else read from disk."""
+    global _datasets
+    if _datasets is None:
+        prefix = os.environ.get(PREFIX_ENV)
+        _datasets = SharedDatasets(prefix) if prefix else Datasets()
+    return _datasets
@@ -0,0 +1,267 @@
+"""Standings Store
+
+Daily standings, delta-encoded. The csv has a full row for every team on
+every day of the season, but from one day to the next most of a team's
+columns don't change: nothing does on a day it didn't play but the date.
+A StandingsStore keeps each team's first row as its base snapshot and,
+per column, only the days on which the value changed and what it changed
+to, so a season of standings takes a fraction of the memory, and a few
+seasons of them a fraction of the disk:
+
+    python standings_store.py 2017-18_standings.csv  # writes ...npz
+
+Datasets reads the standings from the .npz when it's there. The store
+records the size and modification time of the csv it was built from, and
+is rebuilt when the csv has changed since.
+
+Rows are numbered team by team, then by date, and each column's changes
+are sorted by row number. A row's value is the last change at or before
+it, found by binary search, so any date or date range is rebuilt for
+every column at once without replaying a team's history day by day.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DATE, TEAM = 'stDate', 'teamAbbr'
+
+
+class StandingsStore:
+    """Standings as per-team base rows plus per-column changes.
+
+    dates holds the date of every row, team by team; team_offsets[i] is
+    the first row of teams[i]. changes maps each other column to (rows,
+    values, categories): the rows where it changed, the values it changed
+    to, and for text columns the categories those values are codes into.
+    Integers are kept in the narrowest type that holds them, and dtypes
+    has the type each numeric column is read back as.
+    """
+
+    def __init__(self, teams, team_offsets, dates, changes, columns,
+                 dtypes, source=None):
+        self.teams = pd.Index(teams)
+        self.team_offsets = np.asarray(team_offsets, dtype=np.int64)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.changes = changes
+        self.columns = list(columns)     # in the csv's order
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in dtypes.items()}
+        self.source = source             # stamp() of the csv, if any
+        team = np.repeat(np.arange(len(self.teams)),
+                         np.diff(self.team_offsets))
+        self.keys = self._keys(team, self.dates)
+
+    @classmethod
+    def from_frame(cls, standings):
+        """Encode a standings frame, one row per team per date."""
+        codes, teams = pd.factorize(standings[TEAM], sort=True)
+        dates = standings[DATE].to_numpy('datetime64[D]')
+        order = np.lexsort([dates, codes])
+        dates, codes = dates[order], codes[order]
+        team_offsets = np.searchsorted(codes, np.arange(len(teams) + 1))
+
+        changes, dtypes = {}, {}
+        for column in standings.columns:
+            if column in (DATE, TEAM):
+                continue
+            series = standings[column]
+            categories = None
+            if pd.api.types.is_numeric_dtype(series) \
+                    or pd.api.types.is_bool_dtype(series):
+                values = series.to_numpy()[order]
+                dtypes[column] = values.dtype
+            else:
+                values, categories = pd.factorize(series)
+                values = values.astype(np.int32)[order]
+                categories = list(categories)
+
+            changed = np.ones(len(values), dtype=bool)
+            changed[1:] = values[1:] != values[:-1]
+            if values.dtype.kind == 'f':
+                changed[1:] &= ~(np.isnan(values[1:]) & np.isnan(values[:-1]))
+            changed[team_offsets[:-1]] = True    # every team's base row
+            rows = np.flatnonzero(changed).astype(np.int32)
+            changes[column] = (rows, _narrow(values[rows]), categories)
+        return cls(teams, team_offsets, dates, changes, standings.columns,
+                   dtypes)
+
+    @classmethod
+    def read_csv(cls, path):
+        store = cls.from_frame(pd.read_csv(path, parse_dates=[DATE]))
+        store.source = stamp(path)
+        return store
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays, categories aside."""
+        return (self.dates.nbytes + self.team_offsets.nbytes
+                + self.keys.nbytes
+                + sum(rows.nbytes + values.nbytes
+                      for rows, values, _ in self.changes.values()))
+
+    def _team_codes(self, teams):
+        if teams is None:
+            return np.arange(len(self.teams))
+        if isinstance(teams, str):
+            teams = [teams]
+        codes = self.teams.get_indexer(list(teams))
+        return np.unique(codes[codes >= 0])
+
+    @staticmethod
+    def _keys(codes, dates):
+        """Sort keys of (team, date) pairs, ordered like the rows."""
+        days = np.asarray(dates, dtype='datetime64[D]').view(np.int64)
+        return (np.asarray(codes, dtype=np.int64) << 32) + days + 2 ** 31
+
+    def rows(self, dates=None, teams=None):
+        """Row numbers of the given teams between an inclusive (start,
+        end) of dates, team by team; either end may be None."""
+        start, end = dates or (None, None)
+        codes = self._team_codes(teams)
+        first = self.team_offsets[codes]
+        last = self.team_offsets[codes + 1]
+        if start is not None:
+            start = np.datetime64(pd.Timestamp(start), 'D')
+            first = np.searchsorted(self.keys, self._keys(codes, start))
+        if end is not None:
+            end = np.datetime64(pd.Timestamp(end), 'D')
+            last = np.searchsorted(self.keys, self._keys(codes, end),
+                                   side='right')
+        return np.concatenate([np.arange(lo, hi) for lo, hi
+                               in zip(first, last)] or [np.empty(0, int)])
+
+    def column(self, name, rows):
+        """One column's values at the given rows."""
+        changed, values, categories = self.changes[name]
+        values = values[np.searchsorted(changed, rows, side='right') - 1]
+        if categories is None:
+            return values.astype(self.dtypes[name], copy=False)
+        labels = np.asarray(categories + [np.nan], dtype=object)
+        return labels[values]          # code -1, missing, picks the nan
+
+    def take(self, rows, columns=None, by_team=False):
+        """The given rows as a frame like the csv's.
+
+        Rows come back by date then team, as in the csv, or team by team
+        if by_team; either way with a fresh index.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        team = np.searchsorted(self.team_offsets, rows, side='right') - 1
+        if not by_team:
+            order = np.lexsort([team, self.dates[rows]])
+            rows, team = rows[order], team[order]
+        columns = self.columns if columns is None else list(columns)
+        missing = [c for c in columns if c not in self.columns]
+        if missing:
+            raise KeyError(f'No such columns: {missing}')
+
+        data = {}
+        for name in columns:
+            if name == DATE:
+                data[name] = self.dates[rows].astype('datetime64[ns]')
+            elif name == TEAM:
+                data[name] = np.asarray(self.teams, dtype=object)[team]
+            else:
+                data[name] = self.column(name, rows)
+        return pd.DataFrame(data, columns=columns)
+
+    def frame(self, dates=None, teams=None, columns=None, by_team=False):
+        """Every row between an inclusive (start, end) of dates."""
+        return self.take(self.rows(dates, teams), columns, by_team)
+
+    def on(self, date, teams=None, columns=None):
+        """The standings as of a date: each team's latest row by then."""
+        date = np.datetime64(pd.Timestamp(date), 'D')
+        codes = self._team_codes(teams)
+        rows = np.searchsorted(self.keys, self._keys(codes, date),
+                               side='right') - 1
+        return self.take(rows[rows >= self.team_offsets[codes]], columns)
+
+    def save(self, path):
+        """Write the store to a compressed .npz file."""
+        arrays = {'dates': self.dates.view(np.int64),
+                  'team_offsets': self.team_offsets}
+        meta = {'teams': list(self.teams), 'columns': self.columns,
+                'dtypes': {name: dtype.str
+                           for name, dtype in self.dtypes.items()},
+                'categories': {}, 'source': self.source}
+        for i, (name, (rows, values, categories)) in enumerate(
+                self.changes.items()):
+            arrays[f'rows{i}'], arrays[f'values{i}'] = rows, values
+            if categories is not None:
+                meta['categories'][name] = categories
+        meta['changed'] = list(self.changes)
+        arrays['meta'] = np.frombuffer(json.dumps(meta).encode(),
+                                       dtype=np.uint8)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as stored:
+            meta = json.loads(stored['meta'].tobytes())
+            changes = {name: (stored[f'rows{i}'], stored[f'values{i}'],
+                              meta['categories'].get(name))
+                       for i, name in enumerate(meta['changed'])}
+            return cls(meta['teams'], stored['team_offsets'],
+                       stored['dates'].view('datetime64[D]'), changes,
+                       meta['columns'], meta['dtypes'], meta.get('source'))
+
+
+def stamp(path):
+    """[size, mtime in ns] of a file, to tell whether it has changed."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_current(path, csv):
+    """The store at path, rebuilt from csv if that has changed since.
+
+    A rebuilt store is written back to path when it can be.
+    """
+    store = StandingsStore.load(path)
+    if not os.path.exists(csv) or store.source == stamp(csv):
+        return store
+    store = StandingsStore.read_csv(csv)
+    try:
+        store.save(path)
+    except OSError:
+        pass
+    return store
+
+
+def _narrow(values):
+    """Integers in the smallest type that holds them all."""
+    if values.dtype.kind not in 'iu' or not len(values):
+        return values
+    return values.astype(np.result_type(np.min_scalar_type(values.min()),
+                                        np.min_scalar_type(values.max())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv', nargs='?', default='2017-18_standings.csv')
+    parser.add_argument('out', nargs='?',
+                        help='the .npz to write (default: next to csv)')
+    args = parser.parse_args(argv)
+
+    out = args.out or os.path.splitext(args.csv)[0] + '.npz'
+    standings = pd.read_csv(args.csv, parse_dates=[DATE])
+    store = StandingsStore.from_frame(standings)
+    store.source = stamp(args.csv)
+    store.save(out)
+    changes = sum(len(rows) for rows, _, _ in store.changes.values())
+    cells = len(store) * len(store.changes)
+    print(f'{len(store)} rows, {changes} of {cells} values stored; '
+          f'{standings.memory_usage(deep=True).sum() / 2 ** 20:.1f} MB in '
+          f'memory as a frame, {store.nbytes / 2 ** 20:.2f} MB as a store; '
+          f'{os.path.getsize(args.csv) / 2 ** 20:.2f} MB csv, '
+          f'{os.path.getsize(out) / 2 ** 20:.2f} MB {out}')
+
+
+if __name__ == '__main__':
+    main()
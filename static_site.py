@@ -0,0 +1,136 @@
+"""Static Site Build
+
+Writes a set of pages the way output_file() would, except that every
+ColumnDataSource is moved out of the page into a gzip-compressed,
+content-hashed JSON file under data/. Identical data is written once no
+matter how many pages or charts use it, and since the file names never
+change for the same content, browsers can cache them indefinitely. Pages
+share BokehJS as well, from the CDN or from one local copy under static/.
+
+The pages fetch their data over HTTP, so serve the output directory
+(python -m http.server --directory site) rather than opening it from disk,
+or precompress it and serve it with ETags using publish.py.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from lazy_tabs import NULLS_TO_NAN, source_data_json
+
+DATA_DIR = 'data'
+STATIC_DIR = 'static'
+
+# Starts every data fetch straight away, then fills in the sources once
+# BokehJS has built the document. Payloads are decompressed in the browser
+# unless the host already did so with Content-Encoding: gzip.
+LOADER_TEMPLATE = """
+{% block postamble %}
+<script type="text/javascript">
+(function() {""" + NULLS_TO_NAN + """
+  const payloads = {{ payloads | safe }}
+  async function fetchData(url) {
+    const response = await fetch(url)
+    let bytes = new Uint8Array(await response.arrayBuffer())
+    if (bytes[0] === 0x1f && bytes[1] === 0x8b) {
+      const stream = new Blob([bytes]).stream()
+        .pipeThrough(new DecompressionStream('gzip'))
+      bytes = new Uint8Array(await new Response(stream).arrayBuffer())
+    }
+    return nulls_to_nan(JSON.parse(new TextDecoder().decode(bytes)))
+  }
+  const fetches = {}
+  for (const [, url] of payloads)
+    fetches[url] = fetches[url] || fetchData(url)
+  function fill() {
+    const doc = window.Bokeh && Bokeh.documents && Bokeh.documents[0]
+    if (!doc)
+      return setTimeout(fill, 10)
+    for (const [id, url] of payloads)
+      fetches[url].then((data) => { doc.get_model_by_id(id).data = data })
+  }
+  fill()
+})()
+</script>
+{% endblock %}
+"""
+
+
+def build_site(pages, out_dir='site', resources='cdn'):
+    """Write {filename: (title, layout)} pages and their data to out_dir.
+
+    resources is 'cdn' to load BokehJS from cdn.bokeh.org, or 'local' to
+    copy it into out_dir once and point every page at that copy. Returns
+    a manifest of {filename: [data files the page loads]}.
+    """
+    from bokeh.embed import file_html
+    from bokeh.models import ColumnDataSource
+
+    os.makedirs(os.path.join(out_dir, DATA_DIR), exist_ok=True)
+    page_resources = _resources(resources, out_dir)
+
+    manifest = {}
+    for filename, (title, layout) in pages.items():
+        sources = [model for model in layout.references()
+                   if isinstance(model, ColumnDataSource)
+                   and any(len(column) for column in model.data.values())]
+        payloads = [(source.id, write_payload(source, out_dir))
+                    for source in sources]
+
+        # Empty the sources just for the page, they may be reused elsewhere
+        original = {source.id: dict(source.data) for source in sources}
+        for source in sources:
+            source.data = {column: [] for column in source.data}
+        try:
+            # Render from a temporary document, so the same figures can
+            # appear on several pages
+            html = file_html(layout, page_resources, title,
+                             template=LOADER_TEMPLATE,
+                             template_variables={
+                                 'payloads': json.dumps(payloads)},
+                             _always_new=True)
+        finally:
+            for source in sources:
+                source.data = original[source.id]
+
+        with open(os.path.join(out_dir, filename), 'w') as f:
+            f.write(html)
+        manifest[filename] = sorted({url for _, url in payloads})
+    return manifest
+
+
+def write_payload(source, out_dir):
+    """Write a source's data as gzipped JSON named by its content hash.
+
+    Returns the file's URL relative to the pages. If the file already
+    exists it holds the same bytes, so it isn't written again.
+    """
+    data = source_data_json(source).encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    url = f'{DATA_DIR}/{digest}.json.gz'
+    path = os.path.join(out_dir, url)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    return url
+
+
+def _resources(mode, out_dir):
+    from bokeh.resources import CDN, Resources
+    from bokeh.util.paths import bokehjsdir
+
+    if mode == 'cdn':
+        return CDN
+    if mode != 'local':
+        raise ValueError(f"resources must be 'cdn' or 'local', not {mode!r}")
+
+    local = Resources(mode='server', root_url='./')
+    static_js = os.path.join(bokehjsdir(), 'js')
+    for url in local.js_files:
+        name = os.path.basename(url)
+        target = os.path.join(out_dir, STATIC_DIR, 'js', name)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(static_js, name), target)
+    return local
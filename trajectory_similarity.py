@@ -0,0 +1,203 @@
+"""Trajectory Similarity
+
+Answers "countries whose development path resembles X" over the Gapminder
+data. Each country's path through (fertility, life expectancy) space is
+resampled to a fixed number of evenly spaced points over the years it
+reports, z-scored per indicator, and flattened into one float32 vector,
+so that comparing two paths is a Euclidean distance and a top-k query
+over every country is a single matrix-vector product.
+
+The lock-step distance compares the n-th point of one path with the n-th
+point of the other. Paths that go through the same stages at different
+speeds can be re-ranked with dynamic time warping (DTW), which is run on
+the nearest candidates only, all of them at once.
+"""
+import numpy as np
+import pandas as pd
+
+FEATURES = ['fertility', 'life']
+FEATURE_LABELS = {'fertility': 'Fertility (children per woman)',
+                  'life': 'Life Expectancy (years)'}
+LENGTH = 32
+
+# DTW re-ranks this many times k lock-step candidates
+CANDIDATE_FACTOR = 4
+
+
+def resample(years, values, length=LENGTH):
+    """Interpolate a path at length evenly spaced points over its years.
+
+    values has one column per feature; returns an array (length, feature).
+    """
+    grid = np.linspace(years[0], years[-1], length)
+    return np.column_stack([np.interp(grid, years, column)
+                            for column in np.asarray(values).T])
+
+
+def dtw(query, candidates, window=None):
+    """DTW distances from one path to each of a stack of paths.
+
+    query is (length, feature) and candidates (path, length, feature).
+    The warping path is kept within window steps of the diagonal, and the
+    recurrence runs over all candidates together, one cell at a time.
+    """
+    n, m = len(query), candidates.shape[1]
+    window = max(n, m) if window is None else max(window, abs(n - m))
+    cost = np.sqrt(((query[np.newaxis, :, np.newaxis]
+                     - candidates[:, np.newaxis]) ** 2).sum(axis=-1))
+
+    total = np.full((len(candidates), n + 1, m + 1), np.inf)
+    total[:, 0, 0] = 0
+    for i in range(1, n + 1):
+        for j in range(max(1, i - window), min(m, i + window) + 1):
+            total[:, i, j] = cost[:, i - 1, j - 1] + np.minimum(
+                np.minimum(total[:, i - 1, j], total[:, i, j - 1]),
+                total[:, i - 1, j - 1])
+    return total[:, n, m]
+
+
+class TrajectoryIndex:
+    """Nearest-neighbor index over resampled country trajectories.
+
+    Every country's path is stored as a row of one contiguous float32
+    matrix, with its squared norm precomputed, like PlayerIndex.
+    """
+
+    def __init__(self, gapminder, features=FEATURES, length=LENGTH):
+        self.features = list(features)
+        self.length = length
+
+        data = gapminder.dropna(subset=self.features).sort_values(
+            ['Country', 'Year'])
+        countries, paths, years = [], [], []
+        for country, rows in data.groupby('Country', sort=True):
+            if len(rows) < 2:
+                continue
+            countries.append(country)
+            paths.append(resample(rows['Year'].to_numpy(np.float64),
+                                  rows[self.features].to_numpy(np.float64),
+                                  length))
+            years.append((rows['Year'].iloc[0], rows['Year'].iloc[-1]))
+        self.countries = pd.Index(countries, name='Country')
+        self.years = np.array(years)
+        self.paths = np.stack(paths)              # (country, point, feature)
+
+        self.mean = self.paths.mean(axis=(0, 1))
+        self.std = self.paths.std(axis=(0, 1))
+        self.std[self.std == 0] = 1
+        self.scaled = ((self.paths - self.mean) / self.std).astype(np.float32)
+        self.matrix = np.ascontiguousarray(
+            self.scaled.reshape(len(countries), -1))
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    def __len__(self):
+        return len(self.countries)
+
+    def locate(self, country):
+        if country not in self.countries:
+            raise KeyError(f'No trajectory for {country}')
+        return self.countries.get_loc(country)
+
+    def distances(self, rows):
+        """Squared lock-step distances from each queried row to every path."""
+        rows = np.atleast_1d(rows)
+        return (self.sq_norms[np.newaxis, :]
+                - 2 * self.matrix[rows] @ self.matrix.T
+                + self.sq_norms[rows, np.newaxis])
+
+    def _nearest(self, row, k, use_dtw=False, window=None):
+        """Rows and distances of the k paths nearest to row, excluding it."""
+        dist = np.maximum(self.distances(row)[0], 0)
+        dist[row] = np.inf
+        k = min(k, len(self) - 1)
+        if k <= 0:
+            return np.empty(0, int), np.empty(0)
+
+        shortlist = min(k * CANDIDATE_FACTOR if use_dtw else k,
+                        len(self) - 1)
+        nearest = np.argpartition(dist, shortlist - 1)[:shortlist]
+        if use_dtw:
+            window = self.length // 4 if window is None else window
+            dist = np.full(len(self), np.inf)
+            dist[nearest] = dtw(self.scaled[row], self.scaled[nearest],
+                                window)
+        else:
+            dist = np.sqrt(dist)
+        nearest = nearest[np.argsort(dist[nearest], kind='stable')][:k]
+        return nearest, dist[nearest]
+
+    def similar(self, country, k=5, use_dtw=False, window=None):
+        """The k countries whose paths are closest to country's.
+
+        With use_dtw, the nearest CANDIDATE_FACTOR * k paths by lock-step
+        distance are re-ranked by DTW distance within window steps.
+        """
+        nearest, dist = self._nearest(self.locate(country), k, use_dtw,
+                                      window)
+        return pd.DataFrame({'Country': self.countries[nearest],
+                             'first_year': self.years[nearest, 0],
+                             'last_year': self.years[nearest, 1],
+                             'distance': dist})
+
+    def neighbor_table(self, k=5, use_dtw=False, window=None):
+        """The k nearest rows of every path, as an int array (path, k)."""
+        return np.array([self._nearest(row, k, use_dtw, window)[0]
+                         for row in range(len(self))])
+
+
+# Extends a clicked path's selection to its precomputed neighbors; the
+# guard stops the assignment below from re-triggering this callback
+SHOW_NEIGHBORS = """
+const indices = paths.selected.indices
+if (indices.length != 1) {
+    if (indices.length == 0)
+        div.text = ''
+    return
+}
+const row = indices[0]
+const names = neighbors[row].map((i) => paths.data.Country[i])
+paths.selected.indices = [row].concat(neighbors[row])
+div.text = `<b>${paths.data.Country[row]}</b> is most like `
+    + names.join(', ')
+"""
+
+
+def trajectory_chart(gapminder, index=None, k=5, use_dtw=False):
+    """Every country's path; clicking one highlights its nearest paths.
+
+    The neighbors of every country are found up front and shipped with the
+    page, so highlighting them needs no round trip to Python.
+    """
+    from bokeh.layouts import column
+    from bokeh.models import ColumnDataSource, CustomJS, Div, HoverTool
+    from bokeh.plotting import figure
+
+    index = index or TrajectoryIndex(gapminder)
+    x, y = index.features[:2]
+    paths = ColumnDataSource(data={
+        'Country': list(index.countries),
+        'xs': index.paths[:, :, 0].tolist(),
+        'ys': index.paths[:, :, 1].tolist(),
+        'years': [f'{first}-{last}' for first, last in index.years],
+    })
+
+    fig = figure(plot_height=500, plot_width=700,
+                 x_axis_label=FEATURE_LABELS.get(x, x),
+                 y_axis_label=FEATURE_LABELS.get(y, y),
+                 title='Development Paths (click a country to see the '
+                       'most similar)',
+                 tools='tap,reset')
+    fig.multi_line('xs', 'ys', source=paths, color='steelblue', alpha=0.3,
+                   line_width=1, selection_color='firebrick',
+                   selection_alpha=1, selection_line_width=3,
+                   nonselection_alpha=0.08)
+    fig.add_tools(HoverTool(tooltips=[('Country', '@Country'),
+                                      ('Years', '@years')],
+                            line_policy='interp'))
+
+    div = Div(text='', width=700)
+    paths.selected.js_on_change('indices', CustomJS(
+        args={'paths': paths, 'div': div,
+              'neighbors': index.neighbor_table(k, use_dtw).tolist()},
+        code=SHOW_NEIGHBORS))
+    return column(fig, div)
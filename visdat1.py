@@ -0,0 +1,213 @@
+"""NBA and Gapminder Dashboard
+
+The Bokeh server app launched by the Procfile:
+
+    bokeh serve --show visdat1.py
+
+Each tab is only built, and its data only sent, once it's first opened.
+Under serve.py the datasets come from shared memory rather than from each
+worker reading its own copy of the csv files, and standings and box
+scores dropped into the drop directory are pushed to open sessions as
+they arrive (see live_data.py). The Live Games tab follows the running
+scores in the game feed (see game_feed.py). The frames each session
+derives are kept within a memory budget (see session_budget.py), and
+with VISDAT_PROFILE=1 every callback is timed (see callback_profiler.py).
+Three-point tooltips are looked up, and selections summed up, on the
+server (see server_tooltips.py and selection_index.py).
+"""
+from types import SimpleNamespace
+
+from bokeh.io import curdoc
+from bokeh.models import (BoxSelectTool, ColumnDataSource, LassoSelectTool,
+                          NumeralTickFormatter)
+from bokeh.plotting import figure
+
+from backends import choose_backend
+from callback_profiler import install_if_enabled
+from charts import CONFERENCES, RACE_FIGURE, race_figure, standings_slice
+from datasets import missing_data
+from game_feed import GameBoard, game_feed
+from lazy_tabs import lazy_tabs
+from live_data import live_data
+from query import query
+from rasterize import GLYPH_THRESHOLD, RasterScatter
+from selection_index import SelectionSummary
+from server_tooltips import ServerTooltip
+from session_budget import budget, session_cache
+from shared_data import datasets
+
+
+# Must come before any callback is registered
+install_if_enabled()
+
+
+def subscribe(dataset, update):
+    """Have update called with new data while this session is open."""
+    doc = curdoc()
+    if doc.session_context is not None:
+        live_data().subscribe(doc, dataset, update)
+
+
+def standings_panel():
+    """Wins race of the top two teams in each conference, kept current."""
+    from bokeh.layouts import row
+
+    version = live_data().snapshot.version
+    figs = [race_figure(
+        session_cache().get(
+            ('standings', conference, version),
+            lambda: standings_slice(live_data(), list(conference_teams))),
+        {'figure': dict(RACE_FIGURE, plot_width=500, title=conference),
+         'teams': conference_teams})
+        for conference, conference_teams in CONFERENCES.items()]
+    sources = [fig.renderers[0].data_source for fig in figs]
+
+    def update(frame, appended):
+        # New days are streamed onto the end of each source, which keeps
+        # every team's rows in date order, all the step lines need
+        live = SimpleNamespace(standings=frame if appended is None
+                               else appended)
+        for source, conference_teams in zip(sources, CONFERENCES.values()):
+            rows = ColumnDataSource.from_df(
+                standings_slice(live, list(conference_teams))
+                .sort_values('stDate', kind='stable'))
+            if appended is None:
+                source.data = dict(rows)
+            elif len(rows['stDate']):
+                source.stream(rows)
+
+    subscribe('standings', update)
+    return row(*figs)
+
+
+def live_games_panel():
+    """Running scores of today's games, streamed from the game feed."""
+    from bokeh.layouts import column
+    from bokeh.models import Div
+
+    board = GameBoard()
+    board.apply(game_feed().snapshot())
+    doc = curdoc()
+    if doc.session_context is not None:
+        game_feed().subscribe(doc, board)
+    return column(Div(text='<i>Games appear here as the feed reports '
+                           'them.</i>'), board.layout)
+
+
+THREE_POINT_COLUMNS = ['gmDate', 'teamAbbr', 'playFNm', 'playLNm',
+                       'play3PA', 'play3PM']
+THREE_POINT_TOOLTIPS = [('Player', '@playFNm @playLNm (@teamAbbr)'),
+                        ('Game', '@gmDate{%F}'),
+                        ('Three-Pointers', '@play3PM of @play3PA')]
+
+
+def three_point_games(cache):
+    """Player-games with a three-point attempt, from the current data.
+
+    won says whether the player's team won the game.
+    """
+    def games():
+        results = query(live_data(), 'team_stats',
+                        columns=['gmDate', 'teamAbbr', 'teamRslt'])
+        games = query(live_data(), 'player_stats',
+                      where={'play3PA': {'min': 1}},
+                      columns=THREE_POINT_COLUMNS)
+        games = games.merge(results, on=['gmDate', 'teamAbbr'], how='left')
+        return games.assign(won=games.pop('teamRslt') == 'Win')
+
+    return cache.get(('three_games', live_data().snapshot.version), games)
+
+
+def three_point_summary(games):
+    """Combined shooting and win % of a selection of player-games."""
+    if not len(games):
+        return '<i>No games selected.</i>'
+    made, attempted = games['play3PM'].sum(), games['play3PA'].sum()
+    players = len(games[['playFNm', 'playLNm']].drop_duplicates())
+    return (f'<b>{len(games):,} games</b> by {players:,} players: '
+            f'{made:,} of {attempted:,} threes '
+            f'({made / attempted:.1%}), teams won {games["won"].mean():.1%}')
+
+
+def three_point_panel():
+    """Every player-game with a three-point attempt, no minimum."""
+    from bokeh.layouts import column
+
+    missing = [name for name in ('player_stats', 'team_stats')
+               if not live_data().available(name)]
+    if missing:
+        return missing_data(missing)
+
+    cache = session_cache()
+    version = live_data().snapshot.version
+    three_games = three_point_games(cache)
+
+    fig = figure(plot_height=400, plot_width=600,
+                 x_axis_label='Three-Point Shots Attempted',
+                 y_axis_label='Percentage Made',
+                 title='3PT Shots Attempted vs. Percentage Made, '
+                       'Every Game, 2017-18',
+                 toolbar_location='below',
+                 tools='pan,wheel_zoom,box_zoom,reset',
+                 output_backend=choose_backend(GLYPH_THRESHOLD, 'square'))
+    fig.yaxis[0].formatter = NumeralTickFormatter(format='00.0%')
+    pct = three_games['play3PM'] / three_games['play3PA']
+    scatter = RasterScatter(three_games['play3PA'], pct)
+    scatter.attach(fig, glyph='square', color='royalblue', alpha=0.5)
+
+    def records():
+        # From the session cache each time, so the budget sees them. After
+        # a refresh they're newer than the points until update() runs
+        return live_data().snapshot.version, three_point_games(cache)
+
+    # Hovering and selecting work over the image too, on the server
+    tooltip = ServerTooltip(three_games['play3PA'], pct, records,
+                            THREE_POINT_TOOLTIPS, version=version)
+    tooltip.attach(fig)
+    summary = SelectionSummary(three_games['play3PA'], pct, records,
+                               three_point_summary,
+                               empty='<i>Select games to sum them up.</i>',
+                               version=version)
+    summary_div = summary.attach(fig)
+    points = [scatter.points_renderer]
+    fig.add_tools(BoxSelectTool(renderers=points),
+                  LassoSelectTool(renderers=points))
+
+    def update(frame, appended):
+        version = live_data().snapshot.version
+        three_games = three_point_games(cache)
+        pct = three_games['play3PM'] / three_games['play3PA']
+        scatter.set_data(three_games['play3PA'], pct)
+        tooltip.set_data(three_games['play3PA'], pct, records, version)
+        summary.set_data(three_games['play3PA'], pct, records, version)
+
+    subscribe('player_stats', update)
+    subscribe('team_stats', update)
+    return column(fig, summary_div)
+
+
+def gapminder_panel():
+    """Every country in every year."""
+    gapminder = query(datasets(), 'gapminder', columns=['fertility', 'life'])
+
+    fig = figure(plot_height=400, plot_width=600,
+                 x_axis_label='Fertility (children per woman)',
+                 y_axis_label='Life Expectancy (years)',
+                 title='Fertility vs. Life Expectancy, All Countries, '
+                       'All Years',
+                 toolbar_location='below',
+                 tools='pan,wheel_zoom,box_zoom,reset',
+                 output_backend=choose_backend(GLYPH_THRESHOLD))
+    RasterScatter(gapminder['fertility'], gapminder['life']).attach(
+        fig, color='firebrick', alpha=0.5)
+    return fig
+
+
+if curdoc().session_context is not None:
+    budget().register(curdoc())
+
+curdoc().add_root(lazy_tabs([('Standings', standings_panel),
+                             ('Live Games', live_games_panel),
+                             ('Three-Pointers', three_point_panel),
+                             ('Gapminder', gapminder_panel)]))
+curdoc().title = 'NBA and Gapminder Dashboard'